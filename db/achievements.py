@@ -0,0 +1,168 @@
+import threading
+from datetime import datetime
+
+# Every achievement, in display order. An achievement unlocks once the
+# player's running total of `stat` reaches `threshold`.
+ACHIEVEMENTS = {
+    "first_tag": {
+        "name": "First Tag",
+        "description": "Tag another player for the first time",
+        "stat": "totalTags",
+        "threshold": 1,
+    },
+    "survivor_10min": {
+        "name": "10-Minute Survivor",
+        "description": "Stay as 'it' for 10 minutes total",
+        "stat": "totalTimeIt",
+        "threshold": 600,
+    },
+    "survivor_1hour": {
+        "name": "Ultimate Survivor",
+        "description": "Stay as 'it' for 1 hour total",
+        "stat": "totalTimeIt",
+        "threshold": 3600,
+    },
+}
+
+TRACKED_STATS = tuple(sorted({a["stat"] for a in ACHIEVEMENTS.values()}))
+
+
+def default_achievements():
+    """The `achievements` sub-document a new user starts with."""
+    return {
+        key: {"unlocked": False, "name": a["name"], "description": a["description"]}
+        for key, a in ACHIEVEMENTS.items()
+    }
+
+
+def achievement_payload(key):
+    """Body of the `achievementUnlocked` socket event."""
+    a = ACHIEVEMENTS[key]
+    return {"achievement": key, "name": a["name"], "description": a["description"]}
+
+
+class AchievementEngine:
+    """
+    Evaluates ACHIEVEMENTS against per-player running totals kept in memory.
+
+    `load(username)` reads the player's totals and unlock set once (on
+    connect). After that, `record` and `check` decide unlocks locally, and
+    each unlock costs one conditional `update_one` that only matches while
+    the achievement is still locked. A player that was never loaded is
+    loaded lazily on first use.
+
+    *load_doc(username)* returns the user document (with TRACKED_STATS and
+    `achievements`) or None; database.py supplies one that folds in stat
+    increments still sitting in the write-behind buffer.
+    """
+
+    def __init__(self, users, load_doc, rules=ACHIEVEMENTS):
+        self.users = users
+        self.load_doc = load_doc
+        self.rules = {}  # stat → [(threshold, key)], ascending
+        for key, a in rules.items():
+            self.rules.setdefault(a["stat"], []).append((a["threshold"], key))
+        for thresholds in self.rules.values():
+            thresholds.sort()
+
+        self._players = {}  # username → {'totals': {stat: n}, 'unlocked': set(), 'claiming': set()}
+        self._lock = threading.Lock()
+
+    # ─── player state ─────────────────────────────────────────
+    def load(self, username):
+        """(Re)load *username* from Mongo. Returns False if the user doesn't exist."""
+        doc = self.load_doc(username)
+        if doc is None:
+            return False
+        state = {
+            "totals": {stat: doc.get(stat, 0) for stat in self.rules},
+            "unlocked": {key for key, a in (doc.get("achievements") or {}).items()
+                         if isinstance(a, dict) and a.get("unlocked")},
+            "claiming": set(),  # being written by some record()/check() right now
+        }
+        with self._lock:
+            self._players[username] = state
+        return True
+
+    def forget(self, username):
+        with self._lock:
+            self._players.pop(username, None)
+
+    def _state(self, username):
+        with self._lock:
+            state = self._players.get(username)
+        if state is None and self.load(username):
+            with self._lock:
+                state = self._players.get(username)
+        return state
+
+    def total(self, username, stat):
+        state = self._state(username)
+        return None if state is None else state["totals"].get(stat, 0)
+
+    # ─── evaluation ───────────────────────────────────────────
+    def record(self, username, stat, amount):
+        """
+        Add *amount* to the player's running *stat* and unlock whatever it
+        crosses. Returns the keys of newly unlocked achievements.
+        """
+        state = self._state(username)
+        if state is None:
+            return []
+        with self._lock:
+            state["totals"][stat] = state["totals"].get(stat, 0) + amount
+            earned = self._claim(state, stat, state["totals"][stat])
+        return self._persist(username, state, earned)
+
+    def check(self, username, stat, extra):
+        """
+        Unlock achievements reached by the running *stat* plus *extra* that
+        isn't recorded yet (e.g. the current IT streak). Totals are unchanged.
+        """
+        state = self._state(username)
+        if state is None:
+            return []
+        with self._lock:
+            earned = self._claim(state, stat, state["totals"].get(stat, 0) + extra)
+        return self._persist(username, state, earned)
+
+    def _claim(self, state, stat, value):
+        """Reserve the achievements *value* reaches so only one caller writes each."""
+        earned = []
+        for threshold, key in self.rules.get(stat, ()):
+            if value < threshold:
+                break
+            if key not in state["unlocked"] and key not in state["claiming"]:
+                state["claiming"].add(key)
+                earned.append(key)
+        return earned
+
+    def _persist(self, username, state, earned):
+        """
+        Write the claimed unlocks; unlock() marks each one in memory once its
+        write succeeds. If a write raises, the claims are released so the
+        next record() or check() tries again.
+        """
+        try:
+            return [key for key in earned if self.unlock(username, key)]
+        finally:
+            with self._lock:
+                state["claiming"].difference_update(earned)
+
+    def unlock(self, username, key):
+        """
+        Mark *key* unlocked with a single conditional update.
+        Returns True only if this call flipped it.
+        """
+        result = self.users.update_one(
+            {"username": username, f"achievements.{key}.unlocked": {"$ne": True}},
+            {"$set": {
+                f"achievements.{key}.unlocked": True,
+                f"achievements.{key}.unlockDate": datetime.now(),
+            }},
+        )
+        with self._lock:
+            state = self._players.get(username)
+            if state is not None:
+                state["unlocked"].add(key)
+        return result.modified_count > 0
@@ -36,10 +36,19 @@
 
 
 
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from datetime import datetime, timedelta, timezone
+import atexit
 import os
 
+from db.achievements import AchievementEngine, TRACKED_STATS, default_achievements
+from db.indexes import apply_indexes
+from db.session_store import SessionStore
+from db.stats_buffer import UPDATED_AT_FIELD, StatsBuffer
+from util.backend.metrics import timed
+from util.backend.ranked_index import RankedIndex
+from util.backend.ttl_cache import TTLCache
+
 client = MongoClient("mongodb://mongo:27017/")
 db = client["tag_game"]
 
@@ -49,147 +58,368 @@ login_attempts = db["loginAttempts"]
 stats          = db["stats"]  # you may repurpose or drop this
 leaderboard    = db["leaderboard"]
 
+# Stat writes from the game loop are aggregated here and flushed in bulk;
+# server.py runs stats_buffer.run() as a background task.
+stats_buffer = StatsBuffer(
+    users, leaderboard,
+    flush_interval=float(os.environ.get("STATS_FLUSH_INTERVAL", 1.0)),
+    max_pending=int(os.environ.get("STATS_MAX_PENDING", 500)),
+)
+atexit.register(stats_buffer.flush)
+
+# Login sessions (capped per user) and their background sweeper; see
+# db/session_store.py. server.py runs session_store.run() as a background task.
+session_store = SessionStore(
+    sessions, login_attempts,
+    max_per_user=int(os.environ.get("MAX_SESSIONS_PER_USER", 5)),
+    sweep_interval=float(os.environ.get("SESSION_SWEEP_SECONDS", 300)),
+)
+
+
+# How long aggregated login-attempt counts stay in loginAttempts (TTL index)
+LOGIN_ATTEMPTS_RETENTION = timedelta(days=int(os.environ.get("LOGIN_ATTEMPTS_RETENTION_DAYS", 7)))
+
+
+@timed
+def record_login_attempts(counts, interval):
+    """
+    Persist one interval of LoginRateLimiter counts ({key: {attempts,
+    rejected, failed}}) with one unordered bulk upsert, a document per key
+    and interval-aligned window.
+    """
+    now = datetime.now(timezone.utc)
+    window = datetime.fromtimestamp(now.timestamp() // interval * interval, timezone.utc)
+    ops = [
+        UpdateOne({"key": key, "window": window},
+                  {"$inc": fields, "$setOnInsert": {"expires_at": window + LOGIN_ATTEMPTS_RETENTION}},
+                  upsert=True)
+        for key, fields in counts.items()
+    ]
+    if ops:
+        login_attempts.bulk_write(ops, ordered=False)
+
+
+@timed
+def bind_socket(username, sid):
+    """
+    Record *sid* as the user's live socket and return the previous one (which
+    may belong to another worker), in one round trip. Kept on the user
+    document so sockets never add documents to `sessions`.
+    """
+    doc = users.find_one_and_update(
+        {"username": username}, {"$set": {"socket_id": sid}},
+        projection={"_id": 0, "socket_id": 1}, return_document=ReturnDocument.BEFORE)
+    return doc.get("socket_id") if doc else None
+
+
+def _load_progress(username):
+    projection = {"_id": 0, "achievements": 1, **{stat: 1 for stat in TRACKED_STATS}}
+    return stats_buffer.read_doc_with_pending(
+        username, lambda: users.find_one({"username": username}, projection))
+
+
+# Unlock state and running totals of online players; see db/achievements.py
+achievement_engine = AchievementEngine(users, _load_progress)
+
+# In-process leaderboards. Seeded once from Mongo by leaderboard_sync() and
+# kept current by the stat helpers below; every LEADERBOARD_SYNC_SECONDS it
+# also applies the rows other workers wrote, found by their stats_buffer
+# stamp. Until the seed lands, the getters fall back to querying Mongo.
+LEADERBOARD_SYNC_SECONDS = float(os.environ.get("LEADERBOARD_SYNC_SECONDS", 5))
+# Re-read stamps this far back: a flush's writes can become visible after a
+# later-stamped one. Re-applying a row is harmless.
+LEADERBOARD_SYNC_OVERLAP = timedelta(seconds=float(os.environ.get("LEADERBOARD_SYNC_OVERLAP", 10)))
+time_board = RankedIndex("totalTimeIt")                      # least time as "it" first
+streak_board = RankedIndex("longestStreak", descending=True)  # longest streak first
+_boards_ready = False
+_synced_at = None  # newest UPDATED_AT_FIELD applied to the boards
+
+@timed
+def ensure_indexes():
+    """Create the indexes declared in db/indexes.py. Safe to call repeatedly."""
+    for collection, results in apply_indexes(db).items():
+        for name, status in results.items():
+            if status != "ok":
+                print(f"Error creating index {collection}.{name}: {status}")
+
+# Per-user profile cache for get_profiles(). The stat helpers below drop a
+# user's entry whenever they write to it; the TTL bounds staleness from
+# writes made by other workers.
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 30))
+PROFILE_BATCH_LIMIT = 100
+profile_cache = TTLCache(maxsize=4096, ttl=PROFILE_CACHE_TTL)
+# username → [get_profiles() reads in flight, invalidations since the first];
+# entries go when the last read ends, so this stays as small as those reads.
+_profile_reads = {}
+
+
+def invalidate_profile(username):
+    """Called by every stat writer: drop the cached profile and bump the data generation."""
+    reading = _profile_reads.get(username)
+    if reading is not None:
+        reading[1] += 1
+    profile_cache.pop(username)
+    _bump_generation()
+
+
+# Bumped on every write that can change a leaderboard; cached responses
+# built from an older generation are stale (see util/backend/response_cache.py).
+_generation = 0
+
+
+def _bump_generation():
+    global _generation
+    _generation += 1
+
+
+def data_generation():
+    return _generation
+
+
+def _read_board_rows(query):
+    """
+    users / leaderboard rows matching *query* with this worker's buffered
+    writes folded in. Returns ({username: row}, {user: streak}, the buffered
+    streaks, newest stamp).
+    """
+    def read():
+        return (
+            list(users.find(query, {"_id": 0, "username": 1, "totalTags": 1, "totalTimeIt": 1,
+                                    UPDATED_AT_FIELD: 1})),
+            list(leaderboard.find(query, {"_id": 0, "user": 1, "longestStreak": 1, UPDATED_AT_FIELD: 1})),
+        )
+
+    (user_docs, streak_docs), pending, pending_streaks = stats_buffer.read_all_with_pending(read)
+
+    rows = {}
+    for doc in user_docs:
+        if "username" not in doc:
+            continue
+        row = {"totalTags": doc.get("totalTags", 0), "totalTimeIt": doc.get("totalTimeIt", 0)}
+        for field, amount in pending.get(doc["username"], {}).get("$inc", {}).items():
+            if field in row:
+                row[field] += amount
+        rows[doc["username"]] = row
+
+    streaks = {}
+    for doc in streak_docs:
+        if "user" in doc:
+            user = doc["user"]
+            streaks[user] = max(doc.get("longestStreak", 0), pending_streaks.get(user, 0))
+
+    stamps = [doc[UPDATED_AT_FIELD] for doc in user_docs + streak_docs if UPDATED_AT_FIELD in doc]
+    return rows, streaks, pending_streaks, max(stamps, default=None)
+
+
+@timed
+def seed_leaderboards():
+    """Rebuild time_board and streak_board from Mongo plus still-buffered writes."""
+    global _boards_ready, _synced_at
+    try:
+        rows, streaks, pending_streaks, newest = _read_board_rows({})
+    except Exception as e:
+        print(f"Error seeding leaderboards: {e}")
+        return False
+    for user, streak in pending_streaks.items():  # users with no leaderboard document yet
+        streaks.setdefault(user, streak)
+
+    time_board.replace_all(rows)
+    streak_board.replace_all({user: {"longestStreak": s} for user, s in streaks.items()})
+    _synced_at = newest
+    _boards_ready = True
+    _bump_generation()
+    return True
+
+
+@timed
+def sync_leaderboards():
+    """
+    Apply the rows written (by any worker) since the last seed or sync: an
+    indexed range query on UPDATED_AT_FIELD, so the cost follows the number
+    of changed rows rather than the collection size.
+    """
+    global _synced_at
+    if _synced_at is None:
+        query = {UPDATED_AT_FIELD: {"$exists": True}}
+    else:
+        query = {UPDATED_AT_FIELD: {"$gte": _synced_at - LEADERBOARD_SYNC_OVERLAP}}
+    try:
+        rows, streaks, _, newest = _read_board_rows(query)
+    except Exception as e:
+        print(f"Error syncing leaderboards: {e}")
+        return False
+
+    for username, row in rows.items():
+        time_board.set(username, row)
+    for user, streak in streaks.items():
+        streak_board.set(user, {"longestStreak": streak})
+    if newest is not None and (_synced_at is None or newest > _synced_at):
+        _synced_at = newest
+    if rows or streaks:
+        _bump_generation()
+    return True
+
+
+def leaderboard_sync(sleep):
+    """Background task: seed the in-process leaderboards, then apply changed rows."""
+    while not seed_leaderboards():
+        sleep(LEADERBOARD_SYNC_SECONDS)
+    while True:
+        sleep(LEADERBOARD_SYNC_SECONDS)
+        sync_leaderboards()
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Existing helper
+@timed
 def update_user_time_as_it(username, total_seconds):
-    users.update_one(
-        {"username": username},
-        {"$set": {"time_as_it": total_seconds}}
-    )
+    stats_buffer.set(username, "time_as_it", total_seconds)
+    invalidate_profile(username)
 
 
+@timed
 def unlock_achievement(username, achievement_name):
     """
     Unlock an achievement for a user and record the unlock date.
     Returns True if this was a new unlock, False if already unlocked.
     """
-    # Check if achievement is already unlocked
-    user = users.find_one(
-        {"username": username, f"achievements.{achievement_name}.unlocked": True}
-    )
-
-    if user:
-        print(f"Achievement {achievement_name} already unlocked for {username}")
-        return False  # Already unlocked
-
-    # Unlock the achievement with timestamp
-    now = datetime.now()
-    print(f"Unlocking achievement {achievement_name} for {username}")
-    result = users.update_one(
-        {"username": username},
-        {"$set": {
-            f"achievements.{achievement_name}.unlocked": True,
-            f"achievements.{achievement_name}.unlockDate": now
-        }}
-    )
-
-    print(f"Unlock result for {username}.{achievement_name}: modified count = {result.modified_count}")
-    return result.modified_count > 0  # True if newly unlocked
+    try:
+        return achievement_engine.unlock(username, achievement_name)
+    finally:
+        invalidate_profile(username)  # after the write, so no read can cache the old unlocks
 
+@timed
 def initialize_player_stats(username):
     """Ensure every new user has the base stats fields."""
     users.update_one(
         {"username": username},
         {"$setOnInsert": {
             "time_as_it": 0,
-            "achievements": {
-                "first_tag": {
-                    "unlocked": False,
-                    "name": "First Tag",
-                    "description": "Tag another player for the first time"
-                },
-                "survivor_10min": {
-                    "unlocked": False,
-                    "name": "10-Minute Survivor",
-                    "description": "Stay as 'it' for 10 minutes total"
-                },
-                "survivor_1hour": {
-                    "unlocked": False,
-                    "name": "Ultimate Survivor",
-                    "description": "Stay as 'it' for 1 hour total"
-                }
-            },
+            "achievements": default_achievements(),
             # ───────── new fields ─────────
             "totalTags": 0,
             "totalTimeIt": 0
-        }},
+        }, "$currentDate": {UPDATED_AT_FIELD: True}},
         upsert=True
     )
+    if username not in time_board:
+        time_board.set(username, {"totalTags": 0, "totalTimeIt": 0})
+        _bump_generation()
 # ──────────────────────────────────────────────────────────────────────────────
 
 # ──────────────── your new, atomic increment helpers ─────────────────────────
+@timed
 def increment_user_tags(username, count=1):
-    """Atomically bump the totalTags counter."""
-    users.update_one(
-        {"username": username},
-        {"$inc": {"totalTags": count}}
-    )
+    """
+    Bump the totalTags counter (buffered; applied with $inc on flush).
+    Returns a list of newly unlocked achievements, if any.
+    """
+    stats_buffer.inc(username, "totalTags", count)
+    time_board.inc(username, "totalTags", count)
+    try:
+        return achievement_engine.record(username, "totalTags", count)
+    finally:
+        invalidate_profile(username)  # after any unlock record() persists
 
 
+@timed
 def increment_user_time(username, seconds):
     """
-    Atomically bump the totalTimeIt counter and check for time-based achievements.
+    Bump the totalTimeIt counter and check for time-based achievements.
     Returns a list of newly unlocked achievements, if any.
     """
-    print(f"Incrementing time for {username} by {seconds} seconds")
+    stats_buffer.inc(username, "totalTimeIt", seconds)
+    time_board.inc(username, "totalTimeIt", seconds)
+    try:
+        return achievement_engine.record(username, "totalTimeIt", seconds)
+    finally:
+        invalidate_profile(username)  # after any unlock record() persists
 
-    # Update the time counter
-    users.update_one(
-        {"username": username},
-        {"$inc": {"totalTimeIt": seconds}}
-    )
 
-    # Get the updated user data
-    user = users.find_one({"username": username})
-    if not user:
-        print(f"User {username} not found")
-        return []
-
-    total_time = user.get("totalTimeIt", 0)
-    print(f"User {username} total time: {total_time} seconds")
-    unlocked = []
-
-    # Check for time-based achievements
-    if total_time >= 600:  # 10 minutes (600 seconds)
-        print(f"User {username} qualifies for 10-minute achievement")
-        if unlock_achievement(username, "survivor_10min"):
-            print(f"Unlocked 10-minute achievement for {username}")
-            unlocked.append("survivor_10min")
-
-    if total_time >= 3600:  # 1 hour (3600 seconds)
-        print(f"User {username} qualifies for 1-hour achievement")
-        if unlock_achievement(username, "survivor_1hour"):
-            print(f"Unlocked 1-hour achievement for {username}")
-            unlocked.append("survivor_1hour")
-
-    print(f"Achievements unlocked for {username}: {unlocked}")
+@timed
+def check_achievements(username, stat, extra):
+    """Unlock achievements reached by *stat* plus an amount not recorded yet."""
+    unlocked = achievement_engine.check(username, stat, extra)
+    if unlocked:
+        invalidate_profile(username)
     return unlocked
 
+
+@timed
+def load_player_progress(username):
+    """Cache *username*'s totals and unlocks for the length of their session."""
+    return achievement_engine.load(username)
+
+
+@timed
+def forget_player_progress(username):
+    achievement_engine.forget(username)
+
+
+@timed
 def update_leaderboard(username, new_streak):
     """
     Update the leaderboard to store the user's longest streak.
-    Only updates if new_streak is higher.
+    Only updates if new_streak is higher (buffered; applied with $max on flush).
     """
-    leaderboard.update_one(
-        {"user": username},
-        {"$max": {"longestStreak": new_streak}},
-        upsert=True
-    )
+    stats_buffer.leaderboard_max(username, new_streak)
+    streak_board.max(username, "longestStreak", new_streak)
+    invalidate_profile(username)
 
+@timed
 def get_leaderboard(limit=10):
     """
     Return a sorted list of top users by longestStreak.
     """
+    if _boards_ready:
+        return [{"user": user, "longestStreak": row["longestStreak"]}
+                for _, user, row in streak_board.top(limit)]
     return list(
         leaderboard.find({}, {"_id": 0}).sort("longestStreak", -1).limit(limit)
     )
 
+def _board_row(username, row):
+    tags, time_it = row.get("totalTags", 0), row.get("totalTimeIt", 0)
+    return {
+        "username": username,
+        "totalTags": tags,
+        "totalTimeIt": time_it,
+        "tagsPerMinute": 0 if time_it == 0 else tags / time_it * 60,
+    }
+
+
+@timed
+def get_player_rank(username, radius=2):
+    """
+    Position of *username* on the aggregated leaderboard: 1-based rank,
+    percentile (share of other players ranked below) and the neighbouring rows.
+    Returns None if the user isn't ranked (or the board isn't seeded yet).
+    """
+    if not _boards_ready:
+        return None
+    rank = time_board.rank(username)
+    if rank is None:
+        return None
+    return {
+        "username": username,
+        "rank": rank + 1,
+        "percentile": time_board.percentile(username),
+        "players": len(time_board),
+        "around": [{"rank": r + 1, **_board_row(user, row)}
+                   for r, user, row in time_board.around(username, radius)],
+    }
+
+
+@timed
 def get_aggregated_leaderboard(limit=50):
     """
     Return leaderboard using MongoDB aggregation:
     - Top users with totalTags, totalTimeIt
     - Computed field: tagsPerMinute
+    Served from the in-process time_board once it's seeded.
     """
+    if _boards_ready:
+        return [_board_row(user, row) for _, user, row in time_board.top(limit)]
+
     pipeline = [
         {
             "$project": {
@@ -212,11 +442,75 @@ def get_aggregated_leaderboard(limit=50):
 
     return list(users.aggregate(pipeline))
 
+@timed
+def get_profiles(usernames):
+    """
+    Stats, longest streak and achievements for each of *usernames*, as
+    {username: profile}. Unknown users are left out. Cache misses are
+    fetched together with one `$in` query on users and one on leaderboard,
+    with still-buffered stat writes folded in.
+    """
+    wanted = list(dict.fromkeys(usernames))[:PROFILE_BATCH_LIMIT]
+    profiles, misses = {}, []
+    for username in wanted:
+        cached = profile_cache.get(username)
+        if cached is None:
+            misses.append(username)
+        else:
+            profiles[username] = cached
+    if not misses:
+        return profiles
+
+    versions = {}
+    for username in misses:
+        reading = _profile_reads.setdefault(username, [0, 0])
+        reading[0] += 1
+        versions[username] = reading[1]
+    try:
+        return _read_profiles(misses, versions, profiles)
+    finally:
+        for username in misses:
+            reading = _profile_reads[username]
+            reading[0] -= 1
+            if not reading[0]:
+                del _profile_reads[username]
+
+
+def _read_profiles(misses, versions, profiles):
+    """Fetch the uncached *misses* into *profiles*; see get_profiles."""
+    def read():
+        return (
+            list(users.find({"username": {"$in": misses}},
+                            {"_id": 0, "username": 1, "totalTags": 1, "totalTimeIt": 1, "achievements": 1})),
+            list(leaderboard.find({"user": {"$in": misses}}, {"_id": 0, "user": 1, "longestStreak": 1})),
+        )
+
+    (user_docs, streak_docs), pending, pending_streaks = stats_buffer.read_all_with_pending(read)
+    streaks = {doc["user"]: doc.get("longestStreak", 0) for doc in streak_docs}
+
+    for doc in user_docs:
+        username = doc["username"]
+        profile = {
+            "username": username,
+            "totalTags": doc.get("totalTags", 0),
+            "totalTimeIt": doc.get("totalTimeIt", 0.0),
+            "longestStreak": max(streaks.get(username, 0), pending_streaks.get(username, 0)),
+            "achievements": doc.get("achievements", {}),
+        }
+        for field, amount in pending.get(username, {}).get("$inc", {}).items():
+            if field in profile:
+                profile[field] += amount
+        # Don't cache a profile a writer touched while we were reading it
+        if _profile_reads[username][1] == versions[username]:
+            profile_cache.set(username, profile)
+        profiles[username] = profile
+    return profiles
+
+
+@timed
 def get_user_achievements(username):
     """
     Get all achievements for a user
     """
-    user = users.find_one({"username": username}, {"_id": 0, "achievements": 1})
-    if user and "achievements" in user:
-        return user["achievements"]
-    return {}
\ No newline at end of file
+    profile = get_profiles([username]).get(username)
+    return profile["achievements"] if profile else {}
\ No newline at end of file
@@ -0,0 +1,81 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+# Every index the app relies on, by collection. Names are explicit so a
+# changed spec can be told apart from an existing index on the same keys.
+INDEXES = {
+    "users": [
+        # register / login / every stats lookup
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # get_aggregated_leaderboard sorts by least time as "it"
+        IndexModel([("totalTimeIt", ASCENDING)], name="totalTimeIt"),
+        # sync_leaderboards reads rows stamped since its last pass
+        IndexModel([("statsUpdatedAt", ASCENDING)], name="statsUpdatedAt"),
+    ],
+    "sessions": [
+        # validate_session / logout; legacy socket-only docs have no digest
+        IndexModel([("token_digest", ASCENDING)], name="token_digest_unique", unique=True,
+                   partialFilterExpression={"token_digest": {"$exists": True}}),
+        # per-user session cap (SessionStore._enforce_cap)
+        IndexModel([("username", ASCENDING)], name="username"),
+        # Mongo deletes a session once its JWT has expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "loginAttempts": [
+        # record_login_attempts upserts one document per key and window
+        IndexModel([("key", ASCENDING), ("window", ASCENDING)], name="key_window_unique", unique=True),
+        # Mongo drops them once LOGIN_ATTEMPTS_RETENTION has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "leaderboard": [
+        IndexModel([("user", ASCENDING)], name="user_unique", unique=True),
+        IndexModel([("longestStreak", DESCENDING)], name="longestStreak"),
+        IndexModel([("statsUpdatedAt", ASCENDING)], name="statsUpdatedAt"),
+    ],
+}
+
+
+def _stale(existing, model):
+    """Names of existing indexes on the same keys as *model* but under another name."""
+    spec = model.document
+    keys = list(spec["key"].items())
+    return [name for name, info in existing.items()
+            if name != "_id_" and name != spec["name"] and list(info["key"]) == keys]
+
+
+def apply_indexes(db, indexes=INDEXES):
+    """
+    Create every declared index. Idempotent: existing indexes with the same
+    spec are left alone. An older index on the same keys is dropped first so
+    its options can change. One failing index (e.g. duplicate usernames
+    blocking a unique index) doesn't stop the rest.
+
+    Returns {collection: {index name: "ok" | error message}}.
+    """
+    report = {}
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        results = report.setdefault(collection_name, {})
+        try:
+            existing = collection.index_information()
+        except PyMongoError as e:
+            for model in models:
+                results[model.document["name"]] = str(e)
+            continue
+
+        for model in models:
+            name = model.document["name"]
+            try:
+                for stale in _stale(existing, model):
+                    collection.drop_index(stale)
+                collection.create_indexes([model])
+                results[name] = "ok"
+            except PyMongoError as e:
+                results[name] = str(e)
+    return report
+
+
+def drop_indexes(db, indexes=INDEXES):
+    """Drop every non-_id index on the declared collections (benchmarks only)."""
+    for collection_name in indexes:
+        db[collection_name].drop_indexes()
@@ -0,0 +1,149 @@
+import time
+from datetime import datetime, timezone
+
+from pymongo import DESCENDING
+
+
+class SessionStore:
+    """
+    Login sessions, one document per issued JWT:
+
+        {username, token_digest, created_at, expires_at}
+
+    Each user keeps at most *max_per_user* sessions; logging in again evicts
+    the oldest. Mongo's TTL index on expires_at (db/indexes.py) deletes
+    expired sessions on its own schedule; sweep() additionally compacts
+    `sessions` and `login_attempts` on ours: expired documents the TTL monitor
+    hasn't reached yet, leftover per-socket documents, and users over the
+    cap. server.py runs run() as a background task.
+
+    Sessions from before token digests hold a bcrypt `token_hash` instead.
+    They are never bulk-deleted: adopt_legacy() gives one its digest the
+    first time its token is used, and the rest expire like any other.
+    """
+
+    def __init__(self, sessions, login_attempts, max_per_user=5, sweep_interval=300):
+        self.sessions = sessions
+        self.login_attempts = login_attempts
+        self.max_per_user = max_per_user
+        self.sweep_interval = sweep_interval
+        self.created = 0
+        self.evicted = 0
+        self.adopted = 0
+        self.sweeps = 0
+        self.swept = {"sessions": 0, "login_attempts": 0}
+        self.last_sweep = None
+
+    def create(self, username, digest, expires_at):
+        """Store a new session; returns the digests of sessions evicted by the cap."""
+        self.sessions.insert_one({
+            "username": username,
+            "token_digest": digest,
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": expires_at,
+        })
+        self.created += 1
+        return self._enforce_cap(username)
+
+    def _enforce_cap(self, username):
+        extra = list(
+            self.sessions.find({"username": username, "token_digest": {"$exists": True}},
+                               {"_id": 1, "token_digest": 1})
+            .sort("created_at", DESCENDING)
+            .skip(self.max_per_user)
+        )
+        if not extra:
+            return []
+        self.sessions.delete_many({"_id": {"$in": [doc["_id"] for doc in extra]}})
+        self.evicted += len(extra)
+        return [doc["token_digest"] for doc in extra]
+
+    def username_for(self, digest):
+        """Username of the unexpired session with *digest*, or None."""
+        doc = self.sessions.find_one(
+            {"token_digest": digest, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "username": 1})
+        return doc.get("username") if doc else None
+
+    def adopt_legacy(self, username, digest, token, verify):
+        """
+        Find *username*'s unexpired legacy session for *token* (verify(token,
+        token_hash) is a bcrypt check) and move it to *digest*. Returns True
+        if one was adopted.
+        """
+        legacy = self.sessions.find(
+            {"username": username, "token_hash": {"$exists": True},
+             "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 1, "token_hash": 1})
+        for doc in legacy:
+            if verify(token, doc["token_hash"]):
+                self.sessions.update_one({"_id": doc["_id"]},
+                                         {"$set": {"token_digest": digest}, "$unset": {"token_hash": ""}})
+                self.adopted += 1
+                self._enforce_cap(username)
+                return True
+        return False
+
+    def delete(self, digest):
+        self.sessions.delete_one({"token_digest": digest})
+
+    def sweep(self):
+        """
+        One compaction pass. Returns a report with what was deleted, the
+        digests evicted by the cap, collection sizes and how long it took.
+        Orphans are the old per-socket documents, which hold no login.
+        """
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        expired = self.sessions.delete_many({"expires_at": {"$lt": now}}).deleted_count
+        orphaned = self.sessions.delete_many(
+            {"token_digest": {"$exists": False}, "token_hash": {"$exists": False}}).deleted_count
+
+        evicted = []
+        over_cap = self.sessions.aggregate([
+            {"$group": {"_id": "$username", "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": self.max_per_user}}},
+        ])
+        for doc in over_cap:
+            evicted.extend(self._enforce_cap(doc["_id"]))
+
+        attempts = self.login_attempts.delete_many({"expires_at": {"$lt": now}}).deleted_count
+
+        report = {
+            "at": now.isoformat(),
+            "sessions_expired": expired,
+            "sessions_orphaned": orphaned,
+            "sessions_evicted": len(evicted),
+            "login_attempts_expired": attempts,
+            "sessions_size": self.sessions.estimated_document_count(),
+            "login_attempts_size": self.login_attempts.estimated_document_count(),
+            "ms": round((time.perf_counter() - start) * 1000, 2),
+            "evicted_digests": evicted,
+        }
+        self.sweeps += 1
+        self.swept["sessions"] += expired + orphaned + len(evicted)
+        self.swept["login_attempts"] += attempts
+        self.last_sweep = {k: v for k, v in report.items() if k != "evicted_digests"}
+        return report
+
+    def run(self, sleep, on_evicted=None):
+        """Background task: sweep every sweep_interval seconds."""
+        while True:
+            try:
+                report = self.sweep()
+                if on_evicted and report["evicted_digests"]:
+                    on_evicted(report["evicted_digests"])
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+            sleep(self.sweep_interval)
+
+    def metrics(self):
+        return {
+            "max_per_user": self.max_per_user,
+            "created": self.created,
+            "evicted": self.evicted,
+            "adopted": self.adopted,
+            "sweeps": self.sweeps,
+            "swept": dict(self.swept),
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,215 @@
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+# Stamped ($currentDate) on every document a flush writes, so other workers
+# can pick up just the rows that changed (see db.database.sync_leaderboards)
+UPDATED_AT_FIELD = "statsUpdatedAt"
+
+_STAMP = {"$currentDate": {UPDATED_AT_FIELD: True}}
+
+
+class StatsBuffer:
+    """
+    Write-behind buffer for per-user stat updates.
+
+    `$inc`, `$max` and `$set` updates are merged per user in memory and written
+    with one unordered `bulk_write` per collection, every FLUSH_INTERVAL seconds
+    or as soon as MAX_PENDING users are waiting. Call `flush()` on shutdown.
+    Every written document also gets UPDATED_AT_FIELD set to Mongo's clock.
+
+    No lock is held across Mongo I/O. Readers that need exact totals
+    (achievement thresholds, profiles, leaderboard seeds) go through
+    `read_doc_with_pending` / `read_all_with_pending`, which use a sequence
+    number like a seqlock: it is odd while a flush is writing, and a read is
+    retried if a flush started or finished while it ran, so buffered amounts
+    are counted exactly once.
+    """
+
+    def __init__(self, users, leaderboard, flush_interval=1.0, max_pending=500):
+        self.users = users
+        self.leaderboard = leaderboard
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._users = {}   # username → {'$inc': {...}, '$max': {...}, '$set': {...}}
+        self._streaks = {}  # username → best longestStreak not yet written
+        self._lock = threading.Lock()  # guards the pending dicts and _seq; never held across I/O
+        self._seq = 0                  # odd while a flush is in flight
+        self._idle = threading.Event()  # set while no flush is in flight
+        self._idle.set()
+        self._wake = threading.Event()
+
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_ops = 0
+        self.flush_errors = 0
+        self.dropped_ops = 0
+
+    # ─── buffering ────────────────────────────────────────────
+    def _update(self, username, op):
+        ops = self._users.setdefault(username, {})
+        if len(self._users) >= self.max_pending:
+            self._wake.set()
+        return ops.setdefault(op, {})
+
+    def inc(self, username, field, amount):
+        with self._lock:
+            fields = self._update(username, "$inc")
+            fields[field] = fields.get(field, 0) + amount
+
+    def set(self, username, field, value):
+        with self._lock:
+            self._update(username, "$set")[field] = value
+
+    def leaderboard_max(self, username, streak):
+        with self._lock:
+            self._streaks[username] = max(self._streaks.get(username, streak), streak)
+            if len(self._streaks) >= self.max_pending:
+                self._wake.set()
+
+    def _read_consistent(self, read, copy):
+        """
+        Call read() and then copy() the buffered updates with no flush in
+        between: if a flush is writing, wait for it; if one started or ended
+        during read(), read again.
+        """
+        while True:
+            self._idle.wait()
+            seq = self._seq
+            if seq & 1:
+                continue
+            result = read()
+            with self._lock:
+                if self._seq == seq:
+                    return result, copy()
+
+    def read_doc_with_pending(self, username, read):
+        """
+        Return the document read() returns with every buffered `$inc` for
+        *username* folded in, or None if read() returns None.
+        """
+        doc, pending = self._read_consistent(
+            read, lambda: dict(self._users.get(username, {}).get("$inc", {})))
+        if doc is None:
+            return None
+        for field, amount in pending.items():
+            doc[field] = doc.get(field, 0) + amount
+        return doc
+
+    def read_all_with_pending(self, read):
+        """
+        Call read() and copy every buffered update with no flush in between.
+        Returns (read(), {username: {op: {field: value}}}, {username: streak}).
+        """
+        def copy():
+            users = {u: {op: dict(fields) for op, fields in update.items()}
+                     for u, update in self._users.items()}
+            return users, dict(self._streaks)
+
+        result, (users, streaks) = self._read_consistent(read, copy)
+        return result, users, streaks
+
+    @property
+    def queue_depth(self):
+        return len(self._users) + len(self._streaks)
+
+    # ─── flushing ─────────────────────────────────────────────
+    def flush(self):
+        with self._lock:
+            if self._seq & 1:
+                return 0  # another flush is writing; the next one picks these up
+            users, self._users = self._users, {}
+            streaks, self._streaks = self._streaks, {}
+            if not users and not streaks:
+                return 0
+            self._seq += 1
+            self._idle.clear()
+
+        started = time.perf_counter()
+        user_updates = list(users.items())
+        board_updates = list(streaks.items())
+        failed_users = failed_streaks = None
+        try:
+            failed_users = self._write(
+                self.users, [UpdateOne({"username": u}, {**update, **_STAMP})
+                             for u, update in user_updates])
+            failed_streaks = self._write(
+                self.leaderboard, [UpdateOne({"user": u}, {"$max": {"longestStreak": s}, **_STAMP}, upsert=True)
+                                   for u, s in board_updates])
+        finally:
+            with self._lock:
+                # Put back what didn't reach Mongo before readers may run again,
+                # so none of them sees it missing from both Mongo and the buffer
+                self._requeue(dict(user_updates[i] for i in failed_users or ()),
+                              dict(board_updates[i] for i in failed_streaks or ()))
+                self._seq += 1
+                self._idle.set()
+
+        if failed_users is not None or failed_streaks is not None:
+            self.flush_errors += 1
+            return 0
+
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - started
+        self.last_flush_ops = len(user_updates) + len(board_updates)
+        return self.last_flush_ops
+
+    def _write(self, collection, ops):
+        """
+        bulk_write *ops*; returns None on success, else the indexes of the ops
+        to retry. For a BulkWriteError those are exactly the writeErrors (an
+        unordered bulk applies the rest), and if no server could be selected
+        nothing was sent, so all of them are retried. Any other error may come
+        after some `$inc`s were applied; retrying would count those twice, so
+        the batch is logged and dropped instead.
+        """
+        if not ops:
+            return None
+        try:
+            collection.bulk_write(ops, ordered=False)
+            return None
+        except BulkWriteError as e:
+            print(f"Error flushing stats buffer: {e}")
+            return [err["index"] for err in e.details.get("writeErrors", [])]
+        except ServerSelectionTimeoutError as e:
+            print(f"Error flushing stats buffer: {e}")
+            return range(len(ops))
+        except Exception as e:
+            print(f"Error flushing stats buffer, dropping {len(ops)} updates: {e}")
+            self.dropped_ops += len(ops)
+            return []
+
+    def _requeue(self, users, streaks):
+        """Merge failed updates back into the buffer. Caller holds _lock."""
+        for username, update in users.items():
+            for op, fields in update.items():
+                target = self._users.setdefault(username, {}).setdefault(op, {})
+                for field, value in fields.items():
+                    if op == "$inc":
+                        target[field] = target.get(field, 0) + value
+                    elif op == "$max":
+                        target[field] = max(target.get(field, value), value)
+                    else:
+                        target.setdefault(field, value)  # keep the newer $set
+        for username, streak in streaks.items():
+            self._streaks[username] = max(self._streaks.get(username, streak), streak)
+
+    def run(self):
+        """Background task: flush on the interval, or early when the buffer fills."""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def metrics(self):
+        return {
+            "queueDepth": self.queue_depth,
+            "flushes": self.flushes,
+            "flushErrors": self.flush_errors,
+            "droppedOps": self.dropped_ops,
+            "lastFlushSeconds": self.last_flush_seconds,
+            "lastFlushOps": self.last_flush_ops,
+        }
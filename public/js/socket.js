@@ -30,6 +30,62 @@ export function loadAvatarTexture(scene, key, url) {
 }
 
 
+/* ─── Binary wire format (see util/backend/wire_format.py) ──── */
+const WIRE_VERSION = 1;
+const QUANT        = 4;
+const NO_BASE      = 0xFFFFFFFF;
+
+export function encodeMoveFrame(x, y, ack) {
+  const view = new DataView(new ArrayBuffer(9));
+  const q = v => Math.max(0, Math.min(0xFFFF, Math.round(v * QUANT)));
+  view.setUint8(0, WIRE_VERSION);
+  view.setUint16(1, q(x), true);
+  view.setUint16(3, q(y), true);
+  view.setUint32(5, ack || 0, true);
+  return view.buffer;
+}
+
+export function decodeSnapshotFrame(buf, sidOf) {
+  const view = new DataView(buf);
+  if (view.getUint8(0) !== WIRE_VERSION) return null;
+  const tick  = view.getUint32(1, true);
+  const base  = view.getUint32(5, true);
+  const time  = view.getFloat64(9, true);
+  const nPos  = view.getUint16(17, true);
+  const nRem  = view.getUint16(19, true);
+  const nExtra = view.getUint32(21, true);
+  let off = 25;
+
+  const positions = [];
+  for (let i = 0; i < nPos; i++) {
+    const slot = view.getUint16(off, true), mask = view.getUint8(off + 2);
+    off += 3;
+    const fields = {};
+    if (mask & 1) { fields.x = view.getUint16(off, true) / QUANT; off += 2; }
+    if (mask & 2) { fields.y = view.getUint16(off, true) / QUANT; off += 2; }
+    positions.push([slot, fields]);
+  }
+  const removedSlots = [];
+  for (let i = 0; i < nRem; i++) { removedSlots.push(view.getUint16(off, true)); off += 2; }
+  const extra = nExtra
+    ? JSON.parse(new TextDecoder().decode(new Uint8Array(buf, off, nExtra)))
+    : {};
+
+  const players = {};
+  for (const [slot, fields] of Object.entries(extra)) {
+    if (fields.id) { sidOf[slot] = fields.id; delete fields.id; }
+    players[sidOf[slot]] = { ...players[sidOf[slot]], ...fields };
+  }
+  for (const [slot, fields] of positions) {
+    players[sidOf[slot]] = { ...players[sidOf[slot]], ...fields };
+  }
+  return {
+    tick, time, base: base === NO_BASE ? null : base, keyframe: base === NO_BASE,
+    players, removed: removedSlots.map(s => sidOf[s])
+  };
+}
+
+
 /* ─── Network wrapper ──────────────────────────────────────── */
 export default class Network {
   constructor(scene) {
@@ -40,12 +96,33 @@ export default class Network {
     this.itTimes   = {};
     this.leaderboardVisible = false;
 
-    this.socket = io({ transports: ['websocket'], upgrade: false });
+    /* outbound moves are coalesced and flushed at the server tick rate */
+    this.tickRate     = 20;
+    this.pendingMove  = null;
+    this.moveTimer    = null;
+    this.lastTick     = 0;
+    this.ackedTick    = 0;
+    this.frames       = new Map();   // tick → reconstructed world, for delta bases
+    this.spawning     = new Set();   // ids whose avatar is still loading
+
+    /* ask for the binary protocol; server answers with init.proto */
+    this.proto  = 'json';
+    this.sidOf  = {};     // binary slot → sid
+    this.socket = io({
+      transports: ['websocket'], upgrade: false, autoConnect: false,
+      query: { proto: 'bin' }
+    });
+    this.connect();
 
     /* server → client */
     this.socket.on('init',            async data => await this.handleInit(data));
     this.socket.on('playerJoined',    async data => await this.spawn(data));
     this.socket.on('playerMoved',           data => this.move(data));
+    this.socket.on('worldSnapshot',         data => this.applySnapshot(data));
+    this.socket.on('worldFrame',            buf  => {
+      const snap = decodeSnapshotFrame(buf, this.sidOf);
+      if (snap) this.applySnapshot(snap);
+    });
     this.socket.on('playerLeft',            data => this.remove(data));
     this.socket.on('tagUpdate',             data => this.updateTags(data));
     this.socket.on('leaderboardUpdate',     data => this.updateLeaderboard(data));
@@ -55,11 +132,29 @@ export default class Network {
     console.log("Network initialized, listening for achievements");
   }
 
+  /* ── matchmaking: open the socket on the worker that owns our room ── */
+  async connect() {
+    try {
+      const res = await fetch('/api/matchmake');
+      if (res.ok) {
+        const { worker } = await res.json();
+        this.socket.io.opts.query = { ...this.socket.io.opts.query, worker };
+      }
+    } catch (err) {
+      console.warn('Matchmaking failed, using default worker', err);
+    }
+    this.socket.connect();
+  }
+
   /* ── first snapshot ─────────────────────────────────────── */
   async handleInit(data) {
     this.myID    = data.id;
     this.isIt    = data.players[this.myID].it;
     this.itTimes = data.it_times || {};
+    this.lastTick = data.tick || 0;
+    if (data.tickRate) this.tickRate = data.tickRate;
+    this.proto = data.proto || 'json';
+    this.startMoveTimer();
 
     /* spawn ALL players (self + existing) */
     for (const [id, info] of Object.entries(data.players)) {
@@ -81,7 +176,8 @@ export default class Network {
 
   /* ── spawn (first time or on join) ───────────────────────── */
   async spawn({ id, x, y, it, name = '', avatar }) {
-    if (this.players[id]) return;    // already spawned
+    if (this.players[id] || this.spawning.has(id)) return;    // already spawned
+    this.spawning.add(id);
 
     /* 1) base circle */
     const circle = this.scene.add
@@ -113,6 +209,7 @@ export default class Network {
 
     /* save ref */
     this.players[id] = { id, it, circle, container, label };
+    this.spawning.delete(id);
 
     /* self special‑case: enable camera follow */
     if (id === this.myID) {
@@ -130,6 +227,39 @@ export default class Network {
    this.players[id].container.setPosition(x, y);
   }
 
+  /* ── delta snapshots, one message per server tick ───────── */
+  applySnapshot({ tick, base, keyframe, players, removed }) {
+    if (tick <= this.lastTick) return;   // stale / out of order
+
+    let world;
+    if (keyframe) {
+      world = {};
+    } else {
+      const baseFrame = this.frames.get(base);
+      if (!baseFrame) return this.socket.emit('requestKeyframe');
+      world = { ...baseFrame };
+    }
+    for (const id of removed) delete world[id];
+    for (const [id, fields] of Object.entries(players)) {
+      world[id] = { ...world[id], ...fields };
+    }
+
+    this.lastTick = tick;
+    this.frames.set(tick, world);
+    for (const t of this.frames.keys()) {
+      if (this.frames.size <= 64) break;
+      this.frames.delete(t);
+    }
+
+    /* render: joins, moves, IT flips, leaves */
+    for (const [id, p] of Object.entries(world)) {
+      if (!this.players[id]) { this.spawn({ id, ...p }); continue; }
+      this.move({ id, ...p });
+      if (this.players[id].it !== p.it) this.updateTags(p.it ? { newIt: id } : { prevIt: id });
+    }
+    for (const id of removed) this.remove({ id });
+  }
+
   /* ── player left ────────────────────────────────────────── */
   remove({ id }) {
     const p = this.players[id];
@@ -180,7 +310,24 @@ export default class Network {
   }
 
   /* ── client → server ───────────────────────────────────── */
-  sendMove(x, y) { this.socket.emit('move', { x, y }); }
+  sendMove(x, y) { this.pendingMove = { x, y }; }
+  flushMove() {
+    /* acknowledgements ride along with moves, or go alone when idle */
+    const ack = this.lastTick;
+    if (this.pendingMove) {
+      const { x, y } = this.pendingMove;
+      if (this.proto === 'bin') this.socket.emit('moveFrame', encodeMoveFrame(x, y, ack));
+      else                      this.socket.emit('move', { x, y, ack });
+      this.pendingMove = null;
+    } else if (ack !== this.ackedTick) {
+      this.socket.emit('snapshotAck', { tick: ack });
+    }
+    this.ackedTick = ack;
+  }
+  startMoveTimer() {
+    if (this.moveTimer) clearInterval(this.moveTimer);
+    this.moveTimer = setInterval(() => this.flushMove(), 1000 / this.tickRate);
+  }
   sendTag(id)    { this.socket.emit('tag',  { id });   }
   requestLeaderboard() { this.socket.emit('getLeaderboard'); }
   requestAchievements() {
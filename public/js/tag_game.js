@@ -106,18 +106,7 @@ class GameScene extends Phaser.Scene {
     if (!blockedY) { mover.y = newY; moved = true; }
     if (moved) this.network.sendMove(mover.x, mover.y);
 
-    /* bump‑to‑tag (reverse tag) */
-    if (!this.network.isIt) {
-      for (const p of Object.values(this.network.players)) {
-        if (!p.it) continue;
-        const dist = Phaser.Math.Distance.Between(
-          mover.x, mover.y, p.container.x, p.container.y);
-        if (dist < 32) {
-          this.network.sendTag(p.id);
-          break;
-        }
-      }
-    }
+    /* bump‑to‑tag (reverse tag) is detected by the server every tick */
 
     /* leaderboard maintenance */
     if (Phaser.Input.Keyboard.JustDown(this.leaderboardKey)) this.toggleLeaderboard();
@@ -0,0 +1,96 @@
+"""
+Benchmark: avatar processing inline on the hub vs. in the process pool.
+
+    python -m scripts.bench_avatar_upload [uploads] [concurrency] [megapixels]
+
+Runs under eventlet like the server. A ticker greenlet asks to wake every
+5 ms; how late it wakes is the hub stall every game socket would see.
+Reports upload throughput and p50/p99/max stall for each mode.
+"""
+import io
+import random
+import sys
+import tempfile
+import time
+
+TICK = 0.005
+
+
+def _photo(megapixels):
+    """A noisy JPEG roughly the size of a phone photo."""
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.effect_noise((width // 8, height // 8), 64).convert("RGB")
+    image = image.resize((width, height))
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _inline(stream, directory, username):
+    """What upload_avatar used to do, on the calling greenlet."""
+    import os
+    from PIL import Image, ImageOps
+
+    image = Image.open(stream).convert("RGBA")
+    cropped = ImageOps.fit(image, (128, 128), Image.LANCZOS, centering=(0.5, 0.5))
+    cropped.save(os.path.join(directory, f"{username}.png"), format="PNG")
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def _run(label, process, data, uploads, concurrency):
+    import eventlet
+
+    stalls = []
+    running = True
+
+    def ticker():
+        while running:
+            start = time.perf_counter()
+            eventlet.sleep(TICK)
+            stalls.append(max(0.0, time.perf_counter() - start - TICK))
+
+    pool = eventlet.GreenPool(concurrency)
+    with tempfile.TemporaryDirectory() as directory:
+        tick = eventlet.spawn(ticker)
+        eventlet.sleep(TICK * 4)
+        start = time.perf_counter()
+        for i in range(uploads):
+            pool.spawn_n(process, io.BytesIO(data), directory, f"user{i}")
+        pool.waitall()
+        elapsed = time.perf_counter() - start
+        running = False
+        tick.wait()
+
+    print(f"  {label:<7} {uploads / elapsed:7.2f} uploads/s   stall p50 {_percentile(stalls, 0.5) * 1000:7.2f} ms"
+          f"   p99 {_percentile(stalls, 0.99) * 1000:7.2f} ms   max {max(stalls) * 1000:7.2f} ms")
+
+
+def main(uploads=40, concurrency=8, megapixels=12):
+    from util.backend.upload.avatar_processing import AvatarProcessor
+
+    random.seed(0)
+    data = _photo(megapixels)
+    print(f"{uploads} uploads of a {len(data) / 1e6:.1f} MB, {megapixels} MP JPEG, {concurrency} at a time")
+
+    _run("inline", _inline, data, uploads, concurrency)
+
+    processor = AvatarProcessor(workers=2, max_pending=max(concurrency, 8))
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            processor.process(io.BytesIO(data), directory, "warmup")  # start the workers
+        _run("pool", processor.process, data, uploads, concurrency)
+    finally:
+        processor.shutdown()
+
+
+if __name__ == "__main__":
+    import eventlet
+    eventlet.monkey_patch()
+    main(*(int(a) for a in sys.argv[1:4]))
@@ -0,0 +1,152 @@
+"""
+Benchmark the queries in db/database.py with and without the declared indexes.
+
+    python -m scripts.bench_db_queries [--url mongodb://localhost:27017/] [--users 100000]
+
+Seeds a throwaway database (tag_game_bench by default) with synthetic users,
+sessions and leaderboard rows. Each query is then run twice: first with no
+secondary indexes, then after db.indexes.apply_indexes. For each run it
+prints the winning plan's stages (COLLSCAN vs IXSCAN, SORT vs none) and
+the median/p95 latency. The database is dropped at the end unless --keep.
+"""
+import argparse
+import hashlib
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from db.achievements import default_achievements
+from db.indexes import apply_indexes, drop_indexes
+
+BATCH = 10_000
+
+
+def _seed(db, n):
+    rng = random.Random(312)
+    now = datetime.utcnow()
+    for start in range(0, n, BATCH):
+        names = [f"user{i}" for i in range(start, min(start + BATCH, n))]
+        db.users.insert_many([{
+            "username": name,
+            "password": b"x" * 60,
+            "time_as_it": 0,
+            "achievements": default_achievements(),
+            "totalTags": rng.randrange(500),
+            "totalTimeIt": rng.uniform(0, 7200),
+        } for name in names], ordered=False)
+        db.sessions.insert_many([{
+            "username": name,
+            "token_digest": hashlib.sha256(name.encode()).hexdigest(),
+            "created_at": now,
+            "expires_at": now + timedelta(hours=1),
+        } for name in names], ordered=False)
+        db.leaderboard.insert_many([{"user": name, "longestStreak": rng.randrange(3600)}
+                                    for name in names], ordered=False)
+        print(f"  seeded {start + len(names)}/{n}", end="\r")
+    print()
+
+
+def _queries(db, n):
+    """(label, run, explain) for every query shape database.py / auth.py issue."""
+    rng = random.Random(5)
+
+    def name():
+        return f"user{rng.randrange(n)}"
+
+    pipeline = [
+        {"$project": {"_id": 0, "username": 1, "totalTags": 1, "totalTimeIt": 1}},
+        {"$sort": {"totalTimeIt": 1}},
+        {"$limit": 50},
+    ]
+    return [
+        ("users by username",
+         lambda: db.users.find_one({"username": name()}),
+         lambda: db.users.find({"username": name()}).limit(1).explain()),
+        ("sessions by token_digest",
+         lambda: db.sessions.find_one({"token_digest": hashlib.sha256(name().encode()).hexdigest()}),
+         lambda: db.sessions.find({"token_digest": "x"}).limit(1).explain()),
+        ("sessions by username",
+         lambda: db.sessions.find_one({"username": name()}),
+         lambda: db.sessions.find({"username": name()}).limit(1).explain()),
+        ("leaderboard top 10",
+         lambda: list(db.leaderboard.find({}, {"_id": 0}).sort("longestStreak", -1).limit(10)),
+         lambda: db.leaderboard.find({}, {"_id": 0}).sort("longestStreak", -1).limit(10).explain()),
+        ("leaderboard by user",
+         lambda: db.leaderboard.find_one({"user": name()}),
+         lambda: db.leaderboard.find({"user": name()}).limit(1).explain()),
+        ("aggregated leaderboard",
+         lambda: list(db.users.aggregate(pipeline)),
+         lambda: db.command("aggregate", "users", pipeline=pipeline, explain=True)),
+    ]
+
+
+def _stages(plan):
+    """Stage names of a winning plan, outermost first."""
+    out = []
+    while isinstance(plan, dict):
+        if "stage" in plan:
+            out.append(plan["stage"])
+        plan = plan.get("inputStage") or plan.get("queryPlan") or (plan.get("inputStages") or [None])[0]
+    return out
+
+
+def _winning_plan(explain):
+    if "queryPlanner" in explain:
+        return explain["queryPlanner"]["winningPlan"]
+    for stage in explain.get("stages", ()):  # aggregate that didn't fully push down
+        if "$cursor" in stage:
+            return stage["$cursor"]["queryPlanner"]["winningPlan"]
+    return {}
+
+
+def _measure(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def _report(db, n, repeat, label):
+    print(label)
+    for name, run, explain in _queries(db, n):
+        stages = " > ".join(_stages(_winning_plan(explain()))) or "?"
+        median, p95 = _measure(run, repeat)
+        print(f"  {name:<26} {median:9.3f} ms p50 {p95:9.3f} ms p95   {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="tag_game_bench")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="don't drop the database afterwards")
+    args = parser.parse_args()
+
+    db = MongoClient(args.url)[args.db]
+    if db.users.estimated_document_count() != args.users:
+        db.client.drop_database(args.db)
+        print(f"seeding {args.users} users into {args.db}")
+        _seed(db, args.users)
+
+    try:
+        drop_indexes(db)
+        _report(db, args.users, args.repeat, "before (no secondary indexes)")
+        for collection, results in apply_indexes(db).items():
+            for index, status in results.items():
+                if status != "ok":
+                    print(f"  index {collection}.{index} failed: {status}")
+        _report(db, args.users, args.repeat, "after (db/indexes.py)")
+    finally:
+        if not args.keep:
+            db.client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: JSON dict snapshots vs. packed binary frames.
+
+    python -m scripts.bench_wire_format [players] [iterations]
+
+Reports encode cost and payload size for a keyframe and for a typical delta
+where a quarter of the lobby moved.
+"""
+import json
+import random
+import string
+import sys
+import timeit
+
+from util.backend.wire_format import SlotTable, encode_move, encode_snapshot
+
+
+def _sid():
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=20))
+
+
+def _snapshots(n):
+    sids = [_sid() for _ in range(n)]
+    keyframe = {'tick': 100, 'time': 1.7e9, 'base': None, 'keyframe': True, 'removed': [],
+                'players': {sid: {'x': random.uniform(0, 2880), 'y': random.uniform(0, 1920),
+                                  'it': i == 0, 'name': f'user{i}', 'avatar': f'/static/avatars/user{i}.png',
+                                  'total': 0, 'started_at': None}
+                            for i, sid in enumerate(sids)}}
+    delta = {'tick': 101, 'time': 1.7e9, 'base': 100, 'keyframe': False, 'removed': [],
+             'players': {sid: {'x': random.uniform(0, 2880), 'y': random.uniform(0, 1920)}
+                         for sid in sids[: max(1, n // 4)]}}
+    return keyframe, delta
+
+
+def _report(label, fn, iterations):
+    secs = timeit.timeit(fn, number=iterations)
+    size = len(fn())
+    print(f"  {label:<8} {secs / iterations * 1e6:9.2f} µs/op  {size:7d} bytes")
+
+
+def main(players=50, iterations=2000):
+    slots = SlotTable()
+    keyframe, delta = _snapshots(players)
+    encode_snapshot(keyframe, slots)  # warm the slot table
+
+    for name, snap in (("keyframe", keyframe), ("delta", delta)):
+        print(f"{name} ({players} players, {len(snap['players'])} entries)")
+        _report("json", lambda: json.dumps(snap).encode(), iterations)
+        _report("binary", lambda: encode_snapshot(snap, slots), iterations)
+
+    print("move")
+    _report("json", lambda: json.dumps({'x': 1234.5, 'y': 678.25, 'ack': 101}).encode(), iterations * 10)
+    _report("binary", lambda: encode_move(1234.5, 678.25, 101), iterations * 10)
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
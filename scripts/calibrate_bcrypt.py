@@ -0,0 +1,26 @@
+"""
+Pick a bcrypt cost factor for this host.
+
+    python -m scripts.calibrate_bcrypt [target_ms] [samples]
+
+Times bcrypt at each cost from 10 upward and prints the highest one whose
+median stays within the target (default 250 ms). Run it on the production
+host and set BCRYPT_ROUNDS to the result; existing hashes are upgraded to
+the new cost as users log in.
+"""
+import sys
+
+from util.backend.authentication.password_hashing import BCRYPT_ROUNDS, calibrate_rounds
+
+
+def main(target_ms=250, samples=3):
+    rounds, measured = calibrate_rounds(target_ms / 1000, samples=samples)
+    for cost, seconds in measured.items():
+        marker = "  <- chosen" if cost == rounds else ""
+        print(f"  cost {cost:2d}  {seconds * 1000:8.1f} ms{marker}")
+    print(f"target {target_ms} ms (current BCRYPT_ROUNDS={BCRYPT_ROUNDS})")
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
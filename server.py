@@ -1,10 +1,11 @@
 import eventlet
+eventlet.monkey_patch()  # first, so locks and events created at import time are green
+
 from db.database import get_aggregated_leaderboard, get_user_achievements
 from db.database import get_leaderboard as db_get_leaderboard
-eventlet.monkey_patch()
 
 import os
-from flask import Flask, send_from_directory, abort, g, jsonify
+from flask import Flask, Response, send_from_directory, abort, g, jsonify, request
 from flask_socketio import SocketIO
 # from db.database import users, sessions, login_attempts, stats
 from util.backend.logger import (
@@ -12,8 +13,10 @@ from util.backend.logger import (
     log_raw_http,
     register_error_handlers
 )
-from util.backend.authentication.auth import register, login, logout, token_required
-from util.backend.upload.avatar import upload_avatar
+from util.backend.authentication.auth import register, login, logout, token_required, forget_sessions, login_limiter
+from util.backend.authentication.password_hashing import password_hasher
+from util.backend.upload.avatar import upload_avatar, avatar_processor
+from util.backend.upload.avatar_index import avatar_index, get_avatar_url
 
 app = Flask(__name__)
 
@@ -23,7 +26,11 @@ app.after_request(log_request)
 app.after_request(log_raw_http)
 
 #socketio = SocketIO(app, cors_allowed_origins="*")  # Allow all origins during dev
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+# With several workers, SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379/0) lets
+# socketio.emit reach clients connected to any worker. Game emits target rooms
+# owned by this worker and bypass it (ignore_queue=True in socket_handlers).
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet",
+                    message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
 
 
 
@@ -33,37 +40,40 @@ from util.backend.socket_handlers import init_handlers
 init_handlers(socketio)
 
 from util.backend import socket_server
+from util.backend import cluster
+from util.backend.cluster import choose_worker
+from util.backend.game_room import ROOM_CAPACITY
 
 # Secret Key
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev_secret_key")
 
 
 
-from db.database import users
+from db.database import (ensure_indexes, stats_buffer, leaderboard_sync, get_player_rank, get_profiles,
+                         PROFILE_BATCH_LIMIT, data_generation, session_store, record_login_attempts)
+from util.backend import metrics
+from util.backend.response_cache import ResponseCache
+from util.backend.static_assets import StaticAssets
+socketio.start_background_task(ensure_indexes)
+socketio.start_background_task(leaderboard_sync, socketio.sleep)
+socketio.start_background_task(stats_buffer.run)
+socketio.start_background_task(session_store.run, socketio.sleep, forget_sessions)
+# LOGIN_ATTEMPTS_PERSIST=1 also keeps per-minute attempt counts in loginAttempts
+socketio.start_background_task(login_limiter.run, socketio.sleep,
+                               record_login_attempts if os.environ.get("LOGIN_ATTEMPTS_PERSIST") == "1" else None)
 
-# =================== Authentication Routes ===================
+# Leaderboard responses only change when stats are written; serve them with
+# ETags and rebuild only when db.database's generation counter moves.
+response_cache = ResponseCache(max_age=int(os.environ.get("LEADERBOARD_MAX_AGE", 2)))
 
-def _longest_streak(username: str) -> int:
-    """Return longestStreak for *username* from the leaderboard collection."""
-    for row in db_get_leaderboard():  # [{'user': 'ahmed', 'longestStreak': 410}, ...]
-        if row["user"] == username:
-            return int(row.get("longestStreak", 0))
-    return 0
+# =================== Authentication Routes ===================
 
 def _stats_payload(username: str):
-    """Merge data from ``users`` + longest‑streak board into a single dict."""
-    base = users.find_one(
-        {"username": username},
-        {"_id": 0, "username": 1, "totalTags": 1, "totalTimeIt": 1},
-    )
-    if not base:
+    """Stats part of *username*'s profile: totals plus longest streak."""
+    profile = get_profiles([username]).get(username)
+    if profile is None:
         return None
-
-    base["longestStreak"] = _longest_streak(username)
-    # provide defaults so keys always exist
-    base.setdefault("totalTags", 0)
-    base.setdefault("totalTimeIt", 0.0)
-    return base
+    return {k: profile[k] for k in ("username", "totalTags", "totalTimeIt", "longestStreak")}
 
 @app.get("/api/stats/<username>")
 @token_required
@@ -75,6 +85,21 @@ def stats(username: str):
 
 
 
+@app.get("/api/profiles")
+@token_required
+def profiles():
+    """
+    Stats, longest streak and achievements for several players at once:
+    /api/profiles?users=alice,bob (at most PROFILE_BATCH_LIMIT names).
+    """
+    names = [n for n in request.args.get("users", "").split(",") if n]
+    if not names:
+        return jsonify(error="users is required"), 400
+    if len(names) > PROFILE_BATCH_LIMIT:
+        return jsonify(error=f"at most {PROFILE_BATCH_LIMIT} users per request"), 400
+    return jsonify(get_profiles(names)), 200
+
+
 @app.route('/api/leaderboard')
 def get_leaderboard():
     """
@@ -82,8 +107,16 @@ def get_leaderboard():
     - Includes totalTags, totalTimeIt, tagsPerMinute
     - Sorted by least totalTimeIt
     """
-    board = get_aggregated_leaderboard(limit=50)
-    return jsonify(board), 200
+    return response_cache.response("aggregated", data_generation(),
+                                   lambda: get_aggregated_leaderboard(limit=50))
+
+@app.route('/api/leaderboard/rank/<username>')
+def leaderboard_rank(username: str):
+    """Rank, percentile and neighbours of *username* on the aggregated leaderboard."""
+    payload = get_player_rank(username)
+    if payload is None:
+        return jsonify(error="User not ranked"), 404
+    return jsonify(payload), 200
 
 @app.route('/api/achievements')
 @token_required
@@ -96,6 +129,38 @@ def get_achievements():
     return jsonify(achievements), 200
 
 
+@app.route('/api/matchmake')
+@token_required
+def matchmake():
+    """
+    Tell the client which worker to open its socket on: the one owning the
+    fullest room with space, or the least loaded one. The reverse proxy routes
+    /socket.io/?worker=<id> to that process.
+    """
+    worker = choose_worker(cluster.bus.rooms(), ROOM_CAPACITY)
+    return jsonify({"worker": worker}), 200
+
+
+# Internal counters of the write-behind buffer, session sweeper, login
+# throttle, bcrypt offload and avatar pool, exported on /metrics
+metrics.StatsGauge("tag_stats_buffer", "Stat write-behind buffer (db/stats_buffer.py).",
+                   stats_buffer.metrics)
+metrics.StatsGauge("tag_sessions", "Session cap and sweeper (db/session_store.py).", session_store.metrics)
+metrics.StatsGauge("tag_login_limiter", "Login token buckets (util/backend/rate_limiter.py).",
+                   login_limiter.metrics)
+metrics.StatsGauge("tag_password_hashing", "Off-hub bcrypt (password_hashing.py).", password_hasher.metrics)
+metrics.StatsGauge("tag_avatar_processing", "Avatar process pool (avatar_processing.py).",
+                   avatar_processor.metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Prometheus text format: socket events and fan-out, rooms, db helpers and
+    the counters above. Not authenticated; deploy/nginx.conf keeps it internal.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 #_____________________________________________________________________
 
 
@@ -113,43 +178,76 @@ def logout_route():
 
 # =================== Game Routes ===================
 
+# Everything under public/ is fingerprinted, precompressed and held in memory
+# (see util/backend/static_assets.py); pages reference the hashed names.
+static_assets = StaticAssets('public')
+static_assets.build()
+
+def _send_static(rel_path):
+    """Serve public/<rel_path> from the asset cache, or from disk if it isn't cached."""
+    resp = static_assets.send(rel_path)
+    return resp if resp is not None else send_from_directory('public', rel_path)
+
+
 @app.route('/game')
 def game():
-    return send_from_directory('public/html', 'game.html')
+    return _send_static('html/game.html')
 
 @app.route('/')
 def home():
-    return send_from_directory('public/html', 'home_page.html')
+    return _send_static('html/home_page.html')
 
 @app.route('/achievements')
 def achievements_page():
-    return send_from_directory('public/html', 'achievements.html')
+    return _send_static('html/achievements.html')
 
 @app.route('/upload_avatar_page')
 def upload_avatar_page():
-    return send_from_directory('public/html', 'upload_avatar.html')
+    return _send_static('html/upload_avatar.html')
 
 @app.post('/upload_avatar')
 def avatar_upload_route():
     return upload_avatar()
 
+# Avatars are looked up in the in-memory index (util/backend/upload/avatar_index.py):
+# unknown names never touch the disk, and ?v=<version> URLs are cacheable forever.
+AVATAR_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def _send_avatar(rel_path):
+    version = avatar_index.version_of(rel_path)
+    if version is None:
+        return "Not found", 404
+    versioned = request.args.get('v') == version
+    directory, _, filename = rel_path.rpartition('/')
+    resp = send_from_directory(os.path.join('static/avatars', directory), filename,
+                               max_age=AVATAR_IMMUTABLE_MAX_AGE if versioned else 0)
+    if versioned:
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
+
 @app.route('/static/avatars/<filename>')
 def serve_avatar(filename):
-    return send_from_directory('static/avatars', filename)
+    return _send_avatar(filename)
+
+@app.route('/static/avatars/<int:size>/<filename>')
+def serve_avatar_variant(size, filename):
+    return _send_avatar(f"{size}/{filename}")
 
 @app.route('/api/current-user')
 @token_required
 def current_user():
-    return jsonify({"username": g.username})
+    return jsonify({"username": g.username, "avatar": get_avatar_url(g.username)})
 
 # ---------- Extra pages ----------
 @app.route('/leaderboard_page')
 def global_leaderboard_page():
-    return send_from_directory('public/html', 'leaderboard.html')
+    return _send_static('html/leaderboard.html')
 
 @app.route('/stats_page')
 def stats_page():
-    return send_from_directory('public/html', 'stats.html')
+    return _send_static('html/stats.html')
 
 
 # =================== Static File Routes ===================
@@ -157,34 +255,33 @@ def stats_page():
 # Serve JS, CSS, assets (tilesets, etc.)
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
-    return send_from_directory('public/assets', filename)
+    return _send_static(f'assets/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
-    return send_from_directory('public/js', filename)
+    return _send_static(f'js/{filename}')
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
-    return send_from_directory('public/css', filename)
+    return _send_static(f'css/{filename}')
 
 @app.route('/favicon.ico')
 def favicon():
     # Optional: fix annoying browser favicon request
-    return send_from_directory('public', 'favicon.ico')
+    return _send_static('favicon.ico')
 
 # Generic fallback if no route matches
 @app.route('/<path:path>')
 def fallback(path):
     try:
-        return send_from_directory('public', path)
+        return _send_static(path)
     except:
         return abort(404)
 
 
 @app.route("/leaderboard", methods=["GET"])
 def longest_streak_leaderboard():
-    leaderboard_data = db_get_leaderboard()
-    return jsonify(leaderboard_data)
+    return response_cache.response("streaks", data_generation(), db_get_leaderboard)
 # =================== Server Start ===================
 
 if __name__ == "__main__":
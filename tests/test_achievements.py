@@ -0,0 +1,80 @@
+import unittest
+from db.achievements import AchievementEngine, default_achievements
+
+
+class FakeResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class FakeUsers:
+    """Just enough of a collection for conditional unlocks."""
+
+    def __init__(self, unlocked=()):
+        self.unlocked = set(unlocked)
+        self.updates = 0
+        self.fail = None
+
+    def update_one(self, query, update):
+        self.updates += 1
+        if self.fail:
+            raise self.fail
+        key = next(k for k in query if k.startswith("achievements."))
+        name = key.split(".")[1]
+        if name in self.unlocked:
+            return FakeResult(0)
+        self.unlocked.add(name)
+        return FakeResult(1)
+
+
+class TestAchievementEngine(unittest.TestCase):
+    def setUp(self):
+        self.loads = 0
+        self.users = FakeUsers()
+        achievements = default_achievements()
+        achievements["first_tag"]["unlocked"] = True
+
+        def load_doc(username):
+            self.loads += 1
+            if username != "alice":
+                return None
+            return {"totalTags": 4, "totalTimeIt": 590, "achievements": achievements}
+
+        self.engine = AchievementEngine(self.users, load_doc)
+
+    def test_load_once_then_evaluate_locally(self):
+        self.engine.load("alice")
+        self.assertEqual(self.engine.record("alice", "totalTags", 1), [])
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 5), [])
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 5), ["survivor_10min"])
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 5), [])
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.users.updates, 1)
+        self.assertEqual(self.engine.total("alice", "totalTimeIt"), 605)
+
+    def test_check_includes_unrecorded_time_without_adding_it(self):
+        self.assertEqual(self.engine.check("alice", "totalTimeIt", 3100), ["survivor_10min", "survivor_1hour"])
+        self.assertEqual(self.engine.total("alice", "totalTimeIt"), 590)
+        self.assertEqual(self.loads, 1)  # loaded lazily
+
+    def test_unlocked_elsewhere_is_not_reported(self):
+        self.users.unlocked.add("survivor_10min")
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 20), [])
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 20), [])
+        self.assertEqual(self.users.updates, 1)
+
+    def test_failed_unlock_is_retried(self):
+        self.users.fail = RuntimeError("mongo down")
+        with self.assertRaises(RuntimeError):
+            self.engine.record("alice", "totalTimeIt", 20)
+        self.users.fail = None
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 1), ["survivor_10min"])
+        self.assertEqual(self.engine.record("alice", "totalTimeIt", 1), [])
+
+    def test_unknown_user(self):
+        self.assertEqual(self.engine.record("nobody", "totalTags", 1), [])
+        self.assertIsNone(self.engine.total("nobody", "totalTags"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import time
+import unittest
+from unittest import mock
+
+import jwt as pyjwt
+from flask import Flask
+
+from util.backend.authentication import auth_context
+from util.backend.authentication.auth_context import current_auth, current_username, decode_token, SECRET_KEY
+
+
+def _token(username, exp_in=3600):
+    return pyjwt.encode({"username": username, "exp": int(time.time()) + exp_in}, SECRET_KEY, algorithm="HS256")
+
+
+class TestAuthContext(unittest.TestCase):
+    def setUp(self):
+        auth_context._token_cache.clear()
+        self.app = Flask(__name__)
+
+    def test_decoded_once_per_process(self):
+        token = _token("alice")
+        with mock.patch.object(auth_context.pyjwt, "decode", wraps=pyjwt.decode) as decode:
+            self.assertEqual(decode_token(token)["username"], "alice")
+            self.assertEqual(decode_token(token)["username"], "alice")
+            self.assertEqual(decode.call_count, 1)
+
+    def test_bad_tokens_are_not_cached(self):
+        expired = _token("bob", exp_in=-10)
+        for _ in range(2):
+            with self.assertRaises(pyjwt.ExpiredSignatureError):
+                decode_token(expired)
+        with self.assertRaises(pyjwt.InvalidTokenError):
+            decode_token("not-a-jwt")
+
+    def test_request_context_is_shared_and_lazy(self):
+        token = _token("carol")
+        calls = []
+
+        def validate(t):
+            calls.append(t)
+            return "carol"
+
+        with self.app.test_request_context(headers={"Cookie": f"auth_token={token}"}):
+            ctx = current_auth()
+            self.assertIs(current_auth(), ctx)
+            self.assertEqual(current_username(), "carol")
+            self.assertEqual(ctx.session(validate), "carol")
+            self.assertEqual(ctx.session(validate), "carol")
+            self.assertEqual(calls, [token])
+
+        with self.app.test_request_context():
+            self.assertIsNone(current_username())
+            self.assertIsNone(current_auth().session(validate))
+        self.assertIsNone(current_username())  # outside any request
+
+    def test_session_error_is_reraised(self):
+        def validate(t):
+            raise pyjwt.ExpiredSignatureError("expired")
+
+        with self.app.test_request_context(headers={"Cookie": "auth_token=x"}):
+            for _ in range(2):
+                with self.assertRaises(pyjwt.ExpiredSignatureError):
+                    current_auth().session(validate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from util.backend.upload.avatar_generator import generate_avatar, render_avatar
+
+
+class TestAvatarGenerator(unittest.TestCase):
+    def test_deterministic_per_username(self):
+        self.assertEqual(render_avatar("alice").tobytes(), render_avatar("alice").tobytes())
+        self.assertNotEqual(render_avatar("alice").tobytes(), render_avatar("alicf").tobytes())
+
+    def test_sprite_is_mirrored(self):
+        img = render_avatar("bob", size=128)
+        self.assertEqual(img.size, (128, 128))
+        self.assertEqual(img.tobytes(), img.transpose(Image.FLIP_LEFT_RIGHT).tobytes())
+        self.assertGreater(len(img.getcolors()), 1)
+
+    def test_generate_writes_variants_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            written = generate_avatar(tmp, "carol")
+            self.assertIn("32/carol.webp", written)
+            with Image.open(os.path.join(tmp, "32", "carol.png")) as img:
+                self.assertEqual(img.size, (32, 32))
+
+            path = os.path.join(tmp, "carol.png")
+            os.utime(path, ns=(1_000, 1_000))
+            self.assertEqual(generate_avatar(tmp, "carol"), [])  # cached: left alone
+            self.assertEqual(os.stat(path).st_mtime_ns, 1_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
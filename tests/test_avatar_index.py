@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from util.backend.upload.avatar_index import AvatarIndex
+
+
+class TestAvatarIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = AvatarIndex(self.tmp.name)
+
+    def _write(self, name, mtime_ns=None):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(b"img")
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_scan_prefers_png_and_versions_urls(self):
+        self._write("alice.jpg", 1_000)
+        self._write("alice.png", 2_000)
+        self._write("bob.jpeg", 3_000)
+        self._write("notes.txt")
+        self.assertEqual(self.index.scan(), 2)
+
+        self.assertEqual(self.index.url("alice"), "/static/avatars/alice.png?v=2000")
+        self.assertEqual(self.index.url("bob"), "/static/avatars/bob.jpeg?v=3000")
+        self.assertIsNone(self.index.url("carol"))
+        self.assertEqual(self.index.version_of("alice.png"), "2000")
+        self.assertIsNone(self.index.version_of("alice.jpg"))  # shadowed by the png
+        self.assertIsNone(self.index.version_of("notes.txt"))
+
+    def test_lookups_do_not_touch_the_disk(self):
+        self._write("alice.png", 1_000)
+        self.index.scan()
+        with mock.patch("os.stat") as stat, mock.patch("os.path.exists") as exists:
+            for _ in range(3):
+                self.index.url("alice")
+                self.index.url("nobody")
+            stat.assert_not_called()
+            exists.assert_not_called()
+
+    def test_record_picks_up_new_uploads(self):
+        self.index.scan()
+        self._write("dave.png", 5_000)
+        self.assertIsNone(self.index.url("dave"))
+        self.assertEqual(self.index.record("dave"), "/static/avatars/dave.png?v=5000")
+
+        self._write("dave.png", 6_000)  # re-upload → new URL
+        self.assertEqual(self.index.record("dave"), "/static/avatars/dave.png?v=6000")
+
+        os.remove(os.path.join(self.tmp.name, "dave.png"))
+        self.assertIsNone(self.index.record("dave"))
+        self.assertIsNone(self.index.url("dave"))
+
+    def test_variants_share_the_version_and_fall_back(self):
+        os.makedirs(os.path.join(self.tmp.name, "64"))
+        self._write(os.path.join("64", "erin.webp"))
+        self._write("erin.png", 7_000)
+        self._write("frank.png", 8_000)
+        self.index.scan()
+
+        self.assertEqual(self.index.url("erin", 64, "webp"), "/static/avatars/64/erin.webp?v=7000")
+        self.assertEqual(self.index.version_of("64/erin.webp"), "7000")
+        self.assertEqual(self.index.url("frank", 64, "webp"), "/static/avatars/frank.png?v=8000")
+        self.assertIsNone(self.index.version_of("64/frank.webp"))
+
+        self._write(os.path.join("64", "frank.webp"))
+        self.index.record("frank")
+        self.assertEqual(self.index.url("frank", 64, "webp"), "/static/avatars/64/frank.webp?v=8000")
+
+    def test_missing_directory_is_empty(self):
+        self.assertEqual(AvatarIndex(os.path.join(self.tmp.name, "nope")).scan(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
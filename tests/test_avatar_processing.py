@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from PIL import Image
+
+from util.backend.upload.avatar_processing import (
+    VARIANT_FORMATS,
+    VARIANT_SIZES,
+    AvatarBusy,
+    AvatarProcessor,
+    process_avatar,
+)
+
+
+def _image_bytes(size, fmt="JPEG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def _main_file():
+    return getattr(sys.modules["__main__"], "__file__", None)
+
+
+class TestAvatarProcessing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_writes_square_variants_and_full_size_png(self):
+        written = process_avatar(_image_bytes((1600, 900)), self.tmp.name, "alice")
+        self.assertEqual(len(written), len(VARIANT_SIZES) * len(VARIANT_FORMATS))
+        for size in VARIANT_SIZES:
+            for fmt in VARIANT_FORMATS:
+                with Image.open(os.path.join(self.tmp.name, str(size), f"alice.{fmt}")) as img:
+                    self.assertEqual(img.size, (size, size))
+                    self.assertEqual(img.format, fmt.upper())
+        with Image.open(os.path.join(self.tmp.name, "alice.png")) as img:
+            self.assertEqual(img.size, (VARIANT_SIZES[0], VARIANT_SIZES[0]))
+        self.assertFalse([n for n in os.listdir(self.tmp.name) if n.endswith(".tmp")])
+
+    def test_small_png_is_upscaled(self):
+        process_avatar(_image_bytes((20, 40), "PNG"), self.tmp.name, "bob")
+        with Image.open(os.path.join(self.tmp.name, "bob.png")) as img:
+            self.assertEqual(img.size, (128, 128))
+
+    def test_garbage_is_a_value_error(self):
+        with self.assertRaises(ValueError):
+            process_avatar(b"not an image", self.tmp.name, "carol")
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_pool_round_trip_and_backpressure(self):
+        spool = os.path.join(self.tmp.name, "spool")
+        os.makedirs(spool)
+        processor = AvatarProcessor(workers=1, max_pending=1, spool_dir=spool)
+        self.addCleanup(processor.shutdown)
+        written = processor.process(io.BytesIO(_image_bytes((300, 300))), self.tmp.name, "dave")
+        self.assertIn("64/dave.webp", written)
+        with self.assertRaises(ValueError):
+            processor.process(io.BytesIO(b"nope"), self.tmp.name, "erin")
+
+        processor.max_pending = 0
+        with self.assertRaises(AvatarBusy):
+            processor.process(io.BytesIO(), self.tmp.name, "frank")
+        with self.assertRaises(AvatarBusy):
+            processor.submit(os.getpid)
+        self.assertEqual(processor.metrics()["processed"], 1)
+        self.assertEqual(processor.metrics()["rejected"], 2)
+        self.assertEqual(processor.metrics()["failed"], 1)
+        self.assertEqual(processor.pending(), 0)
+        self.assertEqual(os.listdir(spool), [])
+
+    def test_timed_out_job_keeps_its_spool_file_until_it_ends(self):
+        spool = os.path.join(self.tmp.name, "spool")
+        os.makedirs(spool)
+        processor = AvatarProcessor(workers=1, timeout=0.001, spool_dir=spool)
+        processor.submit(os.getpid).result(timeout=30)  # worker up, so the job starts at once
+        futures = []
+        submit = processor._submit
+        processor._submit = lambda *args: futures.append(submit(*args)) or futures[-1]
+        with self.assertRaises(FutureTimeout):
+            processor.process(io.BytesIO(_image_bytes((2000, 2000), "PNG")), self.tmp.name, "gina")
+        processor.shutdown()  # waits for the running job
+        self.assertEqual(os.listdir(spool), [])
+        self.assertEqual(processor.pending(), 0)
+        if not futures[0].cancelled():  # it had started: its input must have outlived the timeout
+            self.assertIn("64/gina.webp", futures[0].result())
+
+    def test_workers_do_not_import_the_parents_main(self):
+        processor = AvatarProcessor(workers=1)
+        self.addCleanup(processor.shutdown)
+        main_file = processor.submit(_main_file).result(timeout=30)
+        self.assertEqual(os.path.basename(main_file), "avatar_processing.py")
+        self.assertNotEqual(os.path.basename(_main_file() or ""), "avatar_processing.py")  # restored
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from util.backend.cluster import choose_worker
+from util.backend.message_bus import LocalBus, create_bus
+
+
+class TestLocalBus(unittest.TestCase):
+    def test_pubsub_and_room_directory(self):
+        bus = create_bus("memory://")
+        self.assertIsInstance(bus, LocalBus)
+
+        seen = []
+        bus.subscribe("chan", seen.append)
+        bus.publish("chan", {"sid": "abc"})
+        self.assertEqual(seen, [{"sid": "abc"}])
+
+        bus.set_room(1, "w1-room-1", 3)
+        bus.set_room(2, "w2-room-1", 5)
+        bus.drop_room(2, "w2-room-1")
+        self.assertEqual(bus.rooms(), {"w1-room-1": {"worker": 1, "players": 3}})
+
+    def test_unknown_scheme_rejected(self):
+        with self.assertRaises(ValueError):
+            create_bus("kafka://somewhere")
+
+
+class TestChooseWorker(unittest.TestCase):
+    def test_prefers_fullest_open_room(self):
+        rooms = {"a": {"worker": 0, "players": 4},
+                 "b": {"worker": 1, "players": 7},
+                 "c": {"worker": 2, "players": 8}}   # full
+        self.assertEqual(choose_worker(rooms, capacity=8, worker_count=3), 1)
+
+    def test_least_loaded_worker_when_all_full(self):
+        rooms = {"a": {"worker": 0, "players": 2}, "b": {"worker": 1, "players": 2},
+                 "c": {"worker": 1, "players": 2}}
+        self.assertEqual(choose_worker(rooms, capacity=2, worker_count=3), 2)
+        self.assertEqual(choose_worker({}, capacity=2, worker_count=3), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
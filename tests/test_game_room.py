@@ -0,0 +1,66 @@
+import unittest
+from util.backend.game_room import GameRoom, Matchmaker, MAP_WIDTH, parse_position
+from util.backend.wire_format import encode_snapshot
+
+
+class TestGameRoom(unittest.TestCase):
+    def test_first_player_is_it_and_state_is_isolated(self):
+        a, b = GameRoom("a", seed=1), GameRoom("b", seed=2)
+        self.assertTrue(a.add_player("s1", "ann", None, 10, 10)["it"])
+        self.assertFalse(a.add_player("s2", "bob", None, 20, 20)["it"])
+        self.assertTrue(b.add_player("s3", "cat", None, 10, 10)["it"])
+        self.assertEqual(set(a.players), {"s1", "s2"})
+        self.assertEqual(set(b.players), {"s3"})
+
+        a.remove_player("s1")
+        self.assertEqual(a.it_sids(), [])
+        self.assertNotIn("s1", a.positions.where)
+
+    def test_malformed_moves_never_reach_the_room(self):
+        room = GameRoom("a", seed=1)
+        room.add_player("s1", "ann", None, 10, 10)
+        for x, y in (("1e9", 5), (None, 5), ("abc", 5), (float("nan"), 5), (5, float("inf"))):
+            position = parse_position(x, y)
+            if position:
+                room.record_move("s1", *position)
+        with self.assertRaises(TypeError):
+            room.record_move("s1", "12", 12)     # unparsed input is rejected before it is stored
+
+        self.assertEqual((room.players["s1"]["x"], room.players["s1"]["y"]), (MAP_WIDTH, 5.0))
+        for payload in room.build_world_snapshots(1.0).values():
+            encode_snapshot(payload, room.slots)  # the room still ticks
+
+
+class TestMatchmaker(unittest.TestCase):
+    def _join(self, mm, sid):
+        room = mm.place(sid)
+        room.add_player(sid, sid, None, 0, 0)
+        return room
+
+    def test_rooms_fill_up_to_capacity(self):
+        mm = Matchmaker(capacity=2)
+        r1 = self._join(mm, "a")
+        self.assertIs(self._join(mm, "b"), r1)
+        r2 = self._join(mm, "c")
+        self.assertIsNot(r2, r1)
+        self.assertEqual(len(mm.rooms), 2)
+
+    def test_fullest_open_room_is_preferred_and_empty_rooms_close(self):
+        mm = Matchmaker(capacity=3)
+        r1 = self._join(mm, "a")
+        self._join(mm, "b")
+        self._join(mm, "c")
+        r2 = self._join(mm, "d")
+        r1.remove_player("a")
+        mm.leave("a")
+        # r1 has 2 players, r2 has 1: the next player goes to r1
+        self.assertIs(self._join(mm, "e"), r1)
+
+        r2.remove_player("d")
+        mm.leave("d")
+        self.assertNotIn(r2.id, mm.rooms)
+        self.assertIsNone(mm.room_for("d"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from db.indexes import apply_indexes
+
+
+class FakeCollection:
+    def __init__(self, existing=None, fail=()):
+        self.indexes = {"_id_": {"key": [("_id", 1)]}, **(existing or {})}
+        self.fail = set(fail)
+        self.dropped = []
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def drop_index(self, name):
+        self.dropped.append(name)
+        del self.indexes[name]
+
+    def create_indexes(self, models):
+        for model in models:
+            doc = model.document
+            if doc["name"] in self.fail:
+                raise OperationFailure("E11000 duplicate key")
+            self.indexes[doc["name"]] = {"key": list(doc["key"].items())}
+
+
+class TestApplyIndexes(unittest.TestCase):
+    def test_replaces_old_index_on_same_keys_and_reports_failures(self):
+        sessions = FakeCollection(existing={"token_digest_1": {"key": [("token_digest", 1)]}})
+        users = FakeCollection(fail={"username_unique"})
+        db = {"sessions": sessions, "users": users}
+        spec = {
+            "sessions": [IndexModel([("token_digest", ASCENDING)], name="token_digest_unique", unique=True)],
+            "users": [IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+                      IndexModel([("totalTimeIt", ASCENDING)], name="totalTimeIt")],
+        }
+
+        report = apply_indexes(db, spec)
+        self.assertEqual(sessions.dropped, ["token_digest_1"])
+        self.assertIn("token_digest_unique", sessions.indexes)
+        self.assertEqual(report["sessions"], {"token_digest_unique": "ok"})
+        self.assertIn("duplicate", report["users"]["username_unique"])
+        self.assertEqual(report["users"]["totalTimeIt"], "ok")
+
+        # Second run is a no-op
+        report = apply_indexes(db, spec)
+        self.assertEqual(sessions.dropped, ["token_digest_1"])
+        self.assertEqual(report["sessions"], {"token_digest_unique": "ok"})
+
+
+if __name__ == '__main__':
+    unittest.main()
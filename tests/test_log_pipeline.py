@@ -0,0 +1,88 @@
+import gzip
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from util.backend.log_pipeline import (
+    BatchingQueueListener,
+    BufferedRotatingFileHandler,
+    DeferredQueueHandler,
+    make_queue,
+)
+
+
+class LazyMessage:
+    def __init__(self, text):
+        self.text = text
+        self.formatted_on = None
+
+    def __str__(self):
+        self.formatted_on = threading.get_ident()
+        return self.text
+
+
+class TestLogPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "app.log")
+
+    def _logger(self, handler, queue):
+        logger = logging.getLogger(f"test-pipeline-{id(self)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(DeferredQueueHandler(queue))
+        self.addCleanup(logger.handlers.clear)
+        return logger
+
+    def test_records_are_formatted_and_written_on_the_writer_thread(self):
+        handler = BufferedRotatingFileHandler(self.path, max_bytes=0, backup_count=0)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        queue = make_queue()
+        listener = BatchingQueueListener(queue, handler)
+        listener.start()
+        logger = self._logger(handler, queue)
+
+        message = LazyMessage("hello")
+        logger.info(message)
+        for i in range(500):
+            logger.info("line %d", i)
+        listener.stop()
+        handler.close()
+
+        self.assertIsNotNone(message.formatted_on)
+        self.assertNotEqual(message.formatted_on, threading.get_ident())
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "hello")
+        self.assertEqual(lines[-1], "line 499")
+        self.assertEqual(len(lines), 501)
+
+    def test_rotation_compresses_backups(self):
+        handler = BufferedRotatingFileHandler(self.path, max_bytes=200, backup_count=2)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        for i in range(30):
+            handler.emit(logging.makeLogRecord({"msg": f"entry {i:02d} " + "x" * 20}))
+        handler.close()  # waits for the last compression
+
+        with gzip.open(self.path + ".1.gz", "rt") as f:
+            newest = f.read()
+        with gzip.open(self.path + ".2.gz", "rt") as f:
+            older = f.read()
+        self.assertLess(older.split()[1], newest.split()[1])
+        self.assertFalse(os.path.exists(self.path + ".1.gz.tmp"))
+        self.assertLessEqual(os.path.getsize(self.path), 200)
+        self.assertFalse(os.path.exists(self.path + ".3.gz"))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        queue = make_queue(maxsize=1)
+        handler = DeferredQueueHandler(queue)
+        for _ in range(3):
+            handler.emit(logging.makeLogRecord({"msg": "x"}))
+        self.assertEqual(handler.dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
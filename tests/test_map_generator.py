@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from util.backend import map_generator
+from util.backend.map_generator import generate_blocked_tiles, load_map
+
+
+class TestMapGrid(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(map_generator, "MAP_CACHE_DIR", self._tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+        load_map.cache_clear()
+
+    def test_grid_matches_tuple_view(self):
+        grid = load_map(7)
+        blocked, free = generate_blocked_tiles(7)
+        for x in range(grid.width):
+            for y in range(grid.height):
+                self.assertEqual(grid.is_blocked(x, y), (x, y) in blocked)
+        self.assertTrue(grid.is_blocked(-1, 5))
+        self.assertTrue(all(grid.region_of(x, y) > 0 for x, y in free))
+
+    def test_disk_cache_round_trip(self):
+        first = load_map(99, 30, 20)
+        self.assertTrue(os.path.exists(os.path.join(self._tmp.name, "99_30x20.bin")))
+
+        load_map.cache_clear()
+        with mock.patch.object(map_generator, "_generate") as gen:
+            second = load_map(99, 30, 20)
+            gen.assert_not_called()
+        self.assertEqual(first.blocked, second.blocked)
+        self.assertEqual(first.regions, second.regions)
+        self.assertEqual(first.free, second.free)
+
+
+if __name__ == '__main__':
+    unittest.main()
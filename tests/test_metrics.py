@@ -0,0 +1,94 @@
+import unittest
+from types import SimpleNamespace
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+from util.backend import metrics
+
+
+def _encoded(event, data):
+    """The Engine.IO packets python-socketio's manager sends for one emit."""
+    encoded = sio_packet.Packet(sio_packet.EVENT, namespace="/", data=[event, data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+
+class TestMetrics(unittest.TestCase):
+    def test_broadcasts_are_grouped_per_emit(self):
+        sent = []
+        server = SimpleNamespace(_send_eio_packet=lambda sid, pkt: sent.append((sid, pkt)))
+        metrics.instrument_socketio(SimpleNamespace(server=server))
+
+        frame = _encoded("testFrame", b"\x01\x02\x03")      # text header + binary attachment
+        update = _encoded("testUpdate", {"newIt": "a"})
+        for sid in ("s1", "s2", "s3"):
+            for pkt in frame:
+                server._send_eio_packet(sid, pkt)
+        for pkt in update:
+            server._send_eio_packet("s1", pkt)
+        text = metrics.render()
+
+        self.assertEqual(len(sent), 7)
+        self.assertEqual(metrics.outbound_messages.values[("testFrame",)], 6)
+        self.assertEqual(metrics.outbound_bytes.values[("testFrame",)],
+                         3 * (len(frame[0].data) + 3))
+        _, recipients, broadcasts = metrics.broadcast_recipients.series[("testFrame",)]
+        self.assertEqual((broadcasts, recipients), (1, 3))    # one emit to three clients
+        self.assertEqual(metrics.broadcast_recipients.series[("testUpdate",)][2], 1)
+        self.assertIn('tag_socketio_broadcast_recipients_bucket{event="testFrame",le="4"} 1', text)
+        self.assertIn('tag_socketio_outbound_messages_total{event="testUpdate"} 1', text)
+
+    def test_missing_send_hook_leaves_the_server_alone(self):
+        server = SimpleNamespace()
+        self.assertFalse(metrics.instrument_socketio(SimpleNamespace(server=server)))
+        self.assertEqual(vars(server), {})
+
+    def test_event_handlers_are_timed_and_extra_args_dropped(self):
+        @metrics.instrument_event("testConnect")
+        def connect():
+            return "ok"
+
+        @metrics.instrument_event("testFail")
+        def fail(data):
+            raise ValueError(data)
+
+        self.assertEqual(connect({"auth": None}), "ok")       # auth argument it doesn't take
+        with self.assertRaises(ValueError):
+            fail("boom")
+        self.assertEqual(metrics.event_seconds.series[("testConnect",)][2], 1)
+        self.assertEqual(metrics.event_errors.values[("testFail",)], 1)
+
+    def test_render_histogram_and_gauge(self):
+        hist = metrics.Histogram("test_latency_seconds", "Test.", ("function",), buckets=(0.1, 1.0))
+        hist.observe(("f",), 0.05)
+        hist.observe(("f",), 0.5)
+        hist.observe(("f",), 5)
+        metrics.Gauge("test_players", "Test.", ("room",), lambda: {('r"1',): 2})
+        text = metrics.render()
+
+        self.assertIn('test_latency_seconds_bucket{function="f",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{function="f",le="1.0"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{function="f",le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count{function="f"} 3', text)
+        self.assertIn('test_players{room="r\\"1"} 2', text)
+        self.assertIn("# TYPE test_players gauge", text)
+
+    def test_stats_gauge_flattens_component_metrics(self):
+        metrics.StatsGauge("test_component", "Test.", lambda: {
+            "queueDepth": 3, "swept": {"sessions": 4}, "busy": True,
+            "last_sweep": {"at": "2026-01-01T00:00:00", "ms": 1.5}, "nothing": None})
+        text = metrics.render()
+
+        self.assertIn("test_component_queue_depth 3", text)
+        self.assertIn("test_component_swept_sessions 4", text)
+        self.assertIn("test_component_busy 1", text)
+        self.assertIn("test_component_last_sweep_ms 1.5", text)
+        self.assertIn("# TYPE test_component_queue_depth gauge", text)
+        self.assertNotIn("test_component_last_sweep_at", text)
+        self.assertNotIn("test_component_nothing", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import unittest
+
+from util.backend.authentication.password_hashing import (
+    HashingBusy,
+    PasswordHasher,
+    calibrate_rounds,
+    hash_rounds,
+)
+
+
+class TestPasswordHashing(unittest.TestCase):
+    def test_hash_verify_and_rehash(self):
+        hasher = PasswordHasher(rounds=4)
+        hashed = hasher.hash("hunter2")
+        self.assertEqual(hash_rounds(hashed), 4)
+        self.assertTrue(hasher.verify("hunter2", hashed))
+        self.assertFalse(hasher.verify("hunter3", hashed))
+        self.assertFalse(hasher.needs_rehash(hashed))
+
+        stronger = PasswordHasher(rounds=5)
+        self.assertTrue(stronger.needs_rehash(hashed))
+        self.assertTrue(stronger.verify("hunter2", hashed))  # old hashes still verify
+        self.assertEqual(hasher.metrics()["completed"], 3)
+
+    def test_rejects_beyond_queue_limit(self):
+        hasher = PasswordHasher(rounds=4, threads=1, max_queue=0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return True
+
+        worker = threading.Thread(target=hasher._run, args=(slow,))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(HashingBusy):
+            hasher.hash("x")
+        release.set()
+        worker.join()
+        self.assertEqual(hasher.metrics()["rejected"], 1)
+        self.assertEqual(hasher.in_flight, 0)
+        hasher.hash("x")  # room again
+
+    def test_calibration_stops_at_target(self):
+        timer = lambda rounds: 0.001 * 2 ** (rounds - 4)   # doubling per round
+        rounds, measured = calibrate_rounds(0.25, min_rounds=4, max_rounds=16, samples=1, timer=timer)
+        self.assertEqual(rounds, 11)                        # 128 ms; 12 would be 256 ms
+        self.assertEqual(max(measured), 12)
+        rounds, _ = calibrate_rounds(0.0001, min_rounds=10, samples=1, timer=timer)
+        self.assertEqual(rounds, 10)                        # never below the floor
+
+
+if __name__ == '__main__':
+    unittest.main()
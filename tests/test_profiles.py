@@ -0,0 +1,159 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from db import database
+from db.stats_buffer import StatsBuffer
+
+
+class FakeCursorCollection:
+    def __init__(self, docs, key):
+        self.docs = docs
+        self.key = key
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        wanted = set(query[self.key]["$in"])
+        return [dict(d) for d in self.docs if d[self.key] in wanted]
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        self.users = FakeCursorCollection([
+            {"username": "alice", "totalTags": 3, "totalTimeIt": 10.0, "achievements": {"first_tag": {"unlocked": True}}},
+            {"username": "bob", "totalTags": 0, "totalTimeIt": 0.0, "achievements": {}},
+        ], "username")
+        self.board = FakeCursorCollection([{"user": "alice", "longestStreak": 42}], "user")
+        buffer = StatsBuffer(self.users, self.board)
+        patches = [
+            mock.patch.object(database, "users", self.users),
+            mock.patch.object(database, "leaderboard", self.board),
+            mock.patch.object(database, "stats_buffer", buffer),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        database.profile_cache.clear()
+        self.addCleanup(database.profile_cache.clear)
+
+    def test_batched_read_and_cache(self):
+        profiles = database.get_profiles(["alice", "bob", "nobody", "alice"])
+        self.assertEqual(set(profiles), {"alice", "bob"})
+        self.assertEqual(profiles["alice"]["longestStreak"], 42)
+        self.assertEqual(profiles["bob"]["longestStreak"], 0)
+        self.assertEqual((self.users.queries, self.board.queries), (1, 1))
+
+        database.get_profiles(["alice", "bob"])
+        self.assertEqual((self.users.queries, self.board.queries), (1, 1))
+
+    def test_writer_invalidates_and_buffered_stats_are_included(self):
+        database.get_profiles(["alice"])
+        database.stats_buffer.inc("alice", "totalTags", 2)
+        database.invalidate_profile("alice")
+        self.assertEqual(database.get_profiles(["alice"])["alice"]["totalTags"], 5)
+        self.assertEqual(self.users.queries, 2)
+
+    def test_profile_written_during_read_is_not_cached(self):
+        find = self.users.find
+
+        def racing_find(query, projection=None):
+            docs = find(query, projection)
+            database.invalidate_profile("alice")  # a stat write lands mid-read
+            return docs
+
+        with mock.patch.object(self.users, "find", racing_find):
+            database.get_profiles(["alice"])
+        self.assertIsNone(database.profile_cache.get("alice"))
+        self.assertEqual(database._profile_reads, {})
+
+        database.invalidate_profile("bob")  # no read in flight: nothing to track
+        self.assertEqual(database._profile_reads, {})
+
+    def test_profile_read_before_an_unlock_persists_is_dropped(self):
+        def record(username, stat, amount):
+            database.get_profiles([username])  # a read lands before the unlock is written
+            self.users.docs[0]["achievements"] = {"tag_10": {"unlocked": True}}
+            return ["tag_10"]
+
+        engine = mock.Mock(record=record)
+        with mock.patch.object(database, "achievement_engine", engine), \
+                mock.patch.object(database, "time_board"):
+            self.assertEqual(database.increment_user_tags("alice"), ["tag_10"])
+        self.assertIn("tag_10", database.get_profiles(["alice"])["alice"]["achievements"])
+
+
+class FakeStampedCollection:
+    """find() with {}, {field: {"$exists": True}} or {field: {"$gte": t}}."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.returned = 0
+
+    def find(self, query, projection=None):
+        found = []
+        for doc in self.docs:
+            for field, cond in query.items():
+                if field not in doc or ("$gte" in cond and doc[field] < cond["$gte"]):
+                    break
+            else:
+                found.append(dict(doc))
+        self.returned += len(found)
+        return found
+
+
+class TestLeaderboardSync(unittest.TestCase):
+    def setUp(self):
+        self.t0 = datetime(2026, 1, 1)
+        self.users = FakeStampedCollection([
+            {"username": "alice", "totalTags": 3, "totalTimeIt": 10.0},
+            {"username": "bob", "totalTags": 1, "totalTimeIt": 5.0, "statsUpdatedAt": self.t0},
+        ])
+        self.board = FakeStampedCollection([{"user": "alice", "longestStreak": 4}])
+        buffer = StatsBuffer(self.users, self.board)
+        patches = [
+            mock.patch.object(database, "users", self.users),
+            mock.patch.object(database, "leaderboard", self.board),
+            mock.patch.object(database, "stats_buffer", buffer),
+            mock.patch.object(database, "time_board", database.RankedIndex("totalTimeIt")),
+            mock.patch.object(database, "streak_board", database.RankedIndex("longestStreak", descending=True)),
+            mock.patch.object(database, "_boards_ready", False),
+            mock.patch.object(database, "_synced_at", None),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_seed_then_only_changed_rows(self):
+        database.stats_buffer.leaderboard_max("carol", 2)   # buffered, no document yet
+        self.assertTrue(database.seed_leaderboards())
+        self.assertEqual(database.streak_board.get("carol"), {"longestStreak": 2})
+        self.assertEqual(database.time_board.get("alice")["totalTags"], 3)
+
+        # Another worker's flush: bob and a new user; alice changes without a stamp
+        later = self.t0 + timedelta(minutes=5)
+        self.users.docs[1].update(totalTags=7, statsUpdatedAt=later)
+        self.users.docs.append({"username": "dave", "totalTags": 2, "totalTimeIt": 1.0,
+                                "statsUpdatedAt": later})
+        self.users.docs[0]["totalTags"] = 99
+        self.board.docs.append({"user": "dave", "longestStreak": 6, "statsUpdatedAt": later})
+        database.stats_buffer.inc("dave", "totalTags", 1)    # this worker's unflushed write
+
+        self.users.returned = 0
+        self.assertTrue(database.sync_leaderboards())
+        self.assertEqual(self.users.returned, 2)
+        self.assertEqual(database.time_board.get("bob")["totalTags"], 7)
+        self.assertEqual(database.time_board.get("dave")["totalTags"], 3)
+        self.assertEqual(database.time_board.get("alice")["totalTags"], 3)
+        self.assertEqual(database.streak_board.get("dave"), {"longestStreak": 6})
+        self.assertEqual(database._synced_at, later)
+
+        # Nothing new: only the overlap window is re-read
+        self.users.docs[1]["statsUpdatedAt"] = self.t0
+        self.users.returned = 0
+        database.sync_leaderboards()
+        self.assertEqual(self.users.returned, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import random
+import unittest
+from util.backend.ranked_index import RankedIndex
+
+
+class TestRankedIndex(unittest.TestCase):
+    def test_matches_sorted_list_under_random_updates(self):
+        rng = random.Random(7)
+        index = RankedIndex("score", seed=1)
+        scores = {}
+        for _ in range(2000):
+            member = f"p{rng.randrange(200)}"
+            op = rng.random()
+            if op < 0.1:
+                index.remove(member)
+                scores.pop(member, None)
+            elif op < 0.6:
+                amount = rng.randrange(1, 50)
+                index.inc(member, "score", amount)
+                scores[member] = scores.get(member, 0) + amount
+            else:
+                value = rng.randrange(500)
+                index.set(member, {"score": value})
+                scores[member] = value
+
+        expected = sorted(scores, key=lambda m: (scores[m], m))
+        self.assertEqual(len(index), len(expected))
+        self.assertEqual([m for _, m, _ in index.top(len(expected))], expected)
+        for rank, member in enumerate(expected):
+            self.assertEqual(index.rank(member), rank)
+
+    def test_descending_top_around_and_percentile(self):
+        index = RankedIndex("longestStreak", descending=True)
+        for name, streak in [("a", 5), ("b", 50), ("c", 20), ("d", 20), ("e", 1)]:
+            index.max(name, "longestStreak", streak)
+        index.max("e", "longestStreak", 0)  # lower value is ignored
+
+        self.assertEqual([m for _, m, _ in index.top(3)], ["b", "c", "d"])
+        self.assertEqual(index.rank("d"), 2)
+        self.assertEqual([(r, m) for r, m, _ in index.around("d", 1)], [(1, "c"), (2, "d"), (3, "a")])
+        self.assertEqual([m for _, m, _ in index.around("b", 1)], ["b", "c"])
+        self.assertEqual(index.percentile("b"), 100.0)
+        self.assertEqual(index.percentile("e"), 0.0)
+        self.assertEqual(index.get("e"), {"longestStreak": 1})
+        self.assertIsNone(index.rank("zz"))
+
+    def test_replace_all(self):
+        index = RankedIndex("score")
+        index.set("old", {"score": 1})
+        index.replace_all({"x": {"score": 3}, "y": {"score": 2}})
+        self.assertNotIn("old", index)
+        self.assertEqual([m for _, m, _ in index.top(5)], ["y", "x"])
+
+
+if __name__ == '__main__':
+    unittest.main()
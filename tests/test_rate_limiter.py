@@ -0,0 +1,89 @@
+import unittest
+
+from util.backend.rate_limiter import LoginRateLimiter, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = TokenBucketLimiter(rate=1.0, burst=3, max_keys=2, clock=self.clock)
+
+    def test_burst_then_refill(self):
+        self.assertEqual([self.limiter.allow("a") for _ in range(4)], [True, True, True, False])
+        self.assertAlmostEqual(self.limiter.retry_after("a"), 1.0)
+        self.clock.now += 0.5
+        self.assertFalse(self.limiter.allow("a"))
+        self.clock.now += 0.5
+        self.assertTrue(self.limiter.allow("a"))
+        self.assertTrue(self.limiter.allow("b"))  # keys are independent
+
+    def test_idle_and_excess_buckets_are_evicted(self):
+        self.limiter.allow("a")
+        self.clock.now += 1
+        self.limiter.allow("b")
+        self.clock.now += 2                       # "a" is full again, "b" isn't
+        self.assertEqual(self.limiter.evict_idle(), 1)
+        self.assertEqual(len(self.limiter), 1)
+
+        self.limiter.allow("c")
+        self.limiter.allow("d")                   # over max_keys: oldest ("b") goes
+        self.assertEqual(len(self.limiter), 2)
+        self.assertEqual(self.limiter.retry_after("b"), 0.0)
+
+
+class TestLoginRateLimiter(unittest.TestCase):
+    def test_ip_and_username_limits_and_counts(self):
+        clock = FakeClock()
+        limiter = LoginRateLimiter(ip_rate=1 / 60, ip_burst=3, user_rate=1 / 60, user_burst=2, clock=clock)
+
+        self.assertEqual(limiter.check("1.1.1.1", "alice"), 0)
+        limiter.record_failure("1.1.1.1", "alice")
+        self.assertEqual(limiter.check("2.2.2.2", "alice"), 0)
+        self.assertGreater(limiter.check("3.3.3.3", "alice"), 0)   # alice's bucket is empty
+        self.assertEqual(limiter.check("1.1.1.1", "bob"), 0)
+        self.assertEqual(limiter.check("1.1.1.1", "carol"), 0)
+        wait = limiter.check("1.1.1.1", "dave")                     # 1.1.1.1 used its burst
+        self.assertAlmostEqual(wait, 60, delta=0.01)
+
+        counts = limiter.drain_counts()
+        self.assertEqual(counts["user:alice"], {"attempts": 3, "rejected": 1, "failed": 1})
+        self.assertEqual(counts["ip:1.1.1.1"], {"attempts": 4, "rejected": 1, "failed": 1})
+        self.assertEqual(limiter.drain_counts(), {})
+        self.assertEqual(limiter.metrics()["rejected"], 2)
+
+    def test_successful_logins_are_refunded(self):
+        limiter = LoginRateLimiter(ip_rate=1 / 60, ip_burst=2, user_rate=1 / 60, user_burst=2, clock=FakeClock())
+        for _ in range(5):
+            self.assertEqual(limiter.check("1.1.1.1", "alice"), 0)
+            limiter.record_success("1.1.1.1", "alice")
+        self.assertEqual(limiter.check("1.1.1.1", "alice"), 0)
+        limiter.record_failure("1.1.1.1", "alice")
+        self.assertEqual(limiter.check("1.1.1.1", "alice"), 0)
+        self.assertGreater(limiter.check("1.1.1.1", "alice"), 0)
+
+    def test_rejection_takes_no_token_and_counts_are_capped(self):
+        limiter = LoginRateLimiter(ip_rate=1 / 60, ip_burst=2, user_rate=1 / 60, user_burst=1,
+                                   max_counted=4, clock=FakeClock())
+        self.assertEqual(limiter.check("1.1.1.1", "alice"), 0)
+        for _ in range(3):
+            self.assertGreater(limiter.check("1.1.1.1", "alice"), 0)  # alice is throttled...
+        self.assertEqual(limiter.check("1.1.1.1", "bob"), 0)          # ...without draining the IP
+
+        for name in ("carol", "dave", "erin"):
+            limiter.check("2.2.2.2", name)
+        counts = limiter.drain_counts()
+        self.assertEqual(set(counts), {"ip:1.1.1.1", "user:alice", "user:bob", "ip:2.2.2.2",
+                                       "user:*"})
+        self.assertEqual(counts["user:*"]["attempts"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
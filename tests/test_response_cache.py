@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from util.backend.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.generation = 0
+        self.builds = 0
+        self.cache = ResponseCache(max_age=5)
+        app = Flask(__name__)
+
+        def build():
+            self.builds += 1
+            return [{"user": "alice", "longestStreak": self.generation}]
+
+        @app.route("/board")
+        def board():
+            return self.cache.response("board", self.generation, build)
+
+        self.client = app.test_client()
+
+    def test_etag_and_304(self):
+        first = self.client.get("/board")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["Cache-Control"], "public, max-age=5")
+        etag = first.headers["ETag"]
+
+        second = self.client.get("/board", headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.builds, 1)
+
+        self.generation += 1
+        third = self.client.get("/board", headers={"If-None-Match": etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers["ETag"], etag)
+        self.assertEqual(self.builds, 2)
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def slow_build():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"ok": True}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get("k", 1, slow_build)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(results)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
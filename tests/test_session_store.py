@@ -0,0 +1,143 @@
+import itertools
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from db.session_store import SessionStore
+
+_ids = itertools.count()
+
+
+def _matches(doc, query):
+    for field, cond in query.items():
+        value = doc.get(field)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            if op == "$exists" and (field in doc) != arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$lt" and not (value is not None and value < arg):
+                return False
+            if op == "$gt" and not (value is not None and value > arg):
+                return False
+    return True
+
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+    def skip(self, n):
+        return FakeCursor(self[n:])
+
+
+class FakeCollection:
+    """Just the operators SessionStore uses."""
+
+    def __init__(self):
+        self.docs = []
+
+    def insert_one(self, doc):
+        self.docs.append({"_id": next(_ids), **doc})
+
+    def find(self, query, projection=None):
+        return FakeCursor(d for d in self.docs if _matches(d, query))
+
+    def find_one(self, query, projection=None):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def update_one(self, query, update):
+        for doc in self.find(query):
+            doc.update(update.get("$set", {}))
+            for field in update.get("$unset", {}):
+                doc.pop(field, None)
+            return
+
+    def delete_one(self, query):
+        found = self.find(query)
+        if found:
+            self.docs.remove(found[0])
+
+    def delete_many(self, query):
+        found = self.find(query)
+        self.docs = [d for d in self.docs if d not in found]
+        return SimpleNamespace(deleted_count=len(found))
+
+    def aggregate(self, pipeline):
+        counts = {}
+        for d in self.docs:
+            counts[d["username"]] = counts.get(d["username"], 0) + 1
+        limit = pipeline[1]["$match"]["n"]["$gt"]
+        return [{"_id": u, "n": n} for u, n in counts.items() if n > limit]
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.sessions = FakeCollection()
+        self.attempts = FakeCollection()
+        self.store = SessionStore(self.sessions, self.attempts, max_per_user=2)
+        self.later = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    def test_cap_evicts_oldest_sessions(self):
+        self.assertEqual(self.store.create("alice", "d1", self.later), [])
+        self.assertEqual(self.store.create("alice", "d2", self.later), [])
+        self.assertEqual(self.store.create("alice", "d3", self.later), ["d1"])
+        self.store.create("bob", "b1", self.later)
+
+        self.assertIsNone(self.store.username_for("d1"))
+        self.assertEqual(self.store.username_for("d3"), "alice")
+        self.assertEqual(self.store.metrics()["evicted"], 1)
+
+        self.store.delete("d3")
+        self.assertIsNone(self.store.username_for("d3"))
+
+    def test_expired_session_is_not_valid(self):
+        self.store.create("carol", "old", datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertIsNone(self.store.username_for("old"))
+
+    def test_sweep_compacts_both_collections(self):
+        past = datetime.now(timezone.utc) - timedelta(minutes=5)
+        self.store.create("dave", "expired", past)
+        self.sessions.insert_one({"username": "dave", "socket_id": "sid-1"})  # legacy socket doc
+        self.sessions.insert_one({"username": "dave", "token_hash": b"h", "expires_at": self.later})
+        for i in range(4):  # over the cap, e.g. from before it existed
+            self.sessions.insert_one({"username": "erin", "token_digest": f"e{i}",
+                                      "created_at": past + timedelta(seconds=i), "expires_at": self.later})
+        self.attempts.insert_one({"key": "ip:1.2.3.4", "expires_at": past})
+        self.attempts.insert_one({"key": "ip:5.6.7.8", "expires_at": self.later})
+
+        report = self.store.sweep()
+        self.assertEqual(report["sessions_expired"], 1)
+        self.assertEqual(report["sessions_orphaned"], 1)
+        self.assertEqual(sorted(report["evicted_digests"]), ["e0", "e1"])
+        self.assertEqual(report["login_attempts_expired"], 1)
+        self.assertEqual(report["sessions_size"], 3)  # erin's two and dave's legacy session
+        self.assertEqual(report["login_attempts_size"], 1)
+
+        metrics = self.store.metrics()
+        self.assertEqual(metrics["swept"], {"sessions": 4, "login_attempts": 1})
+        self.assertNotIn("evicted_digests", metrics["last_sweep"])
+
+    def test_legacy_session_is_adopted_on_first_use(self):
+        self.sessions.insert_one({"username": "frank", "token_hash": b"hash-of-t1",
+                                  "created_at": datetime.now(timezone.utc), "expires_at": self.later})
+        verify = lambda token, hashed: hashed == b"hash-of-" + token.encode()
+
+        self.assertFalse(self.store.adopt_legacy("frank", "d-other", "t2", verify))
+        self.assertTrue(self.store.adopt_legacy("frank", "d1", "t1", verify))
+        self.assertEqual(self.store.username_for("d1"), "frank")
+        self.assertNotIn("token_hash", self.sessions.docs[0])
+        self.assertFalse(self.store.adopt_legacy("frank", "d1", "t1", verify))
+        self.assertEqual(self.store.metrics()["adopted"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
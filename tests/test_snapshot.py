@@ -0,0 +1,87 @@
+import unittest
+from util.backend.snapshot import SnapshotEncoder, capture_world
+
+
+def _world(**positions):
+    players = {sid: {'x': x, 'y': y, 'it': False, 'name': sid, 'avatar': None}
+               for sid, (x, y) in positions.items()}
+    return capture_world(players, {})
+
+
+class TestSnapshotEncoder(unittest.TestCase):
+    def test_first_snapshot_is_keyframe(self):
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        out = enc.encode(1, 0.0, _world(a=(1, 1), b=(2, 2)))
+        self.assertTrue(out['a']['keyframe'])
+        self.assertEqual(set(out['a']['players']), {'a', 'b'})
+
+    def test_delta_only_contains_changed_fields(self):
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        enc.encode(1, 0.0, _world(a=(1, 1), b=(2, 2)))
+        enc.ack('a', 1)
+
+        out = enc.encode(2, 0.0, _world(a=(1, 1), b=(5, 2), c=(0, 0)))
+        snap = out['a']
+        self.assertFalse(snap['keyframe'])
+        self.assertEqual(snap['base'], 1)
+        self.assertEqual(snap['players']['b'], {'x': 5})
+        self.assertEqual(snap['players']['c']['name'], 'c')
+        self.assertNotIn('a', snap['players'])
+
+    def test_nothing_sent_when_unchanged_and_leaves_reported(self):
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        enc.encode(1, 0.0, _world(a=(1, 1), b=(2, 2)))
+        enc.ack('a', 1)
+
+        self.assertEqual(enc.encode(2, 0.0, _world(a=(1, 1), b=(2, 2))), {})
+        out = enc.encode(3, 0.0, _world(a=(1, 1)))
+        self.assertEqual(out['a']['removed'], ['b'])
+
+    def test_keyframe_interval_and_request(self):
+        enc = SnapshotEncoder(keyframe_interval=3)
+        enc.add_client('a')
+        enc.encode(1, 0.0, _world(a=(1, 1)))
+        enc.ack('a', 1)
+        self.assertFalse(enc.encode(2, 0.0, _world(a=(2, 1)))['a']['keyframe'])
+        self.assertTrue(enc.encode(4, 0.0, _world(a=(3, 1)))['a']['keyframe'])
+
+        enc.ack('a', 4)
+        enc.request_keyframe('a')
+        self.assertTrue(enc.encode(5, 0.0, _world(a=(3, 1)))['a']['keyframe'])
+
+    def test_delta_against_older_ack_covers_unacked_ticks(self):
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        enc.encode(1, 0.0, _world(a=(1, 1), b=(2, 2), c=(3, 3)))
+        enc.ack('a', 1)
+        enc.encode(2, 0.0, _world(a=(1, 1), b=(5, 2), c=(3, 3)))     # lost
+        enc.encode(3, 0.0, _world(a=(1, 1), b=(5, 2), c=(3, 4)))     # lost
+
+        out = enc.encode(4, 0.0, _world(a=(1, 1), b=(2, 2), c=(3, 4), d=(0, 0)))
+        snap = out['a']
+        self.assertEqual(snap['base'], 1)
+        self.assertEqual(set(snap['players']), {'c', 'd'})            # b is back where tick 1 had it
+        self.assertEqual(snap['players']['c'], {'y': 4})
+
+        enc.ack('a', 4)
+        self.assertEqual(enc.encode(5, 0.0, _world(a=(1, 1), b=(2, 2), c=(3, 4))), {'a': {
+            'tick': 5, 'time': 0.0, 'base': 4, 'keyframe': False, 'players': {}, 'removed': ['d']}})
+
+    def test_out_of_range_status_change_is_sent_without_position(self):
+        players = {'a': {'x': 0, 'y': 0, 'it': False, 'name': 'a'},
+                   'b': {'x': 900, 'y': 0, 'it': False, 'name': 'b'}}
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        enc.encode(1, 0.0, capture_world(players, {}), visible=lambda sid: {'a'})
+        enc.ack('a', 1)
+
+        players['b'].update(x=950, it=True)
+        out = enc.encode(2, 0.0, capture_world(players, {}), visible=lambda sid: {'a'})
+        self.assertEqual(out['a']['players'], {'b': {'it': True}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from util.backend.spatial_hash import SpatialHash
+from util.backend.snapshot import SnapshotEncoder, capture_world
+
+
+class TestSpatialHash(unittest.TestCase):
+    def test_neighbours_only_cover_adjacent_cells(self):
+        grid = SpatialHash(100)
+        grid.update('a', 10, 10)
+        grid.update('b', 150, 50)    # adjacent cell
+        grid.update('c', 450, 450)   # far away
+        self.assertEqual(grid.neighbours('a'), {'a', 'b'})
+
+        grid.update('c', 190, 190)   # moves next to a
+        self.assertEqual(grid.neighbours('a'), {'a', 'b', 'c'})
+
+        grid.remove('b')
+        self.assertEqual(grid.neighbours('a'), {'a', 'c'})
+        self.assertEqual(len(grid), 2)
+
+    def test_query_radius(self):
+        grid = SpatialHash(50)
+        grid.update('a', 0, 0)
+        grid.update('b', 30, 0)
+        grid.update('c', 200, 0)
+        self.assertEqual(sorted(grid.query_radius(0, 0, 32)), ['a', 'b'])
+        self.assertEqual(sorted(grid.query_radius(0, 0, 250)), ['a', 'b', 'c'])
+
+
+class TestAreaOfInterestSnapshots(unittest.TestCase):
+    def test_far_players_keep_last_sent_position(self):
+        players = {'a': {'x': 0, 'y': 0, 'it': False, 'name': 'a'},
+                   'b': {'x': 900, 'y': 0, 'it': False, 'name': 'b'}}
+        enc = SnapshotEncoder(keyframe_interval=100)
+        enc.add_client('a')
+        visible = lambda sid: {'a'}
+
+        enc.encode(1, 0.0, capture_world(players, {}), visible=visible)
+        enc.ack('a', 1)
+
+        players['b']['x'] = 950
+        self.assertEqual(enc.encode(2, 0.0, capture_world(players, {}), visible=visible), {})
+
+        # b walks into range: its current position is sent even though base is old
+        out = enc.encode(3, 0.0, capture_world(players, {}), visible=lambda sid: {'a', 'b'})
+        self.assertEqual(out['a']['players'], {'b': {'x': 950}})
+
+
+if __name__ == '__main__':
+    unittest.main()
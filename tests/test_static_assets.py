@@ -0,0 +1,75 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from util.backend.static_assets import StaticAssets
+
+
+class TestStaticAssets(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        files = {
+            "html/game.html": '<link href="/css/site.css"><script type="module">import \'./js/game.js\';</script>'
+                              '<script src="https://cdn.example.com/lib.js"></script>',
+            "css/site.css": "body { background: url('/assets/bg.png'); }" + " " * 200,
+            "js/game.js": "import Net from './net.js';\nfetch('/api/current-user');\n" + "//" * 200,
+            "js/net.js": "export default class Net {}\n" + "//" * 200,
+            "assets/bg.png": "not really a png",
+        }
+        for rel, text in files.items():
+            path = os.path.join(self.tmp.name, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+
+        self.assets = StaticAssets(self.tmp.name)
+        self.manifest = self.assets.build()
+        app = Flask(__name__)
+
+        @app.route("/<path:rel>")
+        def serve(rel):
+            return self.assets.send(rel) or ("missing", 404)
+
+        self.client = app.test_client()
+
+    def test_references_are_rewritten_to_hashed_names(self):
+        page = self.client.get("/html/game.html").get_data(as_text=True)
+        self.assertIn(f'href="/{self.manifest["css/site.css"]}"', page)
+        self.assertIn(f"import '/{self.manifest['js/game.js']}'", page)
+        self.assertIn("https://cdn.example.com/lib.js", page)
+
+        game = self.client.get("/" + self.manifest["js/game.js"]).get_data(as_text=True)
+        self.assertIn(f"from '/{self.manifest['js/net.js']}'", game)
+        self.assertIn("'/api/current-user'", game)
+
+    def test_hash_changes_when_a_dependency_changes(self):
+        before = dict(self.manifest)
+        with open(os.path.join(self.tmp.name, "js/net.js"), "a") as f:
+            f.write("// changed\n")
+        after = self.assets.build()
+        self.assertNotEqual(before["js/net.js"], after["js/net.js"])
+        self.assertNotEqual(before["js/game.js"], after["js/game.js"])
+        self.assertEqual(before["css/site.css"], after["css/site.css"])
+
+    def test_caching_headers_and_encoding(self):
+        hashed = self.client.get("/" + self.manifest["js/net.js"], headers={"Accept-Encoding": "gzip"})
+        self.assertIn("immutable", hashed.headers["Cache-Control"])
+        self.assertEqual(hashed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(hashed.headers["Vary"], "Accept-Encoding")
+        self.assertTrue(gzip.decompress(hashed.data).startswith(b"export default"))
+
+        plain = self.client.get("/js/net.js")
+        self.assertEqual(plain.headers["Cache-Control"], "no-cache")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        again = self.client.get("/js/net.js", headers={"If-None-Match": plain.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+        self.assertEqual(self.client.get("/js/nope.js").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from pymongo.errors import AutoReconnect, BulkWriteError, ServerSelectionTimeoutError
+from db.stats_buffer import UPDATED_AT_FIELD, StatsBuffer
+
+STAMP = {"$currentDate": {UPDATED_AT_FIELD: True}}
+
+
+class FakeCollection:
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+        self.write_errors = []  # indexes rejected by the next bulk_write
+
+    def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise self.fail
+        self.batches.append(ops)
+        if self.write_errors:
+            errors, self.write_errors = self.write_errors, []
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": 11000} for i in errors]})
+
+
+class TestStatsBuffer(unittest.TestCase):
+    def test_merges_updates_into_one_op_per_user(self):
+        users, board = FakeCollection(), FakeCollection()
+        buf = StatsBuffer(users, board)
+        buf.inc("alice", "totalTags", 1)
+        buf.inc("alice", "totalTags", 2)
+        buf.inc("alice", "totalTimeIt", 1.5)
+        buf.set("alice", "time_as_it", 7)
+        buf.leaderboard_max("alice", 3)
+        buf.leaderboard_max("alice", 9)
+        buf.leaderboard_max("alice", 4)
+
+        self.assertEqual(buf.flush(), 2)
+        (op,), = users.batches
+        self.assertEqual(op._doc, {"$inc": {"totalTags": 3, "totalTimeIt": 1.5},
+                                   "$set": {"time_as_it": 7}, **STAMP})
+        (board_op,), = board.batches
+        self.assertEqual(board_op._doc, {"$max": {"longestStreak": 9}, **STAMP})
+        self.assertEqual(buf.queue_depth, 0)
+
+    def test_read_doc_with_pending_adds_buffered_increment(self):
+        buf = StatsBuffer(FakeCollection(), FakeCollection())
+        buf.inc("bob", "totalTimeIt", 30)
+        self.assertEqual(buf.read_doc_with_pending("bob", lambda: {"totalTimeIt": 570}),
+                         {"totalTimeIt": 600})
+        self.assertIsNone(buf.read_doc_with_pending("bob", lambda: None))
+
+    def test_read_retries_when_a_flush_lands_during_it(self):
+        users = FakeCollection()
+        buf = StatsBuffer(users, FakeCollection())
+        buf.inc("bob", "totalTags", 5)
+        stored = {"totalTags": 10}
+        reads = []
+
+        def read():
+            reads.append(dict(stored))
+            if len(reads) == 1:  # a flush writes the buffered 5 while we read
+                buf.flush()
+                stored["totalTags"] += 5
+            return dict(reads[-1])
+
+        self.assertEqual(buf.read_doc_with_pending("bob", read), {"totalTags": 15})
+        self.assertEqual(len(reads), 2)
+
+    def test_failed_flush_requeues(self):
+        users = FakeCollection(fail=ServerSelectionTimeoutError("no servers"))
+        buf = StatsBuffer(users, FakeCollection())
+        buf.inc("carol", "totalTags", 1)
+        self.assertEqual(buf.flush(), 0)
+        buf.inc("carol", "totalTags", 1)
+        self.assertEqual(buf.read_doc_with_pending("carol", lambda: {}), {"totalTags": 2})
+        self.assertEqual(buf.metrics()["flushErrors"], 1)
+
+        users.fail = None
+        buf.flush()
+        self.assertEqual(users.batches[0][0]._doc, {"$inc": {"totalTags": 2}, **STAMP})
+
+    def test_ambiguous_failure_drops_the_batch(self):
+        users = FakeCollection(fail=AutoReconnect("connection reset"))  # may have applied some ops
+        buf = StatsBuffer(users, FakeCollection())
+        buf.inc("carol", "totalTags", 1)
+        self.assertEqual(buf.flush(), 0)
+        self.assertEqual(buf.queue_depth, 0)
+        self.assertEqual(buf.metrics()["droppedOps"], 1)
+
+    def test_partial_bulk_failure_requeues_only_failed_ops(self):
+        users = FakeCollection()
+        buf = StatsBuffer(users, FakeCollection())
+        buf.inc("dave", "totalTags", 1)
+        buf.inc("erin", "totalTags", 1)
+        users.write_errors = [1]
+        self.assertEqual(buf.flush(), 0)
+
+        buf.flush()
+        (retried,) = users.batches[1]
+        self.assertEqual(retried._filter, {"username": "erin"})
+        self.assertEqual(retried._doc, {"$inc": {"totalTags": 1}, **STAMP})
+
+
+if __name__ == '__main__':
+    unittest.main()
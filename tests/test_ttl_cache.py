@@ -0,0 +1,27 @@
+import time
+import unittest
+from util.backend.ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")          # a is now most recent
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expiry_and_pop(self):
+        cache = TTLCache(ttl=60)
+        cache.set("gone", 1, expires_at=time.monotonic() - 1)
+        self.assertIsNone(cache.get("gone"))
+        cache.set("k", "v")
+        self.assertEqual(cache.pop("k"), "v")
+        self.assertIsNone(cache.get("k"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from util.backend.wire_format import (
+    SlotTable, WireFormatError, decode_move, decode_snapshot, encode_move, encode_snapshot
+)
+
+
+class TestWireFormat(unittest.TestCase):
+    def test_move_round_trip_is_quantized(self):
+        frame = encode_move(123.4, 56.78, ack=9)
+        self.assertEqual(len(frame), 9)
+        self.assertEqual(decode_move(frame), {'x': 123.5, 'y': 56.75, 'ack': 9})
+
+    def test_bad_move_frame_rejected(self):
+        with self.assertRaises(WireFormatError):
+            decode_move(b'\x01\x02')
+
+    def test_snapshot_round_trip(self):
+        slots = SlotTable()
+        keyframe = {'tick': 7, 'time': 1.5, 'base': None, 'keyframe': True, 'removed': [],
+                    'players': {'sidA': {'x': 10, 'y': 20, 'it': True, 'name': 'ann'},
+                                'sidB': {'x': 30, 'y': 40, 'it': False, 'name': 'bob'}}}
+        sid_of = {}
+        self.assertEqual(decode_snapshot(encode_snapshot(keyframe, slots), sid_of), keyframe)
+
+        delta = {'tick': 8, 'time': 1.6, 'base': 7, 'keyframe': False,
+                 'players': {'sidA': {'y': 22.25}, 'sidB': {'it': True}}, 'removed': []}
+        self.assertEqual(decode_snapshot(encode_snapshot(delta, slots), sid_of), delta)
+
+        slots.release('sidB')
+        gone = {'tick': 9, 'time': 1.7, 'base': 8, 'keyframe': False, 'players': {}, 'removed': ['sidB']}
+        self.assertEqual(decode_snapshot(encode_snapshot(gone, slots), sid_of), gone)
+
+    def test_released_slots_are_reused_after_quarantine(self):
+        slots = SlotTable(quarantine=0)
+        self.assertEqual(slots.assign('a'), 0)
+        self.assertEqual(slots.assign('b'), 1)
+        slots.release('a')
+        self.assertEqual(slots.assign('c'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,38 +1,149 @@
 import os
-import bcrypt
-import requests
+import hmac
+import hashlib
+import math
+import time
 from datetime import datetime, timedelta, timezone
 from flask import request, jsonify, make_response
-from db.database import users, sessions
-from db.database import users, sessions, initialize_player_stats
+from werkzeug.utils import secure_filename
+from db.database import users, session_store, initialize_player_stats
 from util.backend.logger import log_auth_attempt
+from util.backend.rate_limiter import LoginRateLimiter
+from util.backend.ttl_cache import TTLCache
+from util.backend.upload.avatar import avatar_processor
+from util.backend.upload.avatar_generator import generate_avatar
+from util.backend.upload.avatar_index import avatar_changed, get_avatar_url
+from util.backend.authentication.auth_context import SECRET_KEY, current_auth, decode_token, forget_token
+from util.backend.authentication.password_hashing import HashingBusy, password_hasher
 import jwt as pyjwt
-
-# Secret key for JWTs (set via environment in production)
-SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key")
 # Token expiration time (e.g., 24 hours)
 TOKEN_EXP_HOURS = int(os.environ.get("TOKEN_EXP_HOURS", 24))
 
+# Recently validated sessions: token digest → username. Entries live for at
+# most SESSION_CACHE_TTL seconds, so a session deleted by another worker
+# stops working within that window; logout on this worker evicts at once.
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", 60))
+_session_cache = TTLCache(maxsize=4096, ttl=SESSION_CACHE_TTL)
+
+# Digests with no live session (expired, revoked, logged out), so replaying
+# a dead cookie skips the session lookup and the legacy-session check.
+DEAD_SESSION_CACHE_TTL = float(os.environ.get("DEAD_SESSION_CACHE_TTL", 10))
+_dead_sessions = TTLCache(maxsize=4096, ttl=DEAD_SESSION_CACHE_TTL)
+
+# Login throttle per client IP and per username, checked before any Mongo or
+# bcrypt work. Rates are attempts per minute; bursts are attempts in a row.
+login_limiter = LoginRateLimiter(
+    ip_rate=float(os.environ.get("LOGIN_IP_PER_MINUTE", 10)) / 60,
+    ip_burst=int(os.environ.get("LOGIN_IP_BURST", 10)),
+    user_rate=float(os.environ.get("LOGIN_USER_PER_MINUTE", 10)) / 60,
+    user_burst=int(os.environ.get("LOGIN_USER_BURST", 10)),
+)
+# Proxies in front of the app that append to X-Forwarded-For. 0 (the default)
+# ignores the header, since a client reaching the app directly could forge it;
+# docker-compose.yml sets 1 for the nginx in deploy/nginx.conf.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+
 # Where to save default avatars
 AVATAR_DIR = os.path.join("static", "avatars")
 os.makedirs(AVATAR_DIR, exist_ok=True)
 
-def download_dicebear_avatar(username):
+def create_default_avatar(username):
+    """
+    Draw *username*'s default pixel-art avatar in the avatar pool, without
+    waiting for it; the avatar index picks it up once it's written.
+    Users who already have an avatar keep it.
+    """
+    stem = secure_filename(username + ".png").rsplit('.', 1)[0]
+    if not stem or get_avatar_url(stem) is not None:
+        return
     try:
-        # Dicebear API (for example, using "adventurer" style)
-        url = f"https://api.dicebear.com/7.x/pixel-art/png?seed={username}"
-
-        response = requests.get(url)
-        if response.status_code == 200:
-            filepath = os.path.join(AVATAR_DIR, f"{username}.png")
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-        else:
-            # Optional: log or ignore failures
-            pass
+        avatar_processor.submit(generate_avatar, AVATAR_DIR, stem,
+                                on_done=lambda written: written and avatar_changed(stem))
     except Exception as e:
-        # Optional: log errors
-        pass
+        # A missing avatar only means the default circle in game
+        print(f"Error scheduling avatar for {username}: {e}")
+
+def token_digest(token):
+    """
+    Keyed SHA-256 of a JWT, stored in sessions.token_digest (indexed).
+    The JWT already carries 256 bits of HMAC, so a fast keyed hash is enough
+    to avoid storing it in the clear; bcrypt here only cost CPU.
+    """
+    return hmac.new(SECRET_KEY.encode('utf-8'), token.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def validate_session(token):
+    """
+    Return the username for a valid JWT with a live session, else None.
+    Raises pyjwt.ExpiredSignatureError / InvalidTokenError for bad tokens so
+    callers can report why.
+    """
+    payload = decode_token(token)
+    username = payload.get("username")
+    digest = token_digest(token)
+
+    cached = _session_cache.get(digest)
+    if cached is not None:
+        return cached if cached == username else None
+    if _dead_sessions.get(digest):
+        return None
+
+    if session_store.username_for(digest) != username:
+        adopted = _adopt_legacy_session(username, digest, token)
+        if not adopted:
+            if adopted is not None:
+                _dead_sessions.set(digest, True)
+            return None
+
+    # never cache past the token's own expiry
+    remaining = payload["exp"] - time.time() if "exp" in payload else SESSION_CACHE_TTL
+    _session_cache.set(digest, username, expires_at=time.monotonic() + remaining)
+    return username
+
+
+def _adopt_legacy_session(username, digest, token):
+    """
+    Give a session from before token digests (bcrypt token_hash) its digest.
+    Returns whether one was adopted, or None if the hasher was too busy to tell.
+    """
+    try:
+        return session_store.adopt_legacy(username, digest, token, password_hasher.verify)
+    except HashingBusy:
+        return None  # try again on the next request
+
+
+def forget_sessions(digests):
+    """Drop deleted sessions from this worker's session cache."""
+    for digest in digests:
+        _session_cache.pop(digest)
+
+
+def session_username():
+    """
+    validate_session() for the current request / socket event's cookie,
+    computed once and kept on its AuthContext (flask.g). None without a
+    cookie; raises pyjwt errors like validate_session.
+    """
+    return current_auth().session(validate_session)
+
+
+def client_ip():
+    """
+    The client's address as seen by our own proxy. nginx appends the peer
+    it saw to whatever X-Forwarded-For the client sent, so only the last
+    TRUSTED_PROXY_HOPS entries can be trusted; earlier ones are client input.
+    """
+    hops = [h.strip() for h in request.headers.get('X-Forwarded-For', '').split(',') if h.strip()]
+    if TRUSTED_PROXY_HOPS and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr
+
+
+def _busy(e):
+    resp = make_response(jsonify(error=str(e)), 503)
+    resp.headers["Retry-After"] = "1"
+    return resp
+
 
 def register():
     """
@@ -50,8 +161,11 @@ def register():
         log_auth_attempt("register", username, False, "Username already exists")
         return jsonify(error="Username already exists"), 400
 
-    # Hash the password with bcrypt
-    pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    # Hash the password with bcrypt (on a native thread, not the hub)
+    try:
+        pw_hash = password_hasher.hash(password)
+    except HashingBusy as e:
+        return _busy(e)
     users.insert_one({
         "username": username,
         "password": pw_hash,
@@ -61,8 +175,8 @@ def register():
     # Initialize player stats
     initialize_player_stats(username)
 
-    # Generate default Dicebear avatar
-    download_dicebear_avatar(username)
+    # Draw the default avatar off the request path
+    create_default_avatar(username)
 
     log_auth_attempt("register", username, True)
     return jsonify(message="Registration successful"), 201
@@ -79,23 +193,43 @@ def login():
     if not username or not password:
         return jsonify(error="Username and password are required"), 400
 
+    ip = client_ip()
+    wait = login_limiter.check(ip, username)
+    if wait:
+        log_auth_attempt("login", username, False, "Rate limited")
+        resp = make_response(jsonify(error="Too many login attempts, try again later"), 429)
+        resp.headers["Retry-After"] = str(math.ceil(wait))
+        return resp
+
     user = users.find_one({"username": username})
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password']):
+    try:
+        valid = bool(user) and password_hasher.verify(password, user['password'])
+    except HashingBusy as e:
+        return _busy(e)
+    if not valid:
+        login_limiter.record_failure(ip, username)
         log_auth_attempt("login", username, False, "Invalid credentials")
         return jsonify(error="Invalid username or password"), 401
 
+    login_limiter.record_success(ip, username)
+
+    # Upgrade hashes made with an older cost factor while we have the password
+    if password_hasher.needs_rehash(user['password']):
+        try:
+            users.update_one({"_id": user["_id"], "password": user['password']},
+                             {"$set": {"password": password_hasher.hash(password)}})
+        except HashingBusy:
+            pass  # next login will try again
+
     # Generate JWT token
     exp = datetime.utcnow() + timedelta(hours=TOKEN_EXP_HOURS)
     payload = {"username": username, "exp": exp}
     token = pyjwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
-    token_hash = bcrypt.hashpw(token.encode('utf-8'), bcrypt.gensalt())
-    sessions.insert_one({
-        "username": username,
-        "token_hash": token_hash,
-        "created_at": datetime.now(timezone.utc),
-        "expires_at": exp
-    })
+    # Over MAX_SESSIONS_PER_USER, the oldest sessions are dropped
+    digest = token_digest(token)
+    forget_sessions(session_store.create(username, digest, exp))
+    _dead_sessions.pop(digest)  # a re-login within the same second reissues the same token
 
     log_auth_attempt("login", username, True)
 
@@ -122,17 +256,17 @@ def logout():
         return jsonify(error="No active session"), 400
 
     try:
-        payload = pyjwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        username = payload.get("username")
+        decode_token(token)
     except pyjwt.ExpiredSignatureError:
         return jsonify(error="Session expired"), 401
     except pyjwt.InvalidTokenError:
         return jsonify(error="Invalid token"), 401
 
-    for sess in sessions.find({"username": username}):
-        if bcrypt.checkpw(token.encode('utf-8'), sess.get('token_hash', b'')):
-            sessions.delete_one({"_id": sess['_id']})
-            break
+    digest = token_digest(token)
+    _session_cache.pop(digest)
+    _dead_sessions.set(digest, True)
+    forget_token(token)
+    session_store.delete(digest)
 
     resp = make_response(jsonify(message="Logout successful"))
     resp.set_cookie("auth_token", "", expires=0, max_age=0)
@@ -148,24 +282,17 @@ def token_required(fn):
 
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        token = request.cookies.get("auth_token")
-        if not token:
+        if not current_auth().token:
             return jsonify(error="Authentication required"), 401
 
         try:
-            payload = pyjwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            username = session_username()
         except pyjwt.ExpiredSignatureError:
             return jsonify(error="Session expired"), 401
         except pyjwt.InvalidTokenError:
             return jsonify(error="Invalid token"), 401
 
-        username = payload.get("username")
-        valid = False
-        for sess in sessions.find({"username": username}):
-            if bcrypt.checkpw(token.encode('utf-8'), sess.get('token_hash', b'')):
-                valid = True
-                break
-        if not valid:
+        if not username:
             return jsonify(error="Invalid session"), 401
 
         g.username = username
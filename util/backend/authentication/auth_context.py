@@ -0,0 +1,102 @@
+import os
+import time
+
+import jwt as pyjwt
+from flask import g, has_request_context, request
+
+from util.backend.ttl_cache import TTLCache
+
+# Secret key for JWTs (set via environment in production)
+SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key")
+
+# Recently decoded, unexpired tokens: token → claims. Lets repeat requests
+# skip HMAC verification; an entry never outlives the token's own "exp".
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+_UNSET = object()
+
+
+def decode_token(token):
+    """
+    Verified claims of *token*. Raises pyjwt.ExpiredSignatureError /
+    InvalidTokenError like pyjwt.decode; only valid tokens are cached.
+    """
+    claims = _token_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = pyjwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    expires_at = None
+    if "exp" in claims:
+        expires_at = time.monotonic() + (claims["exp"] - time.time())
+    _token_cache.set(token, claims, expires_at=expires_at)
+    return claims
+
+
+def forget_token(token):
+    _token_cache.pop(token)
+
+
+class AuthContext:
+    """
+    Auth state of one request / socket event, computed lazily and at most
+    once: the cookie token, its decoded claims (or the decode error), and
+    the session-checked username once auth.session_username() has run.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self._claims = _UNSET
+        self.error = None
+        self.session_user = _UNSET   # see session()
+        self.session_error = None
+
+    @property
+    def claims(self):
+        if self._claims is _UNSET:
+            self._claims = None
+            if self.token:
+                try:
+                    self._claims = decode_token(self.token)
+                except pyjwt.InvalidTokenError as e:
+                    self.error = e
+        return self._claims
+
+    def session(self, validate):
+        """
+        Session-checked username via validate(token), run once per context.
+        Re-raises validate's pyjwt error on every call.
+        """
+        if self.session_user is _UNSET:
+            self.session_user = None
+            if self.token:
+                try:
+                    self.session_user = validate(self.token)
+                except pyjwt.InvalidTokenError as e:
+                    self.session_error = e
+        if self.session_error is not None:
+            raise self.session_error
+        return self.session_user
+
+    @property
+    def claimed_username(self):
+        """Username from a validly signed token, without checking the session (for logging)."""
+        claims = self.claims
+        return claims.get("username") if claims else None
+
+
+def current_auth():
+    """The AuthContext of the current request, created on first use and kept on flask.g."""
+    ctx = g.get("_auth_context")
+    if ctx is None:
+        ctx = AuthContext(request.cookies.get("auth_token"))
+        g._auth_context = ctx
+    return ctx
+
+
+def current_username():
+    """claimed_username of the current request, or None outside a request."""
+    if not has_request_context():
+        return None
+    return current_auth().claimed_username
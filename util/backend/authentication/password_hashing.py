@@ -0,0 +1,129 @@
+"""
+bcrypt off the eventlet hub.
+
+bcrypt is deliberately slow (~250 ms at cost 12) and would block every
+socket for that long if called on the hub. `PasswordHasher` runs it on
+eventlet's native thread pool (tpool) instead; bcrypt releases the GIL, so
+the hub keeps serving the game meanwhile. At most *threads* hashes run at
+once and at most *max_queue* more wait; anything beyond that is refused with
+HashingBusy rather than queueing without bound.
+
+The cost factor comes from BCRYPT_ROUNDS; scripts/calibrate_bcrypt.py picks
+one for a target latency on the host. Hashes made with another cost are
+upgraded on the user's next successful login (see needs_rehash).
+"""
+import os
+import threading
+import time
+
+import bcrypt
+
+try:
+    from eventlet import patcher, tpool
+    from eventlet.semaphore import Semaphore as _GreenSemaphore
+except ImportError:
+    patcher = tpool = _GreenSemaphore = None
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+HASH_THREADS = int(os.environ.get("HASH_THREADS", 4))
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", 32))
+MIN_ROUNDS = 10
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already running or queued."""
+
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash ($2b$12$...), or None if unparseable."""
+    try:
+        return int(hashed[4:6])
+    except (TypeError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_seconds, min_rounds=MIN_ROUNDS, max_rounds=16, samples=3, timer=None):
+    """
+    Highest cost whose median hash time stays within *target_seconds*, but
+    never below *min_rounds*. Each extra round doubles the time, so this
+    stops at the first cost that is too slow. Returns (rounds, {rounds: seconds}).
+    """
+    def default_timer(rounds):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration-password", bcrypt.gensalt(rounds))
+        return time.perf_counter() - start
+
+    timer = timer or default_timer
+    measured = {}
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        times = sorted(timer(rounds) for _ in range(samples))
+        measured[rounds] = times[len(times) // 2]
+        if measured[rounds] > target_seconds:
+            break
+        chosen = rounds
+    return chosen, measured
+
+
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, threads=HASH_THREADS, max_queue=HASH_MAX_QUEUE):
+        self.rounds = rounds
+        self.threads = threads
+        self.max_queue = max_queue
+        self._slots = None   # created on first use, once we know if eventlet is active
+        self._green = False
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _setup(self):
+        self._green = patcher is not None and patcher.is_monkey_patched("thread")
+        self._slots = _GreenSemaphore(self.threads) if self._green else threading.BoundedSemaphore(self.threads)
+
+    def _run(self, fn, *args):
+        if self._slots is None:
+            self._setup()
+        with self._lock:
+            if self.in_flight >= self.threads + self.max_queue:
+                self.rejected += 1
+                raise HashingBusy("Too many login attempts in progress, try again.")
+            self.in_flight += 1
+        try:
+            with self._slots:
+                start = time.perf_counter()
+                result = tpool.execute(fn, *args) if self._green else fn(*args)
+                elapsed = (time.perf_counter() - start) * 1000
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        self.completed += 1
+        self.total_ms += elapsed
+        self.max_ms = max(self.max_ms, elapsed)
+        return result
+
+    def hash(self, password):
+        """bcrypt hash of *password* (str) at the current cost."""
+        return self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+
+    def verify(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def metrics(self):
+        return {
+            "rounds": self.rounds,
+            "threads": self.threads,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.completed, 2) if self.completed else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,54 @@
+import os
+
+from util.backend.message_bus import create_bus
+
+# Each worker process owns the rooms it creates. WORKER_ID must be unique and
+# in range(WORKER_COUNT); the reverse proxy routes ?worker=<id> to it.
+WORKER_ID = int(os.environ.get("WORKER_ID", 0))
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", 1))
+MESSAGE_BUS_URL = os.environ.get("MESSAGE_BUS_URL", "memory://")
+HEARTBEAT_SECONDS = 5
+
+KICK_CHANNEL = "tag:kick"  # {'sid': ...} → whichever worker holds it disconnects it
+AVATAR_CHANNEL = "tag:avatar"  # {'username': ...} → every worker re-indexes that avatar
+
+bus = create_bus(MESSAGE_BUS_URL)
+
+
+def choose_worker(rooms, capacity, worker_count=WORKER_COUNT):
+    """
+    Pick the worker a new player should connect to: the owner of the fullest
+    room with space left, or else the worker with the fewest players.
+    """
+    open_rooms = [info for info in rooms.values() if info['players'] < capacity]
+    if open_rooms:
+        return max(open_rooms, key=lambda info: info['players'])['worker']
+
+    load = {w: 0 for w in range(worker_count)}
+    for info in rooms.values():
+        if info['worker'] in load:
+            load[info['worker']] += info['players']
+    return min(load, key=lambda w: (load[w], w))
+
+
+def publish_room(room):
+    """Advertise *room*'s size in the shared directory (or drop it when empty)."""
+    try:
+        if room.players:
+            bus.set_room(WORKER_ID, room.id, len(room.players))
+        else:
+            bus.drop_room(WORKER_ID, room.id)
+    except Exception as e:
+        print(f"Error publishing room {room.id}: {e}")
+
+
+def heartbeat(rooms, sleep):
+    """Background task: refresh this worker's rooms so they don't expire."""
+    while True:
+        try:
+            for room in list(rooms.values()):
+                publish_room(room)
+            bus.heartbeat(WORKER_ID)
+        except Exception as e:
+            print(f"Error in cluster heartbeat: {e}")
+        sleep(HEARTBEAT_SECONDS)
@@ -0,0 +1,173 @@
+import itertools
+import math
+import os
+import random
+import time
+
+from util.backend.snapshot import SnapshotEncoder, capture_world
+from util.backend.spatial_hash import SpatialHash
+from util.backend.wire_format import SlotTable
+
+TICK_RATE = int(os.environ.get("TICK_RATE", 20))  # world snapshots per second
+KEYFRAME_SECONDS = float(os.environ.get("KEYFRAME_SECONDS", 3))
+
+# Area of interest: clients only get movement from the 3×3 grid cells around
+# them (plus the IT player). 640px ≈ 13 tiles of 48px, about half a viewport.
+AOI_CELL_SIZE = int(os.environ.get("AOI_CELL_SIZE", 640))
+
+# Map size in pixels: 60×40 tiles of 16px drawn at 3× (see public/js/tag_game.js)
+MAP_WIDTH = 60 * 48
+MAP_HEIGHT = 40 * 48
+
+# Players per room before the matchmaker opens another one
+ROOM_CAPACITY = int(os.environ.get("ROOM_CAPACITY", 16))
+
+
+def parse_position(x, y):
+    """
+    Client-sent coordinates as floats clamped to the map, or None if either
+    isn't a finite number.
+    """
+    try:
+        x, y = float(x), float(y)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(x) and math.isfinite(y)):
+        return None
+    return min(max(x, 0.0), MAP_WIDTH), min(max(y, 0.0), MAP_HEIGHT)
+
+
+class GameRoom:
+    """
+    One isolated lobby: its own players, IT timers, map seed, spatial index
+    and snapshot stream. `id` doubles as the Socket.IO room name.
+
+    Methods here only mutate in-memory state; emitting and Mongo writes are
+    left to the socket handlers.
+    """
+
+    def __init__(self, room_id, seed=None):
+        self.id = room_id
+        self.seed = seed if seed is not None else random.randint(0, 2 ** 32 - 1)
+        self.players = {}         # sid → {x, y, it, name, avatar}
+        self.it_times = {}        # sid → {'total', 'started_at'}
+        self.became_it_time = {}  # sid → last time it became IT
+        self.last_tag_hint = {}   # sid → time of the last client `tag` event accepted
+        self.binary_clients = set()
+        self.positions = SpatialHash(AOI_CELL_SIZE)
+        self.snapshots = SnapshotEncoder(keyframe_interval=max(1, int(KEYFRAME_SECONDS * TICK_RATE)))
+        self.slots = SlotTable(quarantine=2 * KEYFRAME_SECONDS)
+        self.tick = 0
+
+    def __len__(self):
+        return len(self.players)
+
+    def it_sids(self):
+        return [sid for sid, p in self.players.items() if p['it']]
+
+    # ─── membership ───────────────────────────────────────────
+    def add_player(self, sid, username, avatar_url, x, y, binary=False):
+        """Register *sid*; the first player in an IT-less room becomes IT."""
+        now = time.time()
+        is_it = not self.it_sids()
+        self.players[sid] = {"x": x, "y": y, "it": is_it, "name": username, "avatar": avatar_url}
+        self.it_times[sid] = {"total": 0, "started_at": now if is_it else None}
+        if is_it:
+            self.became_it_time[sid] = now
+
+        self.positions.update(sid, x, y)
+        self.snapshots.add_client(sid)
+        self.slots.assign(sid)
+        if binary:
+            self.binary_clients.add(sid)
+        return self.players[sid]
+
+    def remove_player(self, sid):
+        """Forget *sid* entirely. Timers must be finalised by the caller first."""
+        self.players.pop(sid, None)
+        self.it_times.pop(sid, None)
+        self.became_it_time.pop(sid, None)
+        self.last_tag_hint.pop(sid, None)
+        self.snapshots.remove_client(sid)
+        self.positions.remove(sid)
+        self.slots.release(sid)
+        self.binary_clients.discard(sid)
+
+    def make_it(self, sid, now):
+        self.players[sid]['it'] = True
+        self.it_times.setdefault(sid, {'total': 0})
+        self.it_times[sid]['started_at'] = now
+        self.became_it_time[sid] = now
+
+    # ─── per-tick state ───────────────────────────────────────
+    def record_move(self, sid, x, y, ack=None):
+        """Store the latest position; it is broadcast once per tick."""
+        if sid in self.players:
+            self.positions.update(sid, x, y)  # first: a bad value must not reach the player
+            self.players[sid]['x'] = x
+            self.players[sid]['y'] = y
+            if ack is not None:
+                self.snapshots.ack(sid, ack)
+
+    def build_enriched_it_times(self):
+        enriched = {}
+        for sid, times in self.it_times.items():
+            enriched[sid] = {
+                'total': times.get('total', 0),
+                'started_at': times.get('started_at'),
+                'it': self.players.get(sid, {}).get('it', False)
+            }
+        return enriched
+
+    def area_of_interest(self, sid):
+        """Sids whose movement *sid* should receive: nearby cells plus whoever is IT."""
+        visible = self.positions.neighbours(sid)
+        visible.update(self.it_sids())
+        return visible
+
+    def build_world_snapshots(self, now):
+        """Advance one tick and return {sid: delta snapshot} for every client."""
+        self.tick += 1
+        world = capture_world(self.players, self.it_times)
+        return self.snapshots.encode(self.tick, now, world, visible=self.area_of_interest)
+
+
+class Matchmaker:
+    """
+    Places connecting players into rooms of at most `capacity` players.
+
+    New players fill the fullest room that still has space, so lobbies stay
+    lively; a new room is opened only when every room is full, and rooms are
+    closed as soon as their last player leaves.
+    """
+
+    def __init__(self, capacity=ROOM_CAPACITY, prefix="room"):
+        self.capacity = capacity
+        self.prefix = prefix  # keeps room ids unique across worker processes
+        self.rooms = {}    # room id → GameRoom
+        self.room_of = {}  # sid → room id
+        self._ids = itertools.count(1)
+
+    def place(self, sid):
+        if sid in self.room_of:
+            return self.rooms[self.room_of[sid]]
+        open_rooms = [r for r in self.rooms.values() if len(r) < self.capacity]
+        room = max(open_rooms, key=len) if open_rooms else self.open_room()
+        self.room_of[sid] = room.id
+        return room
+
+    def open_room(self):
+        room = GameRoom(f"{self.prefix}-{next(self._ids)}")
+        self.rooms[room.id] = room
+        return room
+
+    def room_for(self, sid):
+        room_id = self.room_of.get(sid)
+        return self.rooms.get(room_id) if room_id else None
+
+    def leave(self, sid):
+        """Drop *sid*'s placement and close its room if it is now empty."""
+        room = self.rooms.get(self.room_of.pop(sid, None))
+        if room is not None and not room.players and room.id not in self.room_of.values():
+            del self.rooms[room.id]
+        return room
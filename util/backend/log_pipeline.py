@@ -0,0 +1,154 @@
+"""
+Queued, batched log writing.
+
+Request handlers only put records on a queue (`DeferredQueueHandler`); a
+single `BatchingQueueListener` running on a real OS thread drains it in
+batches, writes through long-lived buffered `BufferedRotatingFileHandler`s
+and flushes once per batch. Rotated files are gzipped on another thread.
+
+Under eventlet the queue and threads come from the unpatched stdlib, so
+file I/O never runs on (or blocks) the hub.
+"""
+import gzip
+import logging
+import logging.handlers
+import os
+import shutil
+
+try:
+    from eventlet import patcher
+    _threading = patcher.original("threading")
+    _queue = patcher.original("queue")
+except ImportError:
+    import threading as _threading
+    import queue as _queue
+
+BATCH_SIZE = 256
+
+
+def make_queue(maxsize=10000):
+    return _queue.Queue(maxsize)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread, so lazy
+    messages (objects whose __str__ builds the text) cost nothing at the
+    call site. Records that don't fit in the queue are dropped and counted.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except _queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """QueueListener on a real thread that handles records in batches and flushes once per batch."""
+
+    def start(self):
+        self._thread = t = _threading.Thread(target=self._monitor, name="log-writer", daemon=True)
+        t.start()
+
+    def stop(self):
+        if self._thread is not None:  # idempotent: also registered with atexit
+            super().stop()
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, "task_done")
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(q.get_nowait())
+            except _queue.Empty:
+                pass
+
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                    continue
+                self.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            if has_task_done:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                return
+
+
+def _compress(source, dest):
+    try:
+        with open(source, "rb") as src, gzip.open(dest, "wb") as out:
+            shutil.copyfileobj(src, out)
+        os.remove(source)
+    except OSError as e:
+        print(f"Error compressing rotated log {source}: {e}")
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Size-rotated file handler that writes into a large buffer and leaves
+    flushing to the caller (the listener flushes once per batch). Rotated
+    files become <name>.<n>.gz.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count, buffer_size=64 * 1024):
+        self.buffer_size = buffer_size
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._gzip_rotator
+        self._compressor = None
+
+    def _gzip_rotator(self, source, dest):
+        """Move the full log aside and gzip it on another thread."""
+        pending = dest + ".tmp"
+        os.replace(source, pending)
+        self._compressor = _threading.Thread(target=_compress, args=(pending, dest), daemon=True)
+        self._compressor.start()
+
+    def _wait_for_compression(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def doRollover(self):
+        # The previous backup must be complete before it's shifted to .2.gz
+        self._wait_for_compression()
+        super().doRollover()
+
+    def close(self):
+        super().close()
+        self._wait_for_compression()
+
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=self.buffer_size, encoding=self.encoding)
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def emit(self, record):
+        # Size is tracked here rather than via stream.tell(), which would
+        # flush the buffer on every record.
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self._size and self._size + len(msg) > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(msg)
+            self._size += len(msg)
+        except Exception:
+            self.handleError(record)
@@ -1,14 +1,20 @@
 import os
+import atexit
 import logging
-import jwt
+import random
 from datetime import datetime, timezone
 from flask import request
 import re 
 
-_AUTH_RE = re.compile(r'auth_token=[^;,\s]*', flags=re.IGNORECASE)
+from util.backend.authentication.auth_context import current_username
+from util.backend.log_pipeline import (
+    BatchingQueueListener,
+    BufferedRotatingFileHandler,
+    DeferredQueueHandler,
+    make_queue,
+)
 
-# Secret key for JWT decoding (must match auth service)
-SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key")
+_AUTH_RE = re.compile(r'auth_token=[^;,\s]*', flags=re.IGNORECASE)
 
 # Ensure log directory exists
 LOG_DIR = "logs"
@@ -20,6 +26,12 @@ RAW_LOG_PATH = os.path.join(LOG_DIR, "http_raw.log")
 ERROR_LOG_PATH = os.path.join(LOG_DIR, "errors.log")
 SENSITIVE_PATHS = {"/login", "/register"}          # body must NOT be logged
 
+# Rotation and sampling
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+RAW_LOG_SAMPLE_RATE = float(os.environ.get("RAW_LOG_SAMPLE_RATE", 1.0))  # 0–1; errors always logged
+RAW_LOGGER_NAME = "http_raw"
+
 # Configure root logger
 default_logger = logging.getLogger()
 default_logger.setLevel(logging.INFO)
@@ -36,10 +48,20 @@ class MaxLevelFilter(logging.Filter):
         return record.levelno <= self.max_level
 
 
+class ExcludeLoggerFilter(logging.Filter):
+    """Drop records from one named logger."""
+    def __init__(self, name):
+        self.excluded = name
+    def filter(self, record):
+        return record.name != self.excluded
+
+
 # ─── handlers ────────────────────────────────────────────────
-request_handler = logging.FileHandler(REQUEST_LOG_PATH, encoding="utf-8")
-raw_handler     = logging.FileHandler(RAW_LOG_PATH,     encoding="utf-8")
-error_handler   = logging.FileHandler(ERROR_LOG_PATH,   encoding="utf-8")
+# These run on the log-writer thread (see log_pipeline.py); the request path
+# only enqueues records.
+request_handler = BufferedRotatingFileHandler(REQUEST_LOG_PATH, LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+raw_handler     = BufferedRotatingFileHandler(RAW_LOG_PATH,     LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+error_handler   = BufferedRotatingFileHandler(ERROR_LOG_PATH,   LOG_MAX_BYTES, LOG_BACKUP_COUNT)
 stream_handler  = logging.StreamHandler()
 
 error_handler.setLevel(logging.ERROR)      # only ERROR & CRITICAL
@@ -49,6 +71,11 @@ info_only_filter = MaxLevelFilter(logging.INFO)
 request_handler.addFilter(info_only_filter)
 raw_handler.addFilter(info_only_filter)
 
+# Raw HTTP dumps only go to http_raw.log
+not_raw_filter = ExcludeLoggerFilter(RAW_LOGGER_NAME)
+request_handler.addFilter(not_raw_filter)
+stream_handler.addFilter(not_raw_filter)
+
 # levels (for clarity)
 request_handler.setLevel(logging.INFO)
 raw_handler.setLevel(logging.INFO)
@@ -58,38 +85,47 @@ stream_handler.setLevel(logging.INFO)
 formatter = logging.Formatter("%(message)s")
 for h in (request_handler, raw_handler, error_handler, stream_handler):
     h.setFormatter(formatter)
-    default_logger.addHandler(h)
 
+log_queue = make_queue()
+queue_handler = DeferredQueueHandler(log_queue)
+default_logger.addHandler(queue_handler)
+
+raw_logger = logging.getLogger(RAW_LOGGER_NAME)
+raw_logger.propagate = False
+for h in list(raw_logger.handlers):
+    raw_logger.removeHandler(h)
+raw_logger.addHandler(queue_handler)
+
+log_listener = BatchingQueueListener(
+    log_queue, request_handler, raw_handler, error_handler, stream_handler,
+    respect_handler_level=True,
+)
+log_listener.start()
+atexit.register(log_listener.stop)
 
-def _get_username():
-    """
-    Extracts 'username' from JWT in HttpOnly cookie, if present.
-    """
-    token = request.cookies.get("auth_token")
-    if not token:
-        return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return payload.get("username")
-    except Exception:
-        return None
+
+class _RequestEntry:
+    """Request log line; formatted on the log-writer thread."""
+    __slots__ = ("timestamp", "ip", "method", "path", "status", "user")
+
+    def __init__(self, response):
+        self.timestamp = datetime.now(timezone.utc)
+        self.ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+        self.method = request.method
+        self.path = request.path
+        self.status = response.status_code
+        self.user = current_username()  # shared, once-per-request auth context
+
+    def __str__(self):
+        user_part = f" user='{self.user}'" if self.user else ""
+        return f"[{self.timestamp.isoformat()}] {self.ip} {self.method} {self.path} -> {self.status}{user_part}"
 
 
 def log_request(response):
     """
     Logs every HTTP request: IP, method, path, status, timestamp, and JWT username if any.
     """
-    # ip = request.remote_addr
-    ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-    method = request.method
-    path = request.path
-    status = response.status_code
-    timestamp = datetime.now(timezone.utc).isoformat()
-    user = _get_username()
-    user_part = f" user='{user}'" if user else ""
-
-    entry = f"[{timestamp}] {ip} {method} {path} -> {status}{user_part}"
-    default_logger.info(entry)
+    default_logger.info(_RequestEntry(response))
     return response
 
 
@@ -142,65 +178,90 @@ def _safe_body():
     if request.path in SENSITIVE_PATHS:
         return ""                                  # blank body → “headers only”
     try:
-        return request.get_data(as_text=True)[:2048]
+        return request.get_data()[:2048].decode("utf-8", "replace")
     except Exception:
         return "[Unreadable]"
 
 
-def log_raw_http(response):
-    """
-    Write one entry to http_raw.log containing:
-      • full headers of the incoming request
-      • up‑to‑2048 B of its body (unless path is sensitive → omitted)
-      • full headers of the outgoing response
-      • up‑to‑2048 B of its body (text / JSON only; else placeholder)
-    Passwords and auth tokens are redacted.
-    """
-    timestamp = datetime.now(timezone.utc).isoformat()
-    ip        = request.headers.get("X-Forwarded-For", request.remote_addr)
-    user      = _get_username()
-    user_part = f" user='{user}'" if user else ""
-
-    # ──────── HEADERS (w/ auth‑token redaction) ────────────────────────────
-    req_hdrs  = redact_sensitive_headers(dict(request.headers))
-    resp_hdrs = redact_sensitive_headers(dict(response.headers))
-
-    # ──────── BODY (request) ───────────────────────────────────────────────
-    req_body  = _safe_body()                    # ≤2 KiB or "" for sensitive paths
-
-    # extra password scrubbing if body present
-    if "password=" in req_body:
-        req_body = req_body.replace("password=", "password=[REDACTED]")
-    if '"password"' in req_body:
-        req_body = re.sub(
+def _scrub_passwords(body):
+    if "password=" in body:
+        body = body.replace("password=", "password=[REDACTED]")
+    if '"password"' in body:
+        body = re.sub(
             r'"password"\s*:\s*"[^"]+"',
             '"password": "[REDACTED]"',
-            req_body
+            body
         )
+    return body
 
-    # ──────── BODY (response) ──────────────────────────────────────────────
+
+def _response_body(response):
+    """≤2 KiB of a text / JSON response body, or a placeholder."""
     try:
+        if response.headers.get("Content-Encoding"):
+            return "[Compressed response]"
         if "text" in response.content_type or "json" in response.content_type:
-            resp_body = response.get_data(as_text=True)[:2048]
-        else:
-            resp_body = "[Binary or non-text response]"
+            return response.get_data()[:2048].decode("utf-8", "replace")
+        return "[Binary or non-text response]"
     except Exception:
-        resp_body = "[Unreadable]"
-
-    # ──────── FORMAT AND WRITE ENTRY ───────────────────────────────────────
-    raw_entry = (
-        f"[{timestamp}] {ip} REQUEST {request.method} {request.path}{user_part}\n"
-        f"Headers: {req_hdrs}\n"
-        f"Body (trimmed): {req_body}\n"
-        f"[{timestamp}] {ip} RESPONSE {response.status_code} {request.path}{user_part}\n"
-        f"Headers: {resp_hdrs}\n"
-        f"Body (trimmed): {resp_body}\n"
-        + "-" * 60 + "\n"
-    )
-
-    with open(RAW_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(raw_entry)
+        return "[Unreadable]"
+
+
+class _RawEntry:
+    """
+    One http_raw.log entry. Only the raw pieces are captured on the request
+    path; redaction, scrubbing and formatting happen on the log-writer thread.
+    """
+
+    def __init__(self, response):
+        self.timestamp = datetime.now(timezone.utc)
+        self.ip = request.headers.get("X-Forwarded-For", request.remote_addr)
+        self.user = current_username()
+        self.method = request.method
+        self.path = request.path
+        self.req_hdrs = list(request.headers.items())
+        self.req_body = _safe_body()                # ≤2 KiB or "" for sensitive paths
+        self.status = response.status_code
+        self.resp_hdrs = list(response.headers.items())
+        self.resp_body = _response_body(response)
+
+    def __str__(self):
+        timestamp = self.timestamp.isoformat()
+        user_part = f" user='{self.user}'" if self.user else ""
+
+        # ──────── HEADERS (w/ auth‑token redaction) ────────────────────────
+        req_hdrs  = redact_sensitive_headers(dict(self.req_hdrs))
+        resp_hdrs = redact_sensitive_headers(dict(self.resp_hdrs))
+
+        # extra password scrubbing if body present
+        req_body = _scrub_passwords(self.req_body)
+
+        return (
+            f"[{timestamp}] {self.ip} REQUEST {self.method} {self.path}{user_part}\n"
+            f"Headers: {req_hdrs}\n"
+            f"Body (trimmed): {req_body}\n"
+            f"[{timestamp}] {self.ip} RESPONSE {self.status} {self.path}{user_part}\n"
+            f"Headers: {resp_hdrs}\n"
+            f"Body (trimmed): {self.resp_body}\n"
+            + "-" * 60
+        )
+
 
+def log_raw_http(response):
+    """
+    Queue one entry for http_raw.log containing:
+      • full headers of the incoming request
+      • up‑to‑2048 B of its body (unless path is sensitive → omitted)
+      • full headers of the outgoing response
+      • up‑to‑2048 B of its body (text / JSON only; else placeholder)
+    Passwords and auth tokens are redacted.
+
+    Only RAW_LOG_SAMPLE_RATE of successful requests are logged; 4xx/5xx
+    responses always are.
+    """
+    if response.status_code < 400 and random.random() >= RAW_LOG_SAMPLE_RATE:
+        return response
+    raw_logger.info(_RawEntry(response))
     return response
 
 def log_error(e):
@@ -216,7 +277,10 @@ def log_error(e):
     except Exception:
         ip = method = path = 'N/A'
 
-    user = _get_username()
+    try:
+        user = current_username()
+    except Exception:
+        user = None
     user_part = f" user='{user}'" if user else ""
 
     error_msg = f"[{timestamp}] {ip} {method} {path} ERROR{user_part}: {e}"
@@ -1,43 +1,174 @@
+import os
 import random
+import struct
+from array import array
+from collections import deque
+from functools import lru_cache
 
-def generate_blocked_tiles(seed, width=60, height=40):
-    random.seed(seed)
+# Weighted tile distribution based on tag_game.js
+TILE_WEIGHTS = [
+    (-1, 50), (13, 3), (32, 2), (127, 1),
+    (108, 1), (109, 2), (110, 2),
+    (166, 0.25), (167, 0.25)
+]
+BLOCKED_IDS = {13, 32, 127, 108, 109, 110, 166, 167}
+
+# Generated maps are memoized in-process and on disk, keyed by (seed, w, h)
+MAP_CACHE_DIR = os.environ.get("MAP_CACHE_DIR", os.path.join("cache", "maps"))
+MAP_CACHE_SIZE = int(os.environ.get("MAP_CACHE_SIZE", 32))
+
+_CACHE_MAGIC = b"TMAP"
+_CACHE_VERSION = 1
+_CACHE_HEADER = struct.Struct("<4sBIIII")  # magic, version, width, height, regions, free count
+
+
+class MapGrid:
+    """
+    Occupancy grid for one generated map.
+
+    `blocked` is a row-major bytearray (1 = wall), `regions` labels every free
+    tile with its 4-connected walkable region (0 = wall), and `free` holds the
+    flat indices of spawnable tiles (inside the 2-tile border).
+    """
 
-    # Weighted tile distribution based on tag_game.js
-    tile_weights = [
-        (-1, 50), (13, 3), (32, 2), (127, 1),
-        (108, 1), (109, 2), (110, 2),
-        (166, 0.25), (167, 0.25)
-    ]
+    def __init__(self, width, height, blocked, regions, region_count, free):
+        self.width = width
+        self.height = height
+        self.blocked = blocked
+        self.regions = regions
+        self.region_count = region_count
+        self.free = free
 
-    weighted_pool = []
-    for index, weight in tile_weights:
-        weighted_pool.extend([index] * int(weight * 100))
+    def is_blocked(self, x, y):
+        """O(1) lookup; anything off the map counts as a wall."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.blocked[y * self.width + x] == 1
+        return True
 
-    blocked_ids = {13, 32, 127, 108, 109, 110, 166, 167}
-    blocked_tiles = set()
+    def region_of(self, x, y):
+        return self.regions[y * self.width + x]
 
+    def free_tile(self, i):
+        """The i-th spawnable tile as (x, y)."""
+        return divmod(self.free[i], self.width)[::-1]
+
+    def free_tiles(self):
+        return [self.free_tile(i) for i in range(len(self.free))]
+
+    def blocked_tiles(self):
+        w = self.width
+        return {(i % w, i // w) for i, b in enumerate(self.blocked) if b}
+
+
+def _generate(seed, width, height):
+    rng = random.Random(seed)
+    ids = [index for index, _ in TILE_WEIGHTS]
+    weights = [weight for _, weight in TILE_WEIGHTS]
+
+    blocked = bytearray(width * height)
+    interior = width - 2
+    picks = rng.choices(ids, weights=weights, k=interior * max(height - 2, 0))
     for y in range(1, height - 1):
-        for x in range(1, width - 1):
-            tile = random.choice(weighted_pool)
-            if tile in blocked_ids:
-                blocked_tiles.add((x, y))
+        row = picks[(y - 1) * interior: y * interior]
+        base = y * width + 1
+        for dx, tile in enumerate(row):
+            if tile in BLOCKED_IDS:
+                blocked[base + dx] = 1
 
     # Add outer borders
-    for x in range(width):
-        blocked_tiles.add((x, 0))
-        blocked_tiles.add((x, height - 1))
+    blocked[0:width] = b"\x01" * width
+    blocked[(height - 1) * width:] = b"\x01" * width
     for y in range(height):
-        blocked_tiles.add((0, y))
-        blocked_tiles.add((width - 1, y))
+        blocked[y * width] = 1
+        blocked[y * width + width - 1] = 1
 
+    regions, region_count = _label_regions(blocked, width, height)
 
     # Collect all free tiles (excluding 2-tile border and blocked)
-    free_tiles = [
-        (x, y)
+    free = array("I", (
+        y * width + x
         for x in range(2, width - 2)
         for y in range(2, height - 2)
-        if (x, y) not in blocked_tiles
-    ]
+        if not blocked[y * width + x]
+    ))
+    return MapGrid(width, height, blocked, regions, region_count, free)
+
 
-    return blocked_tiles, free_tiles
\ No newline at end of file
+def _label_regions(blocked, width, height):
+    """Flood-fill 4-connected walkable regions; labels start at 1."""
+    regions = array("H", bytes(2 * width * height))
+    label = 0
+    for start in range(width * height):
+        if blocked[start] or regions[start]:
+            continue
+        label += 1
+        regions[start] = label
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            x = i % width
+            for n in (i - width, i + width, i - 1 if x else -1, i + 1 if x < width - 1 else -1):
+                if 0 <= n < len(blocked) and not blocked[n] and not regions[n]:
+                    regions[n] = label
+                    queue.append(n)
+    return regions, label
+
+
+# ─── caching ──────────────────────────────────────────────────
+def _cache_path(seed, width, height):
+    return os.path.join(MAP_CACHE_DIR, f"{seed}_{width}x{height}.bin")
+
+
+def _read_cached(path, width, height):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, w, h, region_count, n_free = _CACHE_HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    if magic != _CACHE_MAGIC or version != _CACHE_VERSION or (w, h) != (width, height):
+        return None
+
+    off = _CACHE_HEADER.size
+    blocked = bytearray(data[off:off + w * h])
+    off += w * h
+    regions = array("H")
+    regions.frombytes(data[off:off + 2 * w * h])
+    off += 2 * w * h
+    free = array("I")
+    free.frombytes(data[off:off + 4 * n_free])
+    if len(blocked) != w * h or len(regions) != w * h or len(free) != n_free:
+        return None
+    return MapGrid(w, h, blocked, regions, region_count, free)
+
+
+def _write_cached(path, grid):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, grid.width, grid.height,
+                                       grid.region_count, len(grid.free)))
+            f.write(grid.blocked)
+            f.write(grid.regions.tobytes())
+            f.write(grid.free.tobytes())
+        os.replace(tmp, path)  # atomic, so concurrent workers never read half a file
+    except OSError:
+        pass  # the disk cache is best-effort
+
+
+@lru_cache(maxsize=MAP_CACHE_SIZE)
+def load_map(seed, width=60, height=40):
+    """Return the MapGrid for (seed, width, height), generating it at most once."""
+    path = _cache_path(seed, width, height)
+    grid = _read_cached(path, width, height)
+    if grid is None:
+        grid = _generate(seed, width, height)
+        _write_cached(path, grid)
+    return grid
+
+
+def generate_blocked_tiles(seed, width=60, height=40):
+    """Compatibility wrapper: (set of blocked (x, y), list of free (x, y))."""
+    grid = load_map(seed, width, height)
+    return grid.blocked_tiles(), grid.free_tiles()
@@ -0,0 +1,123 @@
+"""
+Cross-process plumbing for running several game workers.
+
+A bus does two jobs:
+  • pub/sub of small JSON messages between workers (`publish` / `subscribe`)
+  • a shared room directory: which worker owns which room, and how full it is
+
+`LocalBus` keeps everything in process memory and is what tests and a single
+worker use. `RedisBus` talks to any Redis-compatible server and is what the
+multi-worker deployment uses. Pick one with `create_bus(url)`.
+"""
+import json
+import threading
+from urllib.parse import urlparse
+
+
+class MessageBus:
+    """Interface shared by every bus implementation."""
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        """Call `callback(message)` for every message published on *channel*."""
+        raise NotImplementedError
+
+    def set_room(self, worker_id, room_id, players):
+        raise NotImplementedError
+
+    def drop_room(self, worker_id, room_id):
+        raise NotImplementedError
+
+    def rooms(self):
+        """Return {room_id: {'worker': worker_id, 'players': n}} for live workers."""
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id):
+        """Mark *worker_id* alive; rooms of workers that stop beating expire."""
+
+
+class LocalBus(MessageBus):
+    def __init__(self):
+        self._subscribers = {}  # channel → [callback]
+        self._rooms = {}        # room_id → {'worker', 'players'}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def set_room(self, worker_id, room_id, players):
+        with self._lock:
+            self._rooms[room_id] = {'worker': worker_id, 'players': players}
+
+    def drop_room(self, worker_id, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def rooms(self):
+        with self._lock:
+            return {room_id: dict(info) for room_id, info in self._rooms.items()}
+
+
+class RedisBus(MessageBus):
+    """
+    Redis-backed bus. Each worker keeps its rooms in its own hash, which
+    expires unless the worker keeps calling `heartbeat`, so a crashed worker's
+    rooms disappear from the directory on their own.
+    """
+
+    KEY_PREFIX = "tag:worker:"
+
+    def __init__(self, url, ttl=15):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RedisBus needs the 'redis' package (pip install redis)")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._listener = None
+        self.ttl = ttl
+
+    def _key(self, worker_id):
+        return f"{self.KEY_PREFIX}{worker_id}:rooms"
+
+    def publish(self, channel, message):
+        self._redis.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel, callback):
+        self._pubsub.subscribe(**{channel: lambda msg: callback(json.loads(msg['data']))})
+        if self._listener is None:
+            self._listener = self._pubsub.run_in_thread(sleep_time=0.05, daemon=True)
+
+    def set_room(self, worker_id, room_id, players):
+        key = self._key(worker_id)
+        self._redis.pipeline().hset(key, room_id, players).expire(key, self.ttl).execute()
+
+    def drop_room(self, worker_id, room_id):
+        self._redis.hdel(self._key(worker_id), room_id)
+
+    def rooms(self):
+        out = {}
+        for key in self._redis.scan_iter(f"{self.KEY_PREFIX}*:rooms"):
+            worker_id = int(key[len(self.KEY_PREFIX):].split(":", 1)[0])
+            for room_id, players in self._redis.hgetall(key).items():
+                out[room_id] = {'worker': worker_id, 'players': int(players)}
+        return out
+
+    def heartbeat(self, worker_id):
+        self._redis.expire(self._key(worker_id), self.ttl)
+
+
+def create_bus(url):
+    """`memory://` → LocalBus, `redis://…` / `rediss://…` → RedisBus."""
+    scheme = urlparse(url or "memory://").scheme
+    if scheme in ("", "memory"):
+        return LocalBus()
+    if scheme in ("redis", "rediss"):
+        return RedisBus(url)
+    raise ValueError(f"unknown message bus URL scheme: {scheme!r}")
@@ -0,0 +1,267 @@
+"""
+Prometheus metrics, served as text by GET /metrics.
+
+A deliberately small registry (no client library): counters, histograms and
+callback gauges keyed by label tuples. Recording is a perf_counter call, a
+bisect and a few dict updates, cheap enough to leave on for every socket
+event and db helper. There is no locking: recording is meant to happen on
+the eventlet hub, where a greenlet only yields on I/O and so never in the
+middle of an update. Updates from a real OS thread could race and be lost.
+
+What feeds it:
+  • `instrument_event`: latency / errors of each Socket.IO event handler
+  • `instrument_socketio`: messages, recipients and bytes of every outbound
+    broadcast, counted where python-socketio hands packets to Engine.IO
+    (a private hook; without it these stay empty)
+  • `timed`: latency of the db/database.py helpers
+  • `Gauge`: values read at scrape time (e.g. players per room)
+  • `StatsGauge`: a component's metrics() dict, read at scrape time
+"""
+import functools
+import inspect
+import re
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RECIPIENT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels → [per-bucket counts (+Inf last), sum, count]
+        _registry.append(self)
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class Gauge:
+    """Read at scrape time: *read()* returns {label tuple: value}."""
+
+    def __init__(self, name, help, labelnames, read):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.read = read
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.read().items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = f"{prefix}_{re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', key).lower()}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (bool, int, float)):
+            yield name, int(value) if isinstance(value, bool) else value
+
+
+class StatsGauge:
+    """
+    Exports *read()*, a component's metrics() dict, as one gauge per numeric
+    entry: <prefix>_<key>, with camelCase keys in snake_case and nested dicts
+    flattened. Other values (timestamps, None) are skipped.
+    """
+
+    def __init__(self, prefix, help, read):
+        self.prefix, self.help, self.read = prefix, help, read
+        _registry.append(self)
+
+    def render(self):
+        for name, value in _flatten(self.prefix, self.read()):
+            yield f"# HELP {name} {self.help}"
+            yield f"# TYPE {name} gauge"
+            yield f"{name} {value}"
+
+
+event_seconds = Histogram("tag_socketio_event_seconds", "Socket.IO event handler latency.", ("event",))
+event_errors = Counter("tag_socketio_event_errors_total", "Socket.IO event handlers that raised.", ("event",))
+outbound_messages = Counter("tag_socketio_outbound_messages_total",
+                            "Engine.IO messages sent, one per recipient.", ("event",))
+outbound_bytes = Counter("tag_socketio_outbound_bytes_total", "Payload bytes sent.", ("event",))
+broadcast_recipients = Histogram("tag_socketio_broadcast_recipients", "Recipients per emit.",
+                                 ("event",), RECIPIENT_BUCKETS)
+broadcast_bytes = Histogram("tag_socketio_broadcast_message_bytes", "Encoded size of each emit.",
+                            ("event",), SIZE_BUCKETS)
+db_seconds = Histogram("tag_db_helper_seconds", "Latency of db/database.py helpers.", ("function",))
+
+
+def render():
+    """The whole registry in Prometheus text exposition format."""
+    _broadcasts.finish()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def timed(fn):
+    """Record each call of *fn* in tag_db_helper_seconds{function=<name>}."""
+    labels = (fn.__name__,)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            db_seconds.observe(labels, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_event(event):
+    """
+    Decorator for a Socket.IO handler: latency and errors per event.
+    Flask-SocketIO passes `connect` handlers an auth argument only if they
+    take one, so surplus positional arguments are dropped here the same way.
+    """
+    labels = (event,)
+
+    def decorator(fn):
+        params = inspect.signature(fn).parameters.values()
+        takes_varargs = any(p.kind == p.VAR_POSITIONAL for p in params)
+        max_args = None if takes_varargs else sum(
+            p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params)
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args[:max_args]) if max_args is not None else fn(*args)
+            except Exception:
+                event_errors.inc(labels)
+                raise
+            finally:
+                event_seconds.observe(labels, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _event_name(data):
+    """Event name from an encoded Socket.IO packet like '2["worldSnapshot",{...}]'."""
+    start = data.find('["')
+    if start < 0:
+        return "_control"
+    end = data.find('"', start + 2)
+    return data[start + 2:end] if end > 0 else "_control"
+
+
+class _BroadcastTracker:
+    """
+    Groups outbound packets into broadcasts. python-socketio encodes an emit
+    once and sends the same packet objects to every recipient: a text packet,
+    followed by one bytes packet per binary attachment. A broadcast is
+    therefore every send of one text packet (plus its attachments), and its
+    event name is parsed once. If a send yields and another emit starts
+    before the first one's sends are done, the first is split in two, so
+    the recipient histograms are approximate; message and byte counts are
+    exact.
+    """
+
+    def __init__(self):
+        self.head = None
+        self.attachments = set()
+        self.event = "_control"
+        self.recipients = 0
+        self.size = 0
+
+    def sent(self, pkt):
+        data = pkt.data
+        size = len(data) if isinstance(data, (str, bytes, bytearray)) else 0
+        if isinstance(data, str):
+            if pkt is not self.head:
+                self.finish()
+                self.head = pkt
+                self.event = _event_name(data)
+                self.size = size
+            self.recipients += 1
+        elif id(pkt) not in self.attachments:
+            self.attachments.add(id(pkt))
+            self.size += size
+        labels = (self.event,)
+        outbound_messages.inc(labels)
+        outbound_bytes.inc(labels, size)
+
+    def finish(self):
+        if self.head is not None:
+            labels = (self.event,)
+            broadcast_recipients.observe(labels, self.recipients)
+            broadcast_bytes.observe(labels, self.size)
+        self.head = None
+        self.attachments = set()
+        self.recipients = 0
+
+
+_broadcasts = _BroadcastTracker()
+
+
+def instrument_socketio(socketio):
+    """
+    Count every packet the Socket.IO server hands to Engine.IO, by wrapping
+    python-socketio's private Server._send_eio_packet (5.x). Returns False,
+    and leaves the outbound metrics empty, if that hook isn't there.
+    """
+    server = socketio.server
+    send = getattr(server, "_send_eio_packet", None)
+    if send is None:
+        print("metrics: python-socketio has no _send_eio_packet; outbound Socket.IO metrics are off")
+        return False
+
+    def counted_send(eio_sid, eio_pkt):
+        _broadcasts.sent(eio_pkt)
+        return send(eio_sid, eio_pkt)
+
+    server._send_eio_packet = counted_send
+    return True
@@ -0,0 +1,203 @@
+import random
+import threading
+
+MAX_LEVEL = 16   # enough for 4**16 members at P = 1/4
+P = 0.25
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # bottom-level steps to next[i]
+
+
+class RankedIndex:
+    """
+    Ordered index of rows keyed by one numeric field, for leaderboards.
+
+    Backed by an indexable skip list (every link also stores how many
+    members it skips), so insert, remove, `rank`, and finding the member at
+    a given rank are all O(log n). `top` and `around` then walk the bottom
+    level. Ties are broken by member name so the order is total.
+
+    Rows are plain dicts; `set`, `inc` and `max` update them atomically and
+    reposition the member when its score changes. All methods are safe to
+    call from several threads.
+    """
+
+    def __init__(self, score_field, descending=False, seed=None):
+        self.score_field = score_field
+        self.descending = descending
+        self._rows = {}   # member → row dict
+        self._keys = {}   # member → skip-list key
+        self._head = _Node(None, MAX_LEVEL)
+        self._tail = _Node(None, 0)
+        self._head.next = [self._tail] * MAX_LEVEL
+        self._size = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # ─── skip list ────────────────────────────────────────────
+    def _key(self, member, row):
+        score = row.get(self.score_field) or 0
+        return (-score if self.descending else score, member)
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < P:
+            level += 1
+        return level
+
+    def _path(self, key):
+        """Rightmost node before *key* on every level, and the steps taken to reach it."""
+        chain = [None] * MAX_LEVEL
+        steps = [0] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._tail and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def _insert(self, key):
+        chain, steps = self._path(key)
+        height = self._random_level()
+        node = _Node(key, height)
+        taken = 0
+        for level in range(height):
+            prev = chain[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            node.width[level] = prev.width[level] - taken
+            prev.width[level] = taken + 1
+            taken += steps[level]
+        for level in range(height, MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def _remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        height = len(node.next)
+        for level in range(height):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+        for level in range(height, MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def _rank(self, key):
+        return sum(self._path(key)[1])
+
+    def _node_at(self, rank):
+        remaining = rank + 1
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def _slice(self, start, count):
+        out = []
+        if start >= self._size or count <= 0:
+            return out
+        node = self._node_at(start)
+        while node is not self._tail and len(out) < count:
+            member = node.key[1]
+            out.append((start + len(out), member, dict(self._rows[member])))
+            node = node.next[0]
+        return out
+
+    def _store(self, member, row):
+        old_key = self._keys.get(member)
+        new_key = self._key(member, row)
+        self._rows[member] = row
+        if old_key != new_key:
+            if old_key is not None:
+                self._remove(old_key)
+            self._insert(new_key)
+            self._keys[member] = new_key
+
+    # ─── updates ──────────────────────────────────────────────
+    def set(self, member, row):
+        """Replace *member*'s row."""
+        with self._lock:
+            self._store(member, dict(row))
+
+    def inc(self, member, field, amount):
+        with self._lock:
+            row = dict(self._rows.get(member, {}))
+            row[field] = (row.get(field) or 0) + amount
+            self._store(member, row)
+
+    def max(self, member, field, value):
+        with self._lock:
+            row = dict(self._rows.get(member, {}))
+            row[field] = max(row.get(field) or 0, value)
+            self._store(member, row)
+
+    def remove(self, member):
+        with self._lock:
+            key = self._keys.pop(member, None)
+            if key is not None:
+                self._remove(key)
+                del self._rows[member]
+
+    def replace_all(self, rows):
+        """Rebuild from {member: row} in one step (used when re-seeding)."""
+        with self._lock:
+            self._rows, self._keys = {}, {}
+            self._head.next = [self._tail] * MAX_LEVEL
+            self._head.width = [1] * MAX_LEVEL
+            self._size = 0
+            for member, row in rows.items():
+                self._store(member, dict(row))
+
+    # ─── queries ──────────────────────────────────────────────
+    def get(self, member):
+        with self._lock:
+            row = self._rows.get(member)
+            return None if row is None else dict(row)
+
+    def rank(self, member):
+        """0-based position of *member*, or None if absent."""
+        with self._lock:
+            key = self._keys.get(member)
+            return None if key is None else self._rank(key)
+
+    def percentile(self, member):
+        """Share of the other members ranked below *member*, 0–100."""
+        with self._lock:
+            key = self._keys.get(member)
+            if key is None:
+                return None
+            if self._size == 1:
+                return 100.0
+            return 100.0 * (self._size - 1 - self._rank(key)) / (self._size - 1)
+
+    def top(self, k):
+        """[(rank, member, row)] for the first *k* members."""
+        with self._lock:
+            return self._slice(0, k)
+
+    def around(self, member, radius):
+        """[(rank, member, row)] for up to *radius* members either side of *member*."""
+        with self._lock:
+            key = self._keys.get(member)
+            if key is None:
+                return []
+            rank = self._rank(key)
+            start = max(0, rank - radius)
+            return self._slice(start, rank - start + radius + 1)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, member):
+        return member in self._keys
@@ -0,0 +1,154 @@
+import time
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets per key: each key holds up to *burst* tokens, refilled at
+    *rate* tokens per second, and every allowed call takes one. allow() is
+    O(1); buckets idle long enough to be full again carry no state and are
+    dropped by evict_idle(). At most *max_keys* buckets are kept; beyond that
+    the oldest is forgotten (which only makes that key more lenient).
+    """
+
+    def __init__(self, rate, burst, max_keys=100_000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = {}  # key → [tokens, last refill time]
+
+    def _refill(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.pop(next(iter(self._buckets)))
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, key):
+        """Take a token for *key*; False (and nothing taken) if there is none."""
+        bucket = self._refill(key, self._clock())
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def refund(self, key):
+        """Give back the token the last allow() took for *key*."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def retry_after(self, key):
+        """Seconds until *key* has a token again (0 if it has one now)."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        tokens = min(self.burst, bucket[0] + (self._clock() - bucket[1]) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def evict_idle(self):
+        """Drop buckets that have refilled completely. Returns how many."""
+        now = self._clock()
+        full_after = self.burst / self.rate
+        idle = [key for key, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoginRateLimiter:
+    """
+    Login throttle: one token bucket per client IP and one per username, so
+    neither a single client nor a spread of clients aimed at one account can
+    make us run bcrypt faster than the configured rates. check() runs before
+    any Mongo or bcrypt work and takes a token from both buckets, or from
+    neither; record_success() returns them, so the rates bound failed attempts.
+
+    Per-key counts of attempts, rejections and failures are aggregated in
+    memory; run() evicts idle buckets and, given *persist*, hands it the
+    counts of each interval (see db.database.record_login_attempts). At most
+    *max_counted* keys are counted per interval; any more are summed under
+    "ip:*" / "user:*".
+    """
+
+    def __init__(self, ip_rate, ip_burst, user_rate, user_burst, max_keys=100_000,
+                 interval=60, max_counted=10_000, clock=time.monotonic):
+        self.by_ip = TokenBucketLimiter(ip_rate, ip_burst, max_keys, clock)
+        self.by_user = TokenBucketLimiter(user_rate, user_burst, max_keys, clock)
+        self.interval = interval
+        self.max_counted = max_counted
+        self._counts = {}  # "ip:<addr>" / "user:<name>" → {"attempts", "rejected", "failed"}
+        self.rejected = 0
+
+    def _count(self, kind, name, field):
+        key = f"{kind}:{name}"
+        counts = self._counts.get(key)
+        if counts is None:
+            if len(self._counts) >= self.max_counted:
+                key = f"{kind}:*"
+                counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = {"attempts": 0, "rejected": 0, "failed": 0}
+        counts[field] += 1
+
+    def check(self, ip, username):
+        """
+        Charge one attempt to *ip* and *username*. Returns 0 if allowed, else
+        the seconds to wait before retrying. A rejected attempt takes no token
+        from either bucket, so a throttled username doesn't drain the IP's.
+        """
+        self._count("ip", ip, "attempts")
+        self._count("user", username, "attempts")
+        wait = max(self.by_ip.retry_after(ip), self.by_user.retry_after(username))
+        if not wait:
+            self.by_ip.allow(ip)
+            self.by_user.allow(username)
+            return 0
+        self.rejected += 1
+        self._count("ip", ip, "rejected")
+        self._count("user", username, "rejected")
+        return max(wait, 0.001)
+
+    def record_success(self, ip, username):
+        """
+        Good credentials: refund the tokens check() took, so only failed
+        attempts use up the budget and users who log in often aren't throttled.
+        """
+        self.by_ip.refund(ip)
+        self.by_user.refund(username)
+
+    def record_failure(self, ip, username):
+        """Bad credentials: counted only (check() already took the tokens)."""
+        self._count("ip", ip, "failed")
+        self._count("user", username, "failed")
+
+    def drain_counts(self):
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def run(self, sleep, persist=None):
+        """Background task: every interval, evict idle buckets and persist counts."""
+        while True:
+            sleep(self.interval)
+            self.by_ip.evict_idle()
+            self.by_user.evict_idle()
+            counts = self.drain_counts()
+            if persist is not None and counts:
+                try:
+                    persist(counts, self.interval)
+                except Exception as e:
+                    print(f"Error persisting login attempts: {e}")
+
+    def metrics(self):
+        return {
+            "ip_buckets": len(self.by_ip),
+            "user_buckets": len(self.by_user),
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import threading
+
+from flask import Response, request
+
+
+class ResponseCache:
+    """
+    Serialized JSON responses keyed by name and tagged with the data
+    generation they were built from.
+
+    A response is rebuilt only when the caller's generation counter has moved
+    on. Concurrent misses for the same key wait on one lock, so a single
+    request recomputes and the rest reuse its result. ETags are a hash of
+    the body, so identical data gets the same tag on every worker.
+    """
+
+    def __init__(self, max_age=2):
+        self.max_age = max_age
+        self._entries = {}  # key → (generation, etag, body)
+        self._locks = {}    # key → lock held while rebuilding
+        self._guard = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key, generation, build):
+        """Return (etag, body) for *key* at *generation*, calling build() on a miss."""
+        entry = self._entries.get(key)
+        if entry and entry[0] == generation:
+            self.hits += 1
+            return entry[1], entry[2]
+
+        with self._lock_for(key):
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation:  # built while we waited
+                self.hits += 1
+                return entry[1], entry[2]
+            body = json.dumps(build(), default=str).encode()
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            self._entries[key] = (generation, etag, body)
+            self.builds += 1
+            return etag, body
+
+    def response(self, key, generation, build):
+        """
+        Flask response for *key*: 304 if the request's If-None-Match already
+        names the current ETag, the cached JSON body otherwise.
+        """
+        etag, body = self.get(key, generation, build)
+        if request.if_none_match.contains(etag):
+            self.not_modified += 1
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype="application/json")
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        return resp
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+
+# Fields sent for every player. A player's state is a tuple in this order so
+# deltas can be computed with a cheap element-wise compare.
+SNAPSHOT_FIELDS = ("x", "y", "it", "name", "avatar", "total", "started_at")
+
+
+def capture_world(players, it_times):
+    """Freeze `players` + `it_times` into {sid: state-tuple} for one tick."""
+    world = {}
+    for sid, p in players.items():
+        t = it_times.get(sid, {})
+        world[sid] = (p['x'], p['y'], p['it'], p['name'], p.get('avatar'),
+                      t.get('total', 0), t.get('started_at'))
+    return world
+
+
+def _full_state(state):
+    return dict(zip(SNAPSHOT_FIELDS, state))
+
+
+class _ClientState:
+    __slots__ = ("view", "history", "sent", "acked", "last_keyframe")
+
+    def __init__(self):
+        self.view = None              # sid → state as last sent to this client
+        self.history = OrderedDict()  # tick → {sid: view entry before that tick}
+        self.sent = OrderedDict()     # ticks sent and not yet superseded by an ack
+        self.acked = None             # last acknowledged tick
+        self.last_keyframe = None
+
+
+class SnapshotEncoder:
+    """
+    Delta-compresses world snapshots per client.
+
+    Each client has its own *view* of the world: players inside its area of
+    interest are current, the rest keep the position last sent to it. Each
+    snapshot is a diff of the view against the last view the client
+    acknowledged. If that view is gone, the keyframe interval has elapsed, or
+    the client asked for one, it receives a full keyframe instead.
+
+    The world's change set is computed once per tick. A client's view is
+    then updated from the players whose team, name or timers changed plus
+    those in its area of interest, never from the whole world, and instead
+    of a full view per tick it keeps what each tick overwrote (`history`), so
+    a diff only visits players changed since the acknowledged tick.
+    """
+
+    def __init__(self, keyframe_interval, history_size=64):
+        self.keyframe_interval = keyframe_interval  # in ticks
+        self.history_size = history_size
+        self.clients = {}  # sid → _ClientState
+        self._world = {}   # last tick's world
+
+    # ─── client bookkeeping ────────────────────────────────────
+    def add_client(self, sid):
+        self.clients[sid] = _ClientState()
+
+    def remove_client(self, sid):
+        self.clients.pop(sid, None)
+
+    def ack(self, sid, tick):
+        """Record that *sid* has applied snapshot *tick*; older history is dropped."""
+        client = self.clients.get(sid)
+        if client is None or not isinstance(tick, int) or tick not in client.sent:
+            return
+        if client.acked is not None and tick <= client.acked:
+            return
+        client.acked = tick
+        while next(iter(client.sent)) < tick:
+            client.sent.popitem(last=False)
+        self._trim(client)
+
+    def request_keyframe(self, sid):
+        if sid in self.clients:
+            self.clients[sid].acked = None
+
+    @staticmethod
+    def _trim(client):
+        """Drop history no diff can need: ticks up to the oldest possible base."""
+        oldest = next(iter(client.sent), None)
+        history = client.history
+        while history and (oldest is None or next(iter(history)) <= oldest):
+            history.popitem(last=False)
+
+    # ─── encoding ──────────────────────────────────────────────
+    def encode(self, tick, now, world, visible=None):
+        """
+        Return {sid: payload} for every client that has something to receive.
+
+        *visible*, if given, is a callable sid → set of sids whose movement that
+        client should receive; everyone else's position is frozen in its view.
+        """
+        changes, others = self._changes(self._world, world)
+        self._world = world
+
+        out = {}
+        for sid, client in self.clients.items():
+            if client.view is None:
+                client.view = dict(world)  # a new client starts from the current world
+            else:
+                undo = self._apply(client.view, world, changes, others,
+                                   visible(sid) if visible else None)
+                if undo:
+                    client.history[tick] = undo
+
+            base_tick = client.acked
+            if (base_tick is None or base_tick not in client.sent
+                    or client.last_keyframe is None or tick - client.last_keyframe >= self.keyframe_interval):
+                base_tick = None
+
+            payload = self._payload(tick, now, base_tick, client)
+            if payload is None:
+                continue  # nothing changed since this client's baseline
+
+            client.sent[tick] = True
+            while len(client.sent) > self.history_size:
+                client.sent.popitem(last=False)
+            if base_tick is None:
+                client.last_keyframe = tick
+            self._trim(client)
+            out[sid] = payload
+        return out
+
+    @staticmethod
+    def _changes(previous, world):
+        """
+        Players whose state differs from last tick: {sid: state, or None if
+        they left}, and the subset whose change isn't just movement (joins,
+        leaves, team, name, avatar or timers), which every client must see.
+        """
+        changes, others = {}, {}
+        for sid, state in world.items():
+            old = previous.get(sid)
+            if old != state:
+                changes[sid] = state
+                if old is None or old[2:] != state[2:]:
+                    others[sid] = state
+        for sid in previous:
+            if sid not in world:
+                changes[sid] = others[sid] = None
+        return changes, others
+
+    @staticmethod
+    def _apply(view, world, changes, others, visible):
+        """Bring *view* up to this tick; returns {sid: entry it replaced}."""
+        undo = {}
+
+        def put(sid, entry):
+            old = view.get(sid)
+            if old != entry:
+                if sid not in undo:
+                    undo[sid] = old
+                if entry is None:
+                    del view[sid]
+                else:
+                    view[sid] = entry
+
+        if visible is None:
+            for sid, state in changes.items():
+                put(sid, state)
+            return undo
+
+        for sid, state in others.items():
+            old = view.get(sid)
+            if state is None or old is None or sid in visible:
+                put(sid, state)
+            else:
+                put(sid, old[:2] + state[2:])  # out of range: keep last sent x/y
+        for sid in visible:
+            state = world.get(sid)
+            if state is not None:
+                put(sid, state)  # movers in range, and players coming back into range
+        return undo
+
+    @staticmethod
+    def _payload(tick, now, base_tick, client):
+        view = client.view
+        if base_tick is None:
+            return {'tick': tick, 'time': now, 'base': None, 'keyframe': True,
+                    'players': {sid: _full_state(s) for sid, s in view.items()}, 'removed': []}
+
+        # Each player's entry at base_tick is the oldest thing overwritten since
+        base = {}
+        for t, undo in client.history.items():
+            if t > base_tick:
+                for sid, old in undo.items():
+                    base.setdefault(sid, old)
+
+        changed, removed = {}, []
+        for sid, old in base.items():
+            state = view.get(sid)
+            if state == old:
+                continue
+            if state is None:
+                removed.append(sid)
+            elif old is None:
+                changed[sid] = _full_state(state)
+            else:
+                changed[sid] = {f: v for f, v, o in zip(SNAPSHOT_FIELDS, state, old) if v != o}
+        if not changed and not removed:
+            return None
+        return {'tick': tick, 'time': now, 'base': base_tick, 'keyframe': False,
+                'players': changed, 'removed': removed}
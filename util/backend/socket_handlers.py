@@ -1,232 +1,297 @@
 import random, time
-from typing import Optional, List
+from typing import List
 
 from flask import request
-from flask_socketio import emit
-from db.database import sessions, update_user_time_as_it, unlock_achievement, update_leaderboard, increment_user_tags, \
-    increment_user_time, get_user_achievements
-import jwt as pyjwt
+from flask_socketio import emit, join_room
+from db.database import bind_socket, update_user_time_as_it, update_leaderboard, increment_user_tags, \
+    increment_user_time, get_user_achievements, check_achievements, load_player_progress, forget_player_progress
+from db.achievements import achievement_payload
+from util.backend import cluster
+from util.backend.game_room import Matchmaker, TICK_RATE, parse_position
+from util.backend.metrics import Gauge, instrument_event, instrument_socketio
+from util.backend.wire_format import WireFormatError, decode_move, encode_snapshot
+from util.backend.authentication.auth import session_username
+from util.backend.upload.avatar_index import get_avatar_url, subscribe_avatar_updates
 import os
 
 # Globals set by init_handlers
 socketio = None
-players = {}
-it_times = {}
-became_it_time = {}
 TAG_COOLDOWN = 0.2
-MAP_SEED = random.randint(0, 2 ** 32 - 1)
-SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key")
-ALLOWED_EXTENSIONS_ON_DISK = ("png", "jpg", "jpeg")
+TAG_RADIUS = 32  # px between centres, same as the client's bump check
+
+# Opt-in binary protocol: clients connecting with ?proto=bin get packed
+# `worldFrame`s and may send `moveFrame`s; everyone else stays on JSON.
+WIRE_BINARY = os.environ.get("WIRE_BINARY", "1") == "1"
+
+# Every player lives in exactly one GameRoom; see util/backend/game_room.py.
+# Rooms are owned by this worker process and advertised on the cluster bus.
+# Their sids are all connected here too, so emits to a room or sid pass
+# ignore_queue=True and skip the SOCKETIO_MESSAGE_QUEUE round trip; only
+# cross-worker messages (kicks, avatar invalidation) go over the bus.
+matchmaker = Matchmaker(prefix=f"w{cluster.WORKER_ID}-room")
+_tick_task = None
+
+Gauge("tag_room_players", "Players connected per room on this worker.", ("room",),
+      lambda: {(room.id,): len(room.players) for room in list(matchmaker.rooms.values())})
+
+
+def tick_world():
+    """Fixed-rate loop: one `worldSnapshot` per tick to each client of each room."""
+    interval = 1.0 / TICK_RATE
+    next_tick = time.time()
+    while True:
+        next_tick += interval
+        for room in list(matchmaker.rooms.values()):
+            try:
+                tick_room(room, time.time())
+            except Exception as e:
+                print(f"Error in world tick for {room.id}: {e}")
+
+        # Sleep to the next deadline; if we fell behind, resync instead of bursting
+        delay = next_tick - time.time()
+        if delay < 0:
+            next_tick = time.time()
+            delay = 0
+        socketio.sleep(delay)
 
 
-def build_enriched_it_times():
-    enriched = {}
-    for sid, times in it_times.items():
-        enriched[sid] = {
-            'total': times.get('total', 0),
-            'started_at': times.get('started_at'),
-            'it': players.get(sid, {}).get('it', False)
-        }
-    return enriched
+def kick_local(message):
+    """Bus callback: drop *sid* if its socket lives on this worker."""
+    sid = message.get('sid')
+    if sid and matchmaker.room_for(sid) is not None:
+        try:
+            socketio.server.disconnect(sid)
+        except Exception:
+            pass
 
 
-def get_avatar_url(username: str) -> Optional[str]:
-    """Return '/static/avatars/<file>' or None if no avatar exists."""
-    for ext in ALLOWED_EXTENSIONS_ON_DISK:
-        candidate = f"static/avatars/{username}.{ext}"
-        if os.path.exists(candidate):
-            return f"/{candidate}"  # leading slash for URL
-    return None
+def tick_room(room, now):
+    detect_tags(room, now)
+    for sid, snapshot in room.build_world_snapshots(now).items():
+        if sid in room.binary_clients:
+            socketio.emit('worldFrame', encode_snapshot(snapshot, room.slots), room=sid, ignore_queue=True)
+        else:
+            socketio.emit('worldSnapshot', snapshot, room=sid, ignore_queue=True)
 
 
 def emit_achievement(achievement_type, room_sid):
     """Helper to emit achievement with proper name and description."""
     print(f"Emitting achievement {achievement_type} to {room_sid}")
-    if achievement_type == "first_tag":
-        emit('achievementUnlocked', {
-            'achievement': 'first_tag',
-            'name': 'First Tag',
-            'description': 'Tag another player for the first time'
-        }, room=room_sid)
-    elif achievement_type == "survivor_10min":
-        emit('achievementUnlocked', {
-            'achievement': 'survivor_10min',
-            'name': '10-Minute Survivor',
-            'description': 'Stay as \'it\' for 10 minutes total'
-        }, room=room_sid)
-    elif achievement_type == "survivor_1hour":
-        emit('achievementUnlocked', {
-            'achievement': 'survivor_1hour',
-            'name': 'Ultimate Survivor',
-            'description': 'Stay as \'it\' for 1 hour total'
-        }, room=room_sid)
+    socketio.emit('achievementUnlocked', achievement_payload(achievement_type), room=room_sid,
+                  ignore_queue=True)
 
 
 def check_time_based_achievements(username, sid, current_time):
     """
     Check if a player has earned any time-based achievements based on current time.
     This is called during regular leaderboard updates to catch achievements in real-time.
+    Totals come from the in-memory achievement engine, so this does no reads.
     """
-    from db.database import users
+    return check_achievements(username, "totalTimeIt", current_time)
 
-    # Get user data
-    user = users.find_one({"username": username})
-    if not user:
-        return []
 
-    # Calculate current total time including ongoing session
-    base_time = user.get("totalTimeIt", 0)
-    total_time = base_time + current_time
-
-    # Check for time thresholds and unlock if needed
-    unlocked = []
+def apply_tag(room, tagger, target, now):
+    """
+    Reverse tag: *tagger* bumped the IT player *target* in *room* and becomes IT.
+    Returns True if the tag was applied.
+    """
+    players, it_times, became_it_time = room.players, room.it_times, room.became_it_time
+
+    # ─────────── Validation ───────────
+    # Both sides must be connected
+    if tagger == target or tagger not in players or target not in players:
+        return False
+
+    # Only bump the current "it" player
+    if not players[target]['it']:
+        return False
+
+    # Enforce cooldown on newly-tagged
+    if target in became_it_time and now - became_it_time[target] < TAG_COOLDOWN:
+        return False
+
+    # ───────── Stop TARGET's timer ─────────
+    if it_times[target].get('started_at'):
+        elapsed = now - it_times[target]['started_at']
+        it_times[target]['total'] += elapsed
+        it_times[target]['started_at'] = None
+
+        # ─────── record in Mongo ───────
+        # tagger gains one tag
+        tagger_username = players[tagger]['name']
+        target_username = players[target]['name']
+
+        # Tag counter; unlocks "first_tag" on the first one. Its own try, so a
+        # failed unlock write can't cost the target their IT time below.
+        try:
+            for achievement in increment_user_tags(tagger_username, 1):
+                emit_achievement(achievement, tagger)
+        except Exception as e:
+            print(f"Error processing achievements in tag event: {e}")
 
-    # Check 10-minute achievement
-    if total_time >= 600 and base_time < 600:  # Just crossed 10 minutes threshold
-        print(f"Real-time 10min achievement check: {username} has {total_time} seconds")
-        if unlock_achievement(username, "survivor_10min"):
-            unlocked.append("survivor_10min")
+        # Add elapsed "it" time for the previous it-player and check for time achievements
+        try:
+            new_achievements = increment_user_time(target_username, elapsed) or []
+            print(f"Tag event: New achievements for {target_username}: {new_achievements}")
 
-    # Check 1-hour achievement
-    if total_time >= 3600 and base_time < 3600:  # Just crossed 1 hour threshold
-        print(f"Real-time 1hour achievement check: {username} has {total_time} seconds")
-        if unlock_achievement(username, "survivor_1hour"):
-            unlocked.append("survivor_1hour")
+            # If any new achievements were unlocked, emit events
+            for achievement in new_achievements:
+                print(f"Emitting {achievement} achievement to {target}")
+                emit_achievement(achievement, target)
 
-    return unlocked
+            # update leaderboard if this was a new personal best
+            update_leaderboard(target_username, int(it_times[target]['total']))
+        except Exception as e:
+            print(f"Error processing achievements in tag event: {e}")
+
+    # ───────── Swap "it": start TAGGER's timer ─────────
+    players[target]['it'] = False
+    room.make_it(tagger, now)
+
+    # ───────── Broadcast updates ─────────
+    socketio.emit('tagUpdate', {'newIt': tagger, 'prevIt': target}, room=room.id, ignore_queue=True)
+    socketio.emit('leaderboardUpdate', {'it_times': room.build_enriched_it_times()}, room=room.id,
+                  ignore_queue=True)
+    return True
+
+
+def detect_tags(room, now):
+    """Authoritative collision check: the closest non-IT player touching IT tags them."""
+    players, positions = room.players, room.positions
+    for it_sid in room.it_sids():
+        if now - room.became_it_time.get(it_sid, 0) < TAG_COOLDOWN:
+            continue
+        x, y = positions.positions[it_sid]
+        touching = [sid for sid in positions.query_radius(x, y, TAG_RADIUS)
+                    if sid != it_sid and not players[sid]['it']]
+        if touching:
+            tagger = min(touching, key=lambda sid: (positions.positions[sid][0] - x) ** 2 +
+                                                    (positions.positions[sid][1] - y) ** 2)
+            apply_tag(room, tagger, it_sid, now)
 
 
 def init_handlers(sock):
     """Register all Socket.IO event handlers."""
-    global socketio
+    global socketio, _tick_task
     socketio = sock
-
-    @socketio.on('connect')
+    if _tick_task is None:
+        _tick_task = socketio.start_background_task(tick_world)
+        socketio.start_background_task(cluster.heartbeat, matchmaker.rooms, socketio.sleep)
+        cluster.bus.subscribe(cluster.KICK_CHANNEL, kick_local)
+        subscribe_avatar_updates()
+        instrument_socketio(socketio)
+
+    def on(event):
+        """socketio.on, with per-event latency and error metrics."""
+        def decorator(fn):
+            return socketio.on(event)(instrument_event(event)(fn))
+        return decorator
+
+    @on('connect')
     def _connect():
         sid = request.sid
         # Validate Auth Token
-        token = request.cookies.get('auth_token')
-        if not token:
-            return False  # reject unauthorized
         try:
-            payload = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            username = payload['username']
-            avatar_url = get_avatar_url(username)
-
+            username = session_username()  # None without a cookie
         except Exception:
             return False
+        if not username:
+            return False
+        avatar_url = get_avatar_url(username, size=64, fmt="webp")  # drawn at 24 px
+        load_player_progress(username)
 
         # Single-session: disconnect old socket
-        sess = sessions.find_one({"username": username})
-        old_sid = sess.get('socket_id') if sess else None
+        old_sid = bind_socket(username, sid)
         if old_sid and old_sid != sid:
-            try:
-                socketio.server.disconnect(old_sid)
-            except Exception:
-                pass
-        sessions.update_one({"username": username}, {"$set": {"socket_id": sid}}, upsert=True)
+            # The old socket may be on another worker: every worker checks
+            cluster.bus.publish(cluster.KICK_CHANNEL, {'sid': old_sid})
 
-        # Choose spawn location
+        # Choose room and spawn location
+        room = matchmaker.place(sid)
         spawn_x = random.randint(64, 700)
         spawn_y = random.randint(64, 500)
-        is_it = len([p for p in players.values() if p['it']]) == 0
+        proto = 'bin' if WIRE_BINARY and request.args.get('proto') == 'bin' else 'json'
 
         # Register new player
-        players[sid] = {"x": spawn_x, "y": spawn_y, "it": is_it, "name": username, "avatar": avatar_url}
-        it_times[sid] = {"total": 0, "started_at": time.time() if is_it else None}
-        if is_it:
-            became_it_time[sid] = time.time()
+        player = room.add_player(sid, username, avatar_url, spawn_x, spawn_y, binary=proto == 'bin')
+        join_room(room.id)
+        cluster.publish_room(room)
 
         # Send initial state
-        emit('init', {'id': sid, 'seed': MAP_SEED, 'players': players, 'it_times': it_times})
-        emit('playerJoined',
-             {'id': sid, 'x': spawn_x, 'y': spawn_y, 'it': is_it, 'name': username, 'avatar': avatar_url},
-             broadcast=True, include_self=False)
+        emit('init', {'id': sid, 'room': room.id, 'seed': room.seed, 'players': room.players,
+                      'it_times': room.it_times, 'tickRate': TICK_RATE, 'tick': room.tick, 'proto': proto},
+             ignore_queue=True)
+        emit('playerJoined', {'id': sid, **player}, to=room.id, include_self=False, ignore_queue=True)
 
         # Send updated leaderboard
-        emit('leaderboardUpdate', {'it_times': build_enriched_it_times()}, broadcast=True)
+        emit('leaderboardUpdate', {'it_times': room.build_enriched_it_times()}, to=room.id, ignore_queue=True)
 
-        print(f"Player connected: {sid} ({username}), it={is_it}")
+        print(f"Player connected: {sid} ({username}) to {room.id}, it={player['it']}")
 
-    @socketio.on('tag')
+    @on('tag')
     def _tag(data):
+        """
+        Client-side collision hint. Tags are detected authoritatively in
+        tick_world(), so spam is dropped here before any Mongo work.
+        """
         tagger = request.sid
-        target = data.get('id')
+        target = (data or {}).get('id')
         now = time.time()
-
-        # ─────────── Validation ───────────
-        # Both sides must be connected
-        if tagger not in players or target not in players:
+        room = matchmaker.room_for(tagger)
+        if room is None:
             return
 
-        # Only bump the current "it" player
-        if not players[target]['it']:
+        if now - room.last_tag_hint.get(tagger, 0) < TAG_COOLDOWN:
             return
+        room.last_tag_hint[tagger] = now
 
-        # Enforce cooldown on newly-tagged
-        if target in became_it_time and now - became_it_time[target] < TAG_COOLDOWN:
+        players, positions = room.players, room.positions
+        if tagger not in players or target not in players or not players[target]['it']:
             return
+        if target not in positions.query_radius(*positions.positions[tagger], TAG_RADIUS):
+            return
+        apply_tag(room, tagger, target, now)
 
-        # ───────── Stop TARGET's timer ─────────
-        if it_times[target].get('started_at'):
-            elapsed = now - it_times[target]['started_at']
-            it_times[target]['total'] += elapsed
-            it_times[target]['started_at'] = None
-
-            # ─────── record in Mongo ───────
-            # tagger gains one tag
-            tagger_username = players[tagger]['name']
-            target_username = players[target]['name']
-
-            # Check for first tag achievement
-            if unlock_achievement(tagger_username, "first_tag"):
-                print(f"First tag achievement unlocked for {tagger_username}")
-                emit_achievement("first_tag", tagger)
-
-            increment_user_tags(tagger_username, 1)
-
-            # Add elapsed "it" time for the previous it-player and check for time achievements
-            try:
-                new_achievements = increment_user_time(target_username, elapsed) or []
-                print(f"Tag event: New achievements for {target_username}: {new_achievements}")
-
-                # If any new achievements were unlocked, emit events
-                for achievement in new_achievements:
-                    print(f"Emitting {achievement} achievement to {target}")
-                    emit_achievement(achievement, target)
-
-                # update leaderboard if this was a new personal best
-                update_leaderboard(target_username, int(it_times[target]['total']))
-            except Exception as e:
-                print(f"Error processing achievements in tag event: {e}")
-
-        # ───────── Start TAGGER's timer ─────────
-        it_times.setdefault(tagger, {'total': 0})
-        it_times[tagger]['started_at'] = now
-
-        # Swap "it" flags
-        players[target]['it'] = False
-        players[tagger]['it'] = True
-        became_it_time[tagger] = now
-
-        # ───────── Broadcast updates ─────────
-        emit('tagUpdate', {'newIt': tagger, 'prevIt': target}, broadcast=True)
-        emit('leaderboardUpdate', {'it_times': build_enriched_it_times()}, broadcast=True)
-
-    @socketio.on('move')
+    @on('move')
     def _move(data):
-        sid = request.sid
-        if sid in players:
-            players[sid]['x'] = data['x']
-            players[sid]['y'] = data['y']
-            emit('playerMoved', {'id': sid, 'x': data['x'], 'y': data['y']}, broadcast=True)
+        if not isinstance(data, dict):
+            return
+        position = parse_position(data.get('x'), data.get('y'))
+        room = matchmaker.room_for(request.sid)
+        if room and position:
+            room.record_move(request.sid, *position, data.get('ack'))
 
-    @socketio.on('disconnect')
+    @on('moveFrame')
+    def _move_frame(frame):
+        try:
+            data = decode_move(frame)
+        except (WireFormatError, TypeError):
+            return
+        room = matchmaker.room_for(request.sid)
+        if room:
+            room.record_move(request.sid, *parse_position(data['x'], data['y']), data['ack'])
+
+    @on('snapshotAck')
+    def _snapshot_ack(data):
+        room = matchmaker.room_for(request.sid)
+        if room:
+            room.snapshots.ack(request.sid, (data or {}).get('tick'))
+
+    @on('requestKeyframe')
+    def _request_keyframe():
+        room = matchmaker.room_for(request.sid)
+        if room:
+            room.snapshots.request_keyframe(request.sid)
+
+    @on('disconnect')
     def _dc():
         sid = request.sid
-        if sid not in players:
+        room = matchmaker.room_for(sid)
+        if room is None or sid not in room.players:
+            matchmaker.leave(sid)
             return
 
+        players, it_times = room.players, room.it_times
         was_it = players[sid]['it']
         player_username = players[sid]['name']
 
@@ -249,31 +314,32 @@ def init_handlers(sock):
                 update_leaderboard(player_username, int(it_times[sid]['total']))
         except Exception as e:
             print(f"Error finalizing time on disconnect: {e}")
+        forget_player_progress(player_username)
 
         # Clean up
-        players.pop(sid, None)
-        it_times.pop(sid, None)
-        became_it_time.pop(sid, None)
+        room.remove_player(sid)
+        matchmaker.leave(sid)
+        cluster.publish_room(room)
 
-        emit('playerLeft', {'id': sid}, broadcast=True)
+        emit('playerLeft', {'id': sid}, to=room.id, ignore_queue=True)
 
         # Reassign 'it' if needed
         if was_it and players:
-            player_keys = list(players.keys())
-            if player_keys:  # Make sure there are still players left
-                new_it = random.choice(player_keys)
-                players[new_it]['it'] = True
-                it_times.setdefault(new_it, {'total': 0})
-                it_times[new_it]['started_at'] = time.time()
-                became_it_time[new_it] = time.time()
-                emit('tagUpdate', {'newIt': new_it, 'prevIt': sid}, broadcast=True)
-
-        emit('leaderboardUpdate', {'it_times': build_enriched_it_times()}, broadcast=True)
-
-    @socketio.on('getLeaderboard')
+            new_it = random.choice(list(players))
+            room.make_it(new_it, time.time())
+            emit('tagUpdate', {'newIt': new_it, 'prevIt': sid}, to=room.id, ignore_queue=True)
+
+        emit('leaderboardUpdate', {'it_times': room.build_enriched_it_times()}, to=room.id, ignore_queue=True)
+
+    @on('getLeaderboard')
     def _get_leaderboard():
+        room = matchmaker.room_for(request.sid)
+        if room is None:
+            return
+        it_times = room.it_times
+
         # Check for time-based achievements for all active players
-        for sid, player in players.items():
+        for sid, player in list(room.players.items()):
             if player.get('it', False) and sid in it_times and it_times[sid].get('started_at'):
                 username = player['name']
                 current_time = time.time() - it_times[sid]['started_at']
@@ -290,16 +356,17 @@ def init_handlers(sock):
                     print(f"Error checking achievements during leaderboard update: {e}")
 
         # Send the updated leaderboard
-        emit('leaderboardUpdate', {'it_times': build_enriched_it_times()}, broadcast=True)
+        emit('leaderboardUpdate', {'it_times': room.build_enriched_it_times()}, to=room.id, ignore_queue=True)
 
-    @socketio.on('getAchievements')
+    @on('getAchievements')
     def _get_achievements():
         """Handle requests for a user's achievements"""
         sid = request.sid
-        if sid not in players:
+        room = matchmaker.room_for(sid)
+        if room is None or sid not in room.players:
             return
 
-        username = players[sid]['name']
+        username = room.players[sid]['name']
         achievements = get_user_achievements(username)
         print(f"Fetched achievements for {username}: {achievements}")
 
@@ -314,4 +381,4 @@ def init_handlers(sock):
                         emit_achievement(achievement_type, sid)
 
         # Send the achievements data
-        emit('achievementsUpdate', {'achievements': achievements})
\ No newline at end of file
+        emit('achievementsUpdate', {'achievements': achievements}, ignore_queue=True)
\ No newline at end of file
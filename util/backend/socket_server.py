@@ -4,7 +4,8 @@ from flask import Flask, request
 from flask_socketio import SocketIO, emit
 import random, time, eventlet
 eventlet.monkey_patch()          # ✱ for the background task
-from util.backend.map_generator import generate_blocked_tiles
+from util.backend.map_generator import load_map
+from util.backend.upload.avatar_index import get_avatar_url
 import os
 
 
@@ -13,11 +14,9 @@ app.config['SECRET_KEY'] = 'secret'
 socketio          = SocketIO(app, cors_allowed_origins='*')
 
 MAP_SEED          = random.randint(0, 2**32 - 1)
-from util.backend.map_generator import generate_blocked_tiles
-BLOCKED_TILES, FREE_TILES = generate_blocked_tiles(MAP_SEED)
-free_spawn_pool = FREE_TILES.copy()
+MAP               = load_map(MAP_SEED)
+free_spawn_pool   = MAP.free_tiles()
 random.shuffle(free_spawn_pool)
-free_spawn_pool = FREE_TILES.copy()
 TAG_COOLDOWN      = 0.20                              # sec
 
 players           = {}   # sid → {x,y,it,name}
@@ -27,7 +26,6 @@ became_it_time    = {}   # sid → last-time-became-it
 
 
 
-ALLOWED_EXTENSIONS_ON_DISK = ("png", "jpg", "jpeg")
 
 
 
@@ -44,14 +42,6 @@ def build_leaderboard():
         }
     return board
 
-def get_avatar_url(username: str) -> Optional[str]:
-    """Return '/static/avatars/<file>' or None if no avatar exists."""
-    for ext in ALLOWED_EXTENSIONS_ON_DISK:
-        candidate = f"static/avatars/{username}.{ext}"
-        if os.path.exists(candidate):
-            return f"/{candidate}"        # leading slash for URL
-    return None
-
 
 # ───────────────────── socket events ────────────────────────
 @app.route('/')
@@ -109,7 +99,7 @@ def on_move(data):
         tile_size = 16 * 3
         tile_x = int(x // tile_size)
         tile_y = int(y // tile_size)
-        if (tile_x, tile_y) in BLOCKED_TILES:
+        if MAP.is_blocked(tile_x, tile_y):
             return  # silently reject illegal move
 
         players[sid]['x'] = x
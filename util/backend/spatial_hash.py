@@ -0,0 +1,74 @@
+import math
+
+
+class SpatialHash:
+    """
+    Uniform-grid index over player positions.
+
+    Every sid lives in exactly one cell of `cell_size` pixels. Updates are O(1)
+    and neighbourhood queries only touch the 3×3 block of cells around a point,
+    so their cost depends on local density rather than on the lobby size.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}      # (cx, cy) → set of sids
+        self.where = {}      # sid → (cx, cy)
+        self.positions = {}  # sid → (x, y)
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def update(self, sid, x, y):
+        """Insert *sid* or move it to (x, y)."""
+        self.positions[sid] = (x, y)
+        cell = self._cell(x, y)
+        old = self.where.get(sid)
+        if old == cell:
+            return
+        if old is not None:
+            self._discard(sid, old)
+        self.cells.setdefault(cell, set()).add(sid)
+        self.where[sid] = cell
+
+    def remove(self, sid):
+        cell = self.where.pop(sid, None)
+        self.positions.pop(sid, None)
+        if cell is not None:
+            self._discard(sid, cell)
+
+    def _discard(self, sid, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(sid)
+            if not bucket:
+                del self.cells[cell]
+
+    def _block(self, cx, cy, reach):
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                bucket = self.cells.get((gx, gy))
+                if bucket:
+                    yield from bucket
+
+    def neighbours(self, sid):
+        """All sids in the 3×3 cells around *sid* (including *sid* itself)."""
+        cell = self.where.get(sid)
+        if cell is None:
+            return set()
+        return set(self._block(cell[0], cell[1], 1))
+
+    def query_radius(self, x, y, radius):
+        """All sids whose position lies within *radius* of (x, y)."""
+        cx, cy = self._cell(x, y)
+        reach = max(1, math.ceil(radius / self.cell_size))
+        r2 = radius * radius
+        hits = []
+        for sid in self._block(cx, cy, reach):
+            px, py = self.positions[sid]
+            if (px - x) ** 2 + (py - y) ** 2 <= r2:
+                hits.append(sid)
+        return hits
+
+    def __len__(self):
+        return len(self.where)
@@ -0,0 +1,139 @@
+"""
+In-memory static asset pipeline for everything under public/.
+
+At startup `StaticAssets.build()` reads every file once and:
+  • rewrites references between our own files (HTML → CSS/JS, JS → JS
+    imports and image URLs, CSS → url(...)) to content-hashed names,
+    dependencies first, so a file's hash covers what it points at
+  • fingerprints each file as name.<hash>.ext
+  • precompresses text types with gzip, and brotli when the optional
+    `brotli` package is installed
+
+`send(rel_path)` then serves from memory with Accept-Encoding negotiation.
+Hashed names get a year-long `immutable` Cache-Control. Plain names and
+HTML pages get `no-cache` plus an ETag, so browsers revalidate with a cheap
+304. Edits under public/ need a restart (or another `build()`).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import urljoin, urlparse
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MAX_CACHED_BYTES = 8 * 1024 * 1024  # bigger files are left to send_from_directory
+TEXT_TYPES = {".html", ".js", ".css"}
+COMPRESSIBLE = TEXT_TYPES | {".svg", ".json", ".ico", ".txt", ".map"}
+
+# Quoted or url(...)-wrapped references inside HTML / JS / CSS
+REF_RE = re.compile(r"""(["'(])([^"'()\s<>]+)(["')])""")
+
+mimetypes.add_type("text/javascript", ".js")
+
+
+class _Asset:
+    __slots__ = ("body", "gzip", "br", "etag", "mimetype")
+
+    def __init__(self, body, ext):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.mimetype = mimetypes.guess_type("x" + ext)[0] or "application/octet-stream"
+        self.gzip = self.br = None
+        if ext in COMPRESSIBLE:
+            packed = gzip.compress(body, compresslevel=9, mtime=0)
+            self.gzip = packed if len(packed) < len(body) else None
+            if brotli is not None:
+                packed = brotli.compress(body, quality=11)
+                self.br = packed if len(packed) < len(body) else None
+
+
+class StaticAssets:
+    def __init__(self, root="public", pages_dir="html"):
+        self.root = root
+        self.pages_dir = pages_dir
+        self.manifest = {}   # logical path → hashed path, e.g. js/socket.js → js/socket.1a2b3c4d.js
+        self._files = {}     # logical or hashed path → _Asset
+        self._hashed = set()
+
+    # ─── build ────────────────────────────────────────────────
+    def build(self):
+        sources = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.getsize(path) <= MAX_CACHED_BYTES:
+                    sources[os.path.relpath(path, self.root).replace(os.sep, "/")] = path
+
+        self.manifest, self._files, self._hashed = {}, {}, set()
+        for rel in sorted(sources):
+            self._process(rel, sources, ())
+        return self.manifest
+
+    def _base_url(self, rel):
+        # Pages are served from top-level routes (/game, /stats_page, …)
+        return "/" if rel.startswith(self.pages_dir + "/") else "/" + rel
+
+    def _process(self, rel, sources, stack):
+        if rel in self.manifest:
+            return
+        with open(sources[rel], "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(rel)
+
+        if ext in TEXT_TYPES:
+            base = self._base_url(rel)
+
+            def rewrite(match):
+                target = urlparse(urljoin(base, match.group(2)))
+                dep = target.path.lstrip("/")
+                if target.netloc or dep not in sources or dep in stack or dep == rel:
+                    return match.group(0)
+                self._process(dep, sources, stack + (rel,))
+                return f"{match.group(1)}/{self.manifest[dep]}{match.group(3)}"
+
+            data = REF_RE.sub(rewrite, data.decode("utf-8")).encode("utf-8")
+
+        asset = _Asset(data, ext)
+        hashed = f"{stem}.{asset.etag[:10]}{ext}"
+        self.manifest[rel] = hashed
+        self._files[rel] = self._files[hashed] = asset
+        self._hashed.add(hashed)
+
+    # ─── serve ────────────────────────────────────────────────
+    def url(self, rel):
+        return "/" + self.manifest.get(rel, rel)
+
+    def send(self, rel):
+        """Response for *rel* (logical or hashed path), or None if it isn't cached."""
+        asset = self._files.get(rel)
+        if asset is None:
+            return None
+
+        body, encoding = asset.body, None
+        accepted = request.accept_encodings
+        if asset.br is not None and accepted["br"]:
+            body, encoding = asset.br, "br"
+        elif asset.gzip is not None and accepted["gzip"]:
+            body, encoding = asset.gzip, "gzip"
+
+        resp = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.headers["Vary"] = "Accept-Encoding"
+        resp.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        if rel in self._hashed:
+            resp.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            resp.headers["Cache-Control"] = "no-cache"
+        return resp.make_conditional(request)
+
+    def page(self, name):
+        return self.send(f"{self.pages_dir}/{name}")
@@ -1,9 +1,11 @@
 import os
 from flask import request, jsonify
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageOps
 from util.backend.logger import logging
+from util.backend.upload.avatar_index import avatar_changed
+from util.backend.upload.avatar_processing import AvatarBusy, AvatarProcessor
 from datetime import datetime, timezone
+from concurrent.futures import TimeoutError as ProcessingTimeout
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
 AVATAR_DIR = os.path.join("static", "avatars")
@@ -11,11 +13,24 @@ os.makedirs(AVATAR_DIR, exist_ok=True)
 
 # Maximum allowed size (5MB)
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB in bytes
+# Room for the multipart boundaries and form fields around the file
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 64 * 1024
+
+# Decoding and resizing run in worker processes (see avatar_processing.py)
+avatar_processor = AvatarProcessor(
+    workers=int(os.environ.get("AVATAR_WORKERS", 2)),
+    max_pending=int(os.environ.get("AVATAR_MAX_PENDING", 8)),
+    timeout=float(os.environ.get("AVATAR_TIMEOUT", 10)),
+)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def upload_avatar():
+    # Reject oversized uploads from the declared length, before the body is parsed
+    if request.content_length is not None and request.content_length > MAX_REQUEST_SIZE:
+        return jsonify({"error": "File too large. Max 5MB allowed."}), 413
+
     if 'avatar' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
@@ -39,20 +54,26 @@ def upload_avatar():
 
         try:
             filename = secure_filename(username + ".png")  # Always save as .png
-            filepath = os.path.join(AVATAR_DIR, filename)
+            stem = filename.rsplit('.', 1)[0]
 
-            # Open and center-crop to square
-            image = Image.open(file.stream).convert("RGBA")
-            cropped = ImageOps.fit(image, (128, 128), Image.LANCZOS, centering=(0.5, 0.5))
-            cropped.save(filepath, format='PNG')
+            # Center-crop to square and write 32/64/128 px PNG + WebP variants
+            # in the process pool; this greenlet just waits
+            avatar_processor.process(file.stream, AVATAR_DIR, stem)
+            avatar_url = avatar_changed(stem)
 
             # Log it
             timestamp = datetime.now(timezone.utc).isoformat()
             ip = request.headers.get('X-Forwarded-For', request.remote_addr)
             logging.info(f"[{timestamp}] {ip} UPLOAD avatar for '{username}' -> {filename}")
 
-            return jsonify({"success": True, "avatar_url": f"/static/avatars/{filename}"})
+            return jsonify({"success": True, "avatar_url": avatar_url})
 
+        except AvatarBusy as e:
+            return jsonify({"error": str(e)}), 503
+        except ProcessingTimeout:
+            return jsonify({"error": "Avatar processing timed out."}), 503
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
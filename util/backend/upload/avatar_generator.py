@@ -0,0 +1,56 @@
+"""
+Default avatars, drawn locally instead of fetched from Dicebear.
+
+Each username hashes to a left/right mirrored 8x8 pixel-art sprite in two
+colours on a pale background, so the same name always gets the same avatar
+and nothing leaves the process. Runs in the avatar pool (see
+avatar_processing.py) so registration doesn't wait for it.
+"""
+import colorsys
+import hashlib
+import os
+
+from PIL import Image
+
+from util.backend.upload.avatar_processing import write_variants
+
+GRID = 8      # sprite cells per side, including a one-cell margin
+HALF = (GRID - 2 + 1) // 2
+
+
+def _colour(hue, saturation, lightness):
+    r, g, b = colorsys.hls_to_rgb(hue, lightness, saturation)
+    return int(r * 255), int(g * 255), int(b * 255), 255
+
+
+def render_avatar(username, size=128):
+    """The sprite for *username* as a size×size RGBA image."""
+    digest = hashlib.blake2b(username.encode("utf-8"), digest_size=32).digest()
+    hue = digest[0] / 255
+    primary = _colour(hue, 0.65, 0.45)
+    accent = _colour((hue + 0.33 + digest[1] / 255 / 3) % 1.0, 0.7, 0.6)
+    background = _colour(hue, 0.35, 0.92)
+
+    sprite = Image.new("RGBA", (GRID, GRID), background)
+    cells = digest[2:]
+    inner = GRID - 2
+    for y in range(inner):
+        for x in range(HALF):
+            value = cells[y * HALF + x] % 4  # 0, 1: empty; 2: primary; 3: accent
+            if value < 2:
+                continue
+            colour = primary if value == 2 else accent
+            sprite.putpixel((1 + x, 1 + y), colour)
+            sprite.putpixel((GRID - 2 - x, 1 + y), colour)
+    return sprite.resize((size, size), Image.NEAREST)
+
+
+def generate_avatar(directory, username):
+    """
+    Write *username*'s generated avatar and its variants, unless an avatar
+    already exists (generated earlier or uploaded). Returns the variants
+    written, or [] if the existing file was kept.
+    """
+    if os.path.exists(os.path.join(directory, f"{username}.png")):
+        return []
+    return write_variants(render_avatar(username), directory, username, resample=Image.NEAREST)
@@ -0,0 +1,152 @@
+import os
+import threading
+from typing import Optional
+
+from util.backend import cluster
+from util.backend.upload.avatar_processing import VARIANT_FORMATS, VARIANT_SIZES
+
+AVATAR_DIR = os.path.join("static", "avatars")
+AVATAR_URL_PREFIX = "/static/avatars/"
+ALLOWED_EXTENSIONS_ON_DISK = ("png", "jpg", "jpeg")  # lookup preference order
+
+
+class AvatarIndex:
+    """
+    In-memory map of username → (avatar filename, version, variants), where
+    the version is the file's mtime in ns and variants are the resized copies
+    under <size>/ (e.g. "64/alice.webp"). Built by one directory scan at
+    startup and kept current by record(), which upload and registration call
+    after writing a file. URLs carry ?v=<version>, so browsers can cache them
+    forever and a new upload changes the URL.
+    """
+
+    def __init__(self, directory=AVATAR_DIR, extensions=ALLOWED_EXTENSIONS_ON_DISK,
+                 sizes=VARIANT_SIZES, formats=VARIANT_FORMATS):
+        self.directory = directory
+        self.extensions = extensions
+        self.sizes = sizes
+        self.formats = formats
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _variants_on_disk(self, username, present=None):
+        """Relative paths of *username*'s variants, from *present* or by stat-ing."""
+        found = []
+        for size in self.sizes:
+            for fmt in self.formats:
+                rel = f"{size}/{username}.{fmt}"
+                if present is not None:
+                    exists = rel in present
+                else:
+                    exists = os.path.isfile(os.path.join(self.directory, str(size), f"{username}.{fmt}"))
+                if exists:
+                    found.append(rel)
+        return frozenset(found)
+
+    def scan(self):
+        """Rebuild the index from the directory; returns the number of avatars."""
+        on_disk = {}
+        variants = set()
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file():
+                        on_disk[entry.name] = entry.stat().st_mtime_ns
+                    elif entry.is_dir() and entry.name in {str(size) for size in self.sizes}:
+                        with os.scandir(entry.path) as sized:
+                            variants.update(f"{entry.name}/{v.name}" for v in sized if v.is_file())
+        except FileNotFoundError:
+            pass
+
+        files = {}
+        for name in on_disk:
+            username, _, ext = name.rpartition(".")
+            if not username or ext not in self.extensions or username in files:
+                continue
+            for preferred in self.extensions:  # png beats jpg beats jpeg
+                candidate = f"{username}.{preferred}"
+                if candidate in on_disk:
+                    files[username] = (candidate, on_disk[candidate],
+                                       self._variants_on_disk(username, variants))
+                    break
+        with self._lock:
+            self._files = files
+        return len(files)
+
+    def record(self, username):
+        """Re-index *username* after its avatar was written; returns its new URL."""
+        for ext in self.extensions:
+            filename = f"{username}.{ext}"
+            try:
+                version = os.stat(os.path.join(self.directory, filename)).st_mtime_ns
+            except OSError:
+                continue
+            entry = (filename, version, self._variants_on_disk(username))
+            with self._lock:
+                self._files[username] = entry
+            return self.url(username)
+        with self._lock:
+            self._files.pop(username, None)
+        return None
+
+    def url(self, username, size=None, fmt="png") -> Optional[str]:
+        """
+        '/static/avatars/<file>?v=<version>' or None if the user has no avatar.
+        With *size*, the <size>/<username>.<fmt> variant if there is one,
+        else the full-size file.
+        """
+        entry = self._files.get(username)
+        if entry is None:
+            return None
+        filename, version, variants = entry
+        if size is not None:
+            rel = f"{size}/{username}.{fmt}"
+            if rel in variants:
+                return f"{AVATAR_URL_PREFIX}{rel}?v={version}"
+        return f"{AVATAR_URL_PREFIX}{filename}?v={version}"
+
+    def version_of(self, path) -> Optional[str]:
+        """
+        Current version of *path* ("alice.png" or "64/alice.webp"), or None
+        if it isn't an indexed avatar file.
+        """
+        filename = path.rpartition("/")[2]
+        entry = self._files.get(filename.rpartition(".")[0])
+        if entry is None:
+            return None
+        if path != entry[0] and path not in entry[2]:
+            return None
+        return str(entry[1])
+
+    def __len__(self):
+        return len(self._files)
+
+
+avatar_index = AvatarIndex()
+avatar_index.scan()
+
+
+def get_avatar_url(username: str, size=None, fmt="png") -> Optional[str]:
+    """Return '/static/avatars/[<size>/]<file>?v=<version>' or None if no avatar exists."""
+    return avatar_index.url(username, size, fmt)
+
+
+def avatar_changed(username):
+    """
+    Call after writing *username*'s avatar file. Updates this worker's index
+    and tells the other workers (which share static/avatars) to do the same.
+    """
+    url = avatar_index.record(username)
+    try:
+        cluster.bus.publish(cluster.AVATAR_CHANNEL, {'username': username})
+    except Exception as e:
+        print(f"Error publishing avatar update for {username}: {e}")
+    return url
+
+
+def _on_avatar_message(message):
+    avatar_index.record(message['username'])
+
+
+def subscribe_avatar_updates():
+    cluster.bus.subscribe(cluster.AVATAR_CHANNEL, _on_avatar_message)
@@ -0,0 +1,263 @@
+"""
+Avatar image processing, off the eventlet hub.
+
+Decoding and resampling an uploaded photo is pure CPU (a large JPEG takes
+hundreds of milliseconds), which on the hub would freeze every game socket.
+`AvatarProcessor` runs `process_avatar` in a small process pool instead; the
+request's greenlet just waits on the future. The upload is spooled to a temp
+file and workers get its path: pushing megabytes through the pool's pipe
+would block the hub until a worker got round to reading them.
+
+Workers are spawned, not forked: a forked child would inherit the hub and
+every green thread the parent had scheduled. A spawned worker re-imports the
+parent's __main__, which for `python server.py` would start Mongo clients,
+background tasks and more pool workers in every child, so workers are
+started with this module standing in as __main__ (see `_worker_main`). It is
+all they import, so it must stay light (PIL and the stdlib only).
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+VARIANT_SIZES = (128, 64, 32)       # largest first; each is resized from the previous
+VARIANT_FORMATS = ("png", "webp")
+MAX_SOURCE_PIXELS = 40_000_000      # refuse decompression bombs before decoding
+
+
+class AvatarBusy(Exception):
+    """Too many avatars are already being processed; try again shortly."""
+
+
+@contextlib.contextmanager
+def _worker_main():
+    """
+    Make workers spawned inside this block import this module as their
+    __main__ instead of the parent's. The pool starts workers from submit(),
+    so every submit runs in here.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _save_atomic(image, path, fmt):
+    # A unique temp name: two uploads for the same user may be saving at once
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                               dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if fmt == "webp":
+                image.save(f, format="WEBP", quality=85, method=4)
+            else:
+                image.save(f, format="PNG", optimize=True)
+        os.chmod(tmp, 0o644)  # mkstemp creates it 0600; the avatar is served as a static file
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def process_avatar(source, directory, username):
+    """
+    Decode *source* (a path or the raw bytes), centre-crop it to a square
+    and write every variant (see write_variants).
+
+    JPEGs are decoded in draft mode, i.e. DCT-scaled down to the smallest
+    1/2, 1/4 or 1/8 that still covers the target, which skips most of the
+    decoding work for camera-sized photos. Raises ValueError for anything
+    that isn't a usable image. Runs in a pool worker.
+    """
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        width, height = image.size
+        if width * height > MAX_SOURCE_PIXELS:
+            raise ValueError("Image dimensions too large.")
+        largest = VARIANT_SIZES[0]
+        if image.format == "JPEG":
+            image.draft("RGB", (largest, largest))
+        image = image.convert("RGBA")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+
+    square = ImageOps.fit(image, (largest, largest), Image.LANCZOS, centering=(0.5, 0.5))
+    return write_variants(square, directory, username)
+
+
+def write_variants(image, directory, username, resample=Image.LANCZOS):
+    """
+    Write a square *image* as every variant:
+
+        <directory>/<size>/<username>.png|.webp   for size in VARIANT_SIZES
+        <directory>/<username>.png                 (the largest PNG, written last)
+
+    Returns the variants' paths relative to *directory*.
+    """
+    largest = VARIANT_SIZES[0]
+    if image.size != (largest, largest):
+        image = image.resize((largest, largest), resample)
+    current = image
+    for size in VARIANT_SIZES:
+        if current.size != (size, size):
+            current = current.resize((size, size), resample)
+        size_dir = os.path.join(directory, str(size))
+        os.makedirs(size_dir, exist_ok=True)
+        for fmt in VARIANT_FORMATS:
+            _save_atomic(current, os.path.join(size_dir, f"{username}.{fmt}"), fmt)
+
+    # The top-level file is what the avatar index versions, so it goes last
+    _save_atomic(image, os.path.join(directory, f"{username}.png"), "png")
+    return [f"{size}/{username}.{fmt}" for size in VARIANT_SIZES for fmt in VARIANT_FORMATS]
+
+
+class AvatarProcessor:
+    """
+    Bounded process pool for `process_avatar`. At most *max_pending* jobs may
+    be queued or running; beyond that `process()` raises AvatarBusy instead
+    of letting uploads pile up. The pool is started on first use.
+    """
+
+    def __init__(self, workers=2, max_pending=8, timeout=10.0, spool_dir=None):
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._futures = set()  # queued or running, for shutdown()
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+
+    def _reserve(self):
+        """Claim a pending slot or raise AvatarBusy."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise AvatarBusy("Avatar processing is busy, try again.")
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, fn, *args):
+        """Submit to the pool; the pending slot is released when the job ends."""
+        try:
+            with _worker_main():
+                future = self._pool().submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self._futures.discard(future)
+        self._release()
+
+    def process(self, stream, directory, username):
+        """
+        Spool *stream* (the uploaded file) to disk, run process_avatar on it
+        in the pool and wait (cooperatively under eventlet). Raises
+        AvatarBusy, ValueError from the image, or
+        concurrent.futures.TimeoutError.
+        """
+        self._reserve()
+        start = time.perf_counter()
+        fd, path = tempfile.mkstemp(prefix="avatar-", dir=self.spool_dir)
+        future = None
+        try:
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    shutil.copyfileobj(stream, f)
+            except Exception:
+                self._release()
+                raise
+            future = self._submit(process_avatar, path, directory, username)
+            try:
+                result = future.result(timeout=self.timeout)
+            except Exception:
+                self.failed += 1
+                raise
+        finally:
+            if future is None or future.cancel():
+                os.remove(path)
+            else:
+                # On a timeout the worker may still be reading the spool file;
+                # remove it when the job ends (right away if it already has)
+                future.add_done_callback(lambda _: os.remove(path))
+        self.last_ms = (time.perf_counter() - start) * 1000
+        self.max_ms = max(self.max_ms, self.last_ms)
+        self.processed += 1
+        return result
+
+    def submit(self, fn, *args, on_done=None):
+        """
+        Run fn(*args) in the pool without waiting, for work off the request
+        path. Shares max_pending with process(), so it raises AvatarBusy too.
+        on_done(result) is called when it succeeds; failures are counted and
+        printed.
+        """
+        self._reserve()
+        future = self._submit(fn, *args)
+
+        def finished(f):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                self.failed += 1
+                print(f"Error in background avatar job {fn.__name__}{args}: {f.exception()}")
+            else:
+                self.processed += 1
+                if on_done is not None:
+                    on_done(f.result())
+
+        future.add_done_callback(finished)
+        return future
+
+    def pending(self):
+        return self._pending
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "last_ms": round(self.last_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+    def shutdown(self):
+        """Cancel queued jobs, wait for running ones and stop the workers."""
+        if self._executor is not None:
+            # By hand: shutdown(cancel_futures=True) needs Python 3.9
+            for future in list(self._futures):
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
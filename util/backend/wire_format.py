@@ -0,0 +1,186 @@
+"""
+Compact binary frames for the hot paths (`move` in, `worldSnapshot` out).
+
+Players are addressed by small integer slots instead of 20-character sids, and
+coordinates are quantized to 1/QUANT px in an unsigned 16-bit field. Anything
+that is not a position (joins, IT flips, timers) rides in a small JSON tail,
+since it changes rarely. All integers are little-endian.
+
+move frame (client → server):
+    <B  version
+    <H  x, <H y        quantized
+    <I  ack            last snapshot tick applied (0 = none)
+
+snapshot frame (server → client):
+    <B  version
+    <I  tick
+    <I  base           NO_BASE for keyframes
+    <d  server time
+    <H  position entries, <H removed slots, <I extra bytes
+    entries:  <H slot, <B mask (1 = x, 2 = y), then <H per set bit
+    removed:  <H slot each
+    extra:    UTF-8 JSON {slot: {field: value, ...}}; joins carry their sid as "id"
+"""
+import json
+import struct
+import time
+
+WIRE_VERSION = 1
+QUANT = 4                       # quarter-pixel precision
+MAX_COORD = 0xFFFF / QUANT      # ≈ 16383 px, well past the 2880×1920 map
+NO_BASE = 0xFFFFFFFF
+
+_MOVE = struct.Struct("<BHHI")
+_SNAP_HEADER = struct.Struct("<BIIdHHI")
+_SLOT_MASK = struct.Struct("<HB")
+_U16 = struct.Struct("<H")
+
+
+class WireFormatError(ValueError):
+    """Raised for frames that are truncated or have an unknown version."""
+
+
+def quantize(v):
+    return int(round(min(max(v, 0), MAX_COORD) * QUANT))
+
+
+def dequantize(q):
+    return q / QUANT
+
+
+class SlotTable:
+    """
+    Hands out the lowest free small integer for each connected sid.
+
+    Released slots stay mapped for *quarantine* seconds, so snapshots that
+    still report the player as removed can be encoded, and a client never
+    sees a slot change owner inside a single delta chain.
+    """
+
+    def __init__(self, quarantine=10.0):
+        self.quarantine = quarantine
+        self.slot_of = {}    # sid → slot
+        self.sid_of = {}     # slot → sid
+        self._free = []
+        self._retiring = []  # (reusable_at, sid)
+        self._next = 0
+
+    def assign(self, sid):
+        if sid in self.slot_of:
+            return self.slot_of[sid]
+        self._reap(time.monotonic())
+        if self._free:
+            self._free.sort()
+            slot = self._free.pop(0)
+        else:
+            slot = self._next
+            self._next += 1
+        self.slot_of[sid] = slot
+        self.sid_of[slot] = sid
+        return slot
+
+    def release(self, sid):
+        if sid in self.slot_of:
+            self._retiring.append((time.monotonic() + self.quarantine, sid))
+
+    def _reap(self, now):
+        while self._retiring and self._retiring[0][0] <= now:
+            _, sid = self._retiring.pop(0)
+            slot = self.slot_of.pop(sid, None)
+            if slot is not None:
+                del self.sid_of[slot]
+                self._free.append(slot)
+
+
+# ─── client → server ──────────────────────────────────────────
+def encode_move(x, y, ack=0):
+    return _MOVE.pack(WIRE_VERSION, quantize(x), quantize(y), ack or 0)
+
+
+def decode_move(frame):
+    """Return {'x', 'y', 'ack'} from a binary move frame."""
+    if len(frame) != _MOVE.size:
+        raise WireFormatError(f"move frame is {len(frame)} bytes, expected {_MOVE.size}")
+    version, qx, qy, ack = _MOVE.unpack(frame)
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"unsupported wire version {version}")
+    return {'x': dequantize(qx), 'y': dequantize(qy), 'ack': ack or None}
+
+
+# ─── server → client ──────────────────────────────────────────
+def encode_snapshot(snapshot, slots):
+    """Pack a snapshot dict (as built by SnapshotEncoder) into one binary frame."""
+    entries = []
+    n_pos = 0
+    extra = {}
+    for sid, fields in snapshot['players'].items():
+        slot = slots.assign(sid)
+        mask = ('x' in fields) | ('y' in fields) << 1
+        if mask:
+            n_pos += 1
+            entries.append(_SLOT_MASK.pack(slot, mask))
+            if mask & 1:
+                entries.append(_U16.pack(quantize(fields['x'])))
+            if mask & 2:
+                entries.append(_U16.pack(quantize(fields['y'])))
+
+        rest = {k: v for k, v in fields.items() if k not in ('x', 'y')}
+        if 'name' in rest:
+            rest['id'] = sid  # join or keyframe: teach the client this slot
+        if rest:
+            extra[slot] = rest
+
+    removed = [_U16.pack(slots.slot_of[sid]) for sid in snapshot['removed'] if sid in slots.slot_of]
+    extra_bytes = json.dumps(extra, separators=(',', ':')).encode() if extra else b''
+
+    base = snapshot['base']
+    header = _SNAP_HEADER.pack(WIRE_VERSION, snapshot['tick'], NO_BASE if base is None else base,
+                               snapshot['time'], n_pos, len(removed), len(extra_bytes))
+    return b''.join([header, *entries, *removed, extra_bytes])
+
+
+def decode_snapshot(frame, sid_of):
+    """
+    Inverse of encode_snapshot, mainly for tests and benchmarks. *sid_of* is
+    the receiver's slot → sid map and is updated from join entries.
+    """
+    try:
+        version, tick, base, now, n_pos, n_removed, n_extra = _SNAP_HEADER.unpack_from(frame)
+    except struct.error as e:
+        raise WireFormatError(str(e))
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"unsupported wire version {version}")
+
+    off = _SNAP_HEADER.size
+    positions = {}
+    for _ in range(n_pos):
+        slot, mask = _SLOT_MASK.unpack_from(frame, off)
+        off += _SLOT_MASK.size
+        fields = {}
+        for bit, name in ((1, 'x'), (2, 'y')):
+            if mask & bit:
+                fields[name] = dequantize(_U16.unpack_from(frame, off)[0])
+                off += _U16.size
+        positions[slot] = fields
+
+    removed_slots = []
+    for _ in range(n_removed):
+        removed_slots.append(_U16.unpack_from(frame, off)[0])
+        off += _U16.size
+
+    extra = json.loads(frame[off:off + n_extra]) if n_extra else {}
+    if off + n_extra != len(frame):
+        raise WireFormatError("trailing bytes in snapshot frame")
+
+    players = {}
+    for slot_key, fields in extra.items():
+        slot = int(slot_key)
+        if 'id' in fields:
+            sid_of[slot] = fields.pop('id')
+        players.setdefault(sid_of[slot], {}).update(fields)
+    for slot, fields in positions.items():
+        players.setdefault(sid_of[slot], {}).update(fields)
+
+    return {'tick': tick, 'time': now, 'base': None if base == NO_BASE else base,
+            'keyframe': base == NO_BASE, 'players': players,
+            'removed': [sid_of[s] for s in removed_slots]}